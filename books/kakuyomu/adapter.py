@@ -0,0 +1,278 @@
+import sys
+import argparse
+from typing import Callable
+from pathlib import Path
+
+import pyarrow as pa
+
+from utils import KakuyomuURL
+from work_list import MAX_PAGE, extract_urls, is_no_result, search_conditions
+import retriver
+
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+
+from common.adapter import Listing, Page, Ref, SiteAdapter, collect
+from common.scheduler import HostPolicy
+
+kakuyomu = KakuyomuURL()
+
+OUTPUT_PATH = "./collected"
+
+
+# kind ごとに使う列が違うので、全部の列を決めておく (使わない列は null)。
+# episode: 本文、comment: 応援コメント、review: レビューへのリンク、access: エピソードごとの PV、
+# duplicate: 取得済みのページと同じ内容だったページ (url と最初のページの duplicate_of)
+RECORD_SCHEMA = pa.schema(
+    [
+        ("kind", pa.string()),
+        ("work_id", pa.string()),
+        ("work_title", pa.string()),
+        ("author_name", pa.string()),
+        ("author_id", pa.string()),
+        ("stars", pa.int64()),
+        ("chapter_index", pa.int64()),
+        ("chapter_title", pa.string()),
+        ("episode_id", pa.string()),
+        ("episode_title", pa.string()),
+        ("episode_index", pa.int64()),
+        ("published_at", pa.string()),
+        ("body", pa.string()),
+        ("comment_id", pa.string()),
+        ("user_id", pa.string()),
+        ("reply_to", pa.string()),
+        ("review_url", pa.string()),
+        ("is_spoiler", pa.bool_()),
+        ("pv", pa.int64()),
+        ("likes", pa.int64()),
+        ("total_pv", pa.int64()),
+        ("url", pa.string()),
+        ("duplicate_of", pa.string()),
+    ]
+)
+
+
+def parse_work_id(url: str):
+    return url.split("/")[-1]
+
+
+# 応援コメントとレビューの一覧ページ。空のページが来るまで次のページをたどる
+def paged_listing(
+    ref: Ref, count: int, compose_url: Callable[[str, int], str]
+) -> Listing:
+    if count == 0:
+        return Listing()
+
+    work_id, page = ref.payload["work_id"], ref.payload["page"]
+    return Listing(
+        # 同じページをレコードにする (一覧として取得したときのキャッシュから読む)
+        items=[Ref(url=ref.url, payload=ref.payload)],
+        listings=[
+            Ref(
+                url=compose_url(work_id, page + 1),
+                payload={**ref.payload, "page": page + 1},
+            )
+        ],
+    )
+
+
+# 検索結果 -> 作品ページ -> エピソードの順にたどり、エピソードごとに 1 レコードにする。
+# 作品ページからは応援コメント、レビュー、アクセス数のページもたどって、
+# それぞれ kind の違うレコードにする。
+# work_urls を渡すと検索はせず、その作品だけを取得する。
+# データセットを作るのは novel_work.py (前回との差分、予算、dead letter の取り直しはそちらだけ)。
+# こちらは共通のエンジンで一度きりの取得や作品を指定した取得をするためのもの
+class KakuyomuAdapter(SiteAdapter):
+    name = "kakuyomu"
+    policy = HostPolicy(
+        delay=0.5,
+        max_concurrency=2,
+        backoff=10.0,
+    )
+    schema = RECORD_SCHEMA
+
+    def __init__(self, work_urls: list[str] | None = None):
+        self.work_urls = work_urls
+
+    def listings(self):
+        if self.work_urls is not None:
+            return [Ref(url=url, payload={"kind": "work"}) for url in self.work_urls]
+
+        return [
+            Ref(
+                url=kakuyomu.compose_search_url(
+                    order=condition.order,
+                    min_star=condition.min_star,
+                    max_star=condition.max_star,
+                    page=1,
+                ),
+                payload={"kind": "search", **condition.model_dump()},
+            )
+            for condition in search_conditions
+        ]
+
+    def parse_listing(self, page: Page, ref: Ref) -> Listing:
+        kind = ref.payload["kind"]
+        if kind == "search":
+            return self.parse_search(page, ref)
+        if kind == "comments":
+            comments = retriver.comments.get_review_links(page.soup())
+            return paged_listing(ref, len(comments), kakuyomu.compose_comment_url)
+        if kind == "reviews":
+            reviews = retriver.reviews.get_review_links(page.soup())
+            return paged_listing(ref, len(reviews), kakuyomu.compose_review_url)
+        return self.parse_work(page, ref)
+
+    # 新しい作品が増えるのは検索結果だけ。作品ページなどは前回たどったものを使う
+    def refresh_listing(self, ref: Ref) -> bool:
+        return ref.payload["kind"] == "search"
+
+    def parse_search(self, page: Page, ref: Ref) -> Listing:
+        soup = page.soup()
+        if is_no_result(soup):  # 小説は見つかりませんでした
+            return Listing()
+
+        listings = [
+            Ref(url=url, payload={"kind": "work"}) for url in extract_urls(soup)
+        ]
+        condition = ref.payload
+        if condition["page"] < MAX_PAGE:
+            next_condition = {**condition, "page": condition["page"] + 1}
+            listings.append(
+                Ref(
+                    url=kakuyomu.compose_search_url(
+                        order=condition["order"],
+                        min_star=condition["min_star"],
+                        max_star=condition["max_star"],
+                        page=next_condition["page"],
+                    ),
+                    payload=next_condition,
+                )
+            )
+        return Listing(listings=listings)
+
+    # 作品のメタデータを各エピソードに持たせる
+    def parse_work(self, page: Page, ref: Ref) -> Listing:
+        soup = page.soup()
+        work_id = parse_work_id(ref.url)
+        author_name, author_id = retriver.metadata.get_author(soup)
+        work = {
+            "work_id": work_id,
+            "work_title": retriver.metadata.get_title(soup),
+            "author_name": author_name,
+            "author_id": author_id,
+            "stars": retriver.metadata.get_stars(soup),
+        }
+
+        items = []
+        for chapter_index, chapter in enumerate(retriver.metadata.get_chapters(soup)):
+            for index, episode in enumerate(chapter.episodes, start=1):
+                items.append(
+                    Ref(
+                        url=kakuyomu.compose_episode_url(work_id, episode.id),
+                        key=f"{work_id}/{episode.id}",
+                        payload={
+                            "kind": "episode",
+                            **work,
+                            "chapter_index": chapter_index,
+                            "chapter_title": chapter.title,
+                            "episode_id": episode.id,
+                            "episode_title": episode.title,
+                            "episode_index": index,
+                            "published_at": episode.published_at,
+                        },
+                    )
+                )
+        items.append(
+            Ref(
+                url=kakuyomu.compose_access_url(work_id),
+                payload={"kind": "access", "work_id": work_id},
+            )
+        )
+
+        listings = [
+            Ref(
+                url=kakuyomu.compose_comment_url(work_id, 1),
+                payload={"kind": "comments", "work_id": work_id, "page": 1},
+            ),
+            Ref(
+                url=kakuyomu.compose_review_url(work_id, 1),
+                payload={"kind": "reviews", "work_id": work_id, "page": 1},
+            ),
+        ]
+        return Listing(items=items, listings=listings)
+
+    def parse_item(self, page: Page, ref: Ref) -> dict | list[dict]:
+        kind, work_id = ref.payload["kind"], ref.payload["work_id"]
+        soup = page.soup()
+
+        if kind == "comments":
+            return [
+                {
+                    "kind": "comment",
+                    "work_id": work_id,
+                    "comment_id": comment.id,
+                    "user_id": comment.user_id,
+                    "episode_id": comment.target_episode_id,
+                    "body": comment.body,
+                    "published_at": comment.published_at,
+                    "reply_to": comment.reply_to,
+                }
+                for comment in retriver.comments.get_review_links(soup)
+            ]
+        if kind == "reviews":
+            return [
+                {
+                    "kind": "review",
+                    "work_id": work_id,
+                    "review_url": review.url,
+                    "is_spoiler": review.is_spoiler,
+                }
+                for review in retriver.reviews.get_review_links(soup)
+            ]
+        if kind == "access":
+            total_pv = retriver.access.get_total_pv(soup)
+            return [
+                {
+                    "kind": "access",
+                    "work_id": work_id,
+                    "episode_id": access.id,
+                    "pv": access.pv,
+                    "likes": access.likes,
+                    "total_pv": total_pv,
+                }
+                for access in retriver.access.get_accesses(soup)
+            ]
+        return {**ref.payload, "body": retriver.episode.get_body(soup)}
+
+    # どの作品のどのページかわかるように payload の列も残す (一覧のページ番号などは除く)
+    def duplicate_record(self, ref: Ref, duplicate_of: str) -> dict:
+        return {
+            **{
+                key: value
+                for key, value in ref.payload.items()
+                if key in RECORD_SCHEMA.names
+            },
+            "kind": "duplicate",
+            "url": ref.url,
+            "duplicate_of": duplicate_of,
+        }
+
+
+def load_url_list(path: str) -> list[str]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() != ""]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--url_list",
+        type=str,
+        default=None,
+        help="作品 URL のリスト (なければ検索結果からたどる)",
+    )
+    parser.add_argument("--output", type=str, default=OUTPUT_PATH)
+    args = parser.parse_args()
+
+    work_urls = load_url_list(args.url_list) if args.url_list is not None else None
+    collect(KakuyomuAdapter(work_urls), args.output)
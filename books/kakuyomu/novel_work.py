@@ -1,4 +1,5 @@
 import os
+import sys
 from pathlib import Path
 
 from typing import Optional, Callable
@@ -14,7 +15,8 @@ from concurrent.futures import ThreadPoolExecutor
 from tqdm import tqdm
 
 from utils import (
-    get_soup,
+    get_html,
+    get_html_with_size,
     KakuyomuURL,
     NovelWork,
     Metadata,
@@ -33,6 +35,21 @@ from retriver.metadata import CachedChapter, CachedInformation
 from retriver.comments import CachedComment
 from retriver.reviews import CachedReview
 
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+
+from common.dead_letter import DeadLetter, DeadLetterQueue
+
+from snapshot import PreviousSnapshot, load_at, scan_works
+from priority import (
+    ScoreWeights,
+    CrawlBudget,
+    BudgetTracker,
+    BudgetExhausted,
+    WorkCoverage,
+    CoverageReport,
+    work_score,
+)
+
 DEBUG = False
 
 URL_LIST_PATH = "./work_list/20230916.txt"
@@ -51,6 +68,30 @@ CACHE_FILE_NAME: Callable[[int], str] = lambda i: os.path.join(
     CACHE_PATH, f"cache_{i}.json"
 )
 
+# 前回の出力 (OUTPUT_PATH とは別のディレクトリ)。指定すると、前回から変わった分だけを取得する
+PREVIOUS_OUTPUT_PATH: str | None = None
+
+previous_snapshot: PreviousSnapshot | None = None
+
+# エピソードの取得の予算。指定すると、価値の高い作品から予算が尽きるまで取得する。
+# 出力は作品の順番で novel_work_*.json に分けて書くので、キャッシュの番号とは対応しない
+# (予算なしの実行と同じ OUTPUT_PATH を混ぜて使わないこと)
+CRAWL_BUDGET: CrawlBudget | None = None
+SCORE_WEIGHTS = ScoreWeights()
+PRIORITY_BATCH_SIZE = 100  # この作品数ごとに保存する
+COVERAGE_FILE_NAME = os.path.join(OUTPUT_PATH, "coverage.json")
+
+budget_tracker: BudgetTracker | None = None
+
+# OUTPUT_PATH に保存済みの作品。途中まで取得した作品を続きから取得するときに使う
+saved_works: PreviousSnapshot | None = None
+
+# 取得や解析に失敗した作品・エピソード。retry_dead_letters で取り直す
+DEAD_LETTER_PATH = "./dead_letter.jsonl"
+MAX_DEAD_LETTER_ATTEMPTS = 3
+
+dead_letters = DeadLetterQueue(DEAD_LETTER_PATH)
+
 kakuyomu = KakuyomuURL()
 
 
@@ -116,6 +157,24 @@ def save_cache(cache: list[WorkInfoCache], index: int):
         )
 
 
+# 予算があればそこから 1 リクエスト分を使う。尽きていたら BudgetExhausted
+def fetch_html(url: str) -> str:
+    if budget_tracker is None:
+        return get_html(url)
+    if not budget_tracker.acquire():
+        raise BudgetExhausted(url)
+    html, num_bytes = get_html_with_size(url)
+    budget_tracker.record_bytes(num_bytes)
+    return html
+
+
+# 取得した html を pages に残してから解析する (失敗したときに生の応答を残すため)
+def get_page_soup(url: str, pages: dict[str, str]) -> BeautifulSoup:
+    html = get_html(url)
+    pages[url] = html
+    return BeautifulSoup(html, "lxml")
+
+
 def parse_work_id(url: str):
     return url.split("/")[-1]
 
@@ -163,13 +222,13 @@ def extract_reviews(soup: BeautifulSoup):
     return review_links
 
 
-def retrive_reviews(work_id: str) -> list[CachedReview]:
+def retrive_reviews(work_id: str, pages: dict[str, str]) -> list[CachedReview]:
     page = 1
     reviews: list[CachedReview] = []
 
     while True:
         url = kakuyomu.compose_review_url(work_id, page)
-        soup = get_soup(url)
+        soup = get_page_soup(url, pages)
         new_review = extract_reviews(soup)
 
         if len(new_review) == 0:
@@ -188,13 +247,32 @@ def extract_comment_urls(soup: BeautifulSoup):
     return comment_links
 
 
-def retrive_comment_urls(work_id: str):
+# 前回の Comment を、キャッシュと同じ形に戻す
+def to_cached_comment(comment: Comment) -> CachedComment:
+    return CachedComment(
+        id=comment.id,
+        user_id=comment.user_id,
+        target_episode_id=comment.episode_id,
+        body=comment.body,
+        published_at=comment.published_at,
+        reply_to=(
+            comment.id.removesuffix("-reply")
+            if comment.id.endswith("-reply")
+            else None
+        ),
+    )
+
+
+# コメントは新しい順に並んでいるので、known_ids のコメントが出てきたページで止める
+def retrive_comment_urls(
+    work_id: str, pages: dict[str, str], known_ids: set[str] | None = None
+):
     page = 1
     comments = []
 
     while True:
         url = kakuyomu.compose_comment_url(work_id, page)
-        soup = get_soup(url)
+        soup = get_page_soup(url, pages)
         new_comment = extract_comment_urls(soup)
 
         if len(new_comment) == 0:
@@ -202,11 +280,51 @@ def retrive_comment_urls(work_id: str):
 
         comments += new_comment
 
+        if known_ids is not None and any(
+            comment.id in known_ids for comment in new_comment
+        ):
+            break
+
         page += 1
 
     return comments
 
 
+# 前回から応援コメントが増えただけなら、増えた分のページだけを取得して前回のコメントに足す
+def retrive_comments(
+    work_id: str, number_of_comments: int | None, pages: dict[str, str]
+) -> list[CachedComment]:
+    version = (
+        previous_snapshot.version(work_id) if previous_snapshot is not None else None
+    )
+    previous = (
+        previous_snapshot.previous_comments(work_id)
+        if previous_snapshot is not None
+        else None
+    )
+    if version is None or previous is None:
+        return retrive_comment_urls(work_id, pages)
+
+    previous_comments = [to_cached_comment(c) for c in previous]
+    if version.number_of_comments == number_of_comments:
+        return previous_comments
+
+    # 減った (削除された) ときや数がわからないときは全部取り直す
+    if (
+        number_of_comments is None
+        or version.number_of_comments is None
+        or number_of_comments < version.number_of_comments
+    ):
+        return retrive_comment_urls(work_id, pages)
+
+    new_comments = retrive_comment_urls(
+        work_id, pages, {comment.id for comment in previous_comments}
+    )
+    # 取り直したページにある前回のコメントは、新しいほう (返信が増えているかもしれない) を使う
+    new_ids = {comment.id for comment in new_comments}
+    return new_comments + [c for c in previous_comments if c.id not in new_ids]
+
+
 # PV数などの情報
 def extract_accesses(soup: BeautifulSoup):
     total_pv = retriver.access.get_total_pv(soup)
@@ -218,51 +336,87 @@ def extract_accesses(soup: BeautifulSoup):
     return access
 
 
-def process_url_chunk(urls: list[str]):
+# pages には取得したページの html を入れていく (失敗したときに残すため)
+def retrive_work_cache(url_pair: CachedURLPair, pages: dict[str, str]):
+    metadata = extract_metadata(get_page_soup(url_pair.metadata, pages))
+
+    access = extract_accesses(get_page_soup(url_pair.accesses, pages))
+
+    # これはレビューの URL のみ
+    reviews = retrive_reviews(url_pair.work_id, pages)
+
+    comments = retrive_comments(
+        url_pair.work_id, metadata.info.number_of_comments, pages
+    )
+
+    # print("|", len(metadata.chapters), "章")
+    # print("|", access.total_pv, "PV")
+    # print("|", len(reviews), "レビュー")
+    # print("|", len(comments), "コメント")
+
+    return WorkInfoCache(
+        id=url_pair.work_id,
+        metadata=metadata,
+        accesses=access,
+        reviews=reviews,
+        comments=comments,
+    )
+
+
+# 作品のキャッシュから NovelWork を作るところで失敗したときの pages。
+# ページを取得する前に失敗したときは、作品を作るもとにしたキャッシュを残す
+def work_pages(cache: WorkInfoCache, pages: dict[str, str]) -> dict[str, str]:
+    if len(pages) > 0:
+        return pages
+    return {kakuyomu.compose_work_url(cache.id): cache.model_dump_json()}
+
+
+def push_work_dead_letter(
+    url_pair: CachedURLPair,
+    pages: dict[str, str],
+    error: Exception,
+    chunk_index: int,
+    attempt: int = 1,
+):
+    # 最後に取得したページが、解析に失敗したページ
+    url, response = (
+        list(pages.items())[-1] if len(pages) > 0 else (url_pair.metadata, None)
+    )
+    dead_letters.push(
+        "work",
+        url_pair.work_id,
+        url,
+        error,
+        response=response,
+        context={"chunk": chunk_index, "url_pair": url_pair.model_dump()},
+        attempt=attempt,
+    )
+
+
+def make_url_pair(work_id: str, metadata_url: str | None = None) -> CachedURLPair:
+    return CachedURLPair(
+        work_id=work_id,
+        metadata=metadata_url or kakuyomu.compose_work_url(work_id),
+        comments=kakuyomu.compose_comment_url(work_id),
+        accesses=kakuyomu.compose_access_url(work_id),
+    )
+
+
+def process_url_chunk(urls: list[str], chunk_index: int):
     url_pairs: list[CachedURLPair] = []
 
     for url in urls:
-        work_id = parse_work_id(url)
-
-        metadata_url = url
-        comments_url = kakuyomu.compose_comment_url(work_id)
-        accesses_url = kakuyomu.compose_access_url(work_id)
-
-        url_pairs.append(
-            CachedURLPair(
-                work_id=work_id,
-                metadata=metadata_url,
-                comments=comments_url,
-                accesses=accesses_url,
-            )
-        )
+        url_pairs.append(make_url_pair(parse_work_id(url), url))
 
     print("total", len(url_pairs))
 
     def process_url_pairs(url_pairs: list[CachedURLPair], pbar: tqdm):
         work_caches = []
         for url_pair in url_pairs:
+            pages: dict[str, str] = {}
             try:
                 print("\n", url_pair.metadata)
-                metadata = extract_metadata(get_soup(url_pair.metadata))
-                access = extract_accesses(get_soup(url_pair.accesses))
-                reviews = retrive_reviews(url_pair.work_id)  # これはレビューの URL のみ
-                comments = retrive_comment_urls(url_pair.work_id)
-
-                # print("|", len(metadata.chapters), "章")
-                # print("|", access.total_pv, "PV")
-                # print("|", len(reviews), "レビュー")
-                # print("|", len(comments), "コメント")
-
-                work_caches.append(
-                    WorkInfoCache(
-                        id=url_pair.work_id,
-                        metadata=metadata,
-                        accesses=access,
-                        reviews=reviews,
-                        comments=comments,
-                    )
-                )
+                work_caches.append(retrive_work_cache(url_pair, pages))
                 pbar.update(1)
 
             except PageNotFound:
@@ -271,8 +425,11 @@ def process_url_chunk(urls: list[str]):
                 continue
 
             except Exception as e:
+                # この作品だけ後回しにして、チャンクの残りは続ける
                 print(f"Error: {url_pair.metadata}")
-                raise e
+                push_work_dead_letter(url_pair, pages, e, chunk_index)
+                pbar.update(1)
+                continue
 
             # print(f"- total {len(caches)} works processed")
 
@@ -319,7 +476,7 @@ def create_cache():
         current_index = existed_file_index
 
     for chunk in url_chunks:
-        caches = process_url_chunk(chunk.tolist())
+        caches = process_url_chunk(chunk.tolist(), current_index)
         save_cache(caches, current_index)
 
         current_index += 1
@@ -327,10 +484,25 @@ def create_cache():
     print("done")
 
 
+# previous_episodes にあって公開日時が同じエピソードは、本文を取得せずにそれを使う。
+# 新しく取得したエピソードが max_episodes を超えるか予算が尽きたら、そこまでのエピソードで打ち切る。
+# 打ち切ったかどうかも返す。
+# pages には最後に取得したエピソードの html を入れる (作品ごと失敗したときに残すため。
+# エピソードは数が多いので 1 ページ分だけ持つ)
 def retrive_episodes(
-    work_id: str, cached_chapters: list[CachedChapter]
-) -> list[Chapter]:
+    work_id: str,
+    cached_chapters: list[CachedChapter],
+    previous_episodes: dict[str, Episode] | None = None,
+    max_episodes: int | None = None,
+    pages: dict[str, str] | None = None,
+) -> tuple[list[Chapter], bool]:
+    if previous_episodes is None:
+        previous_episodes = {}
     chapters: list[Chapter] = []
+    number_of_reused = 0
+    number_of_fetched = 0
+    number_of_episodes = 0
+    stopped = False
 
     for cache in cached_chapters:
         chapter = Chapter(
@@ -342,10 +514,37 @@ def retrive_episodes(
 
         for episode in cache.episodes:
             url = kakuyomu.compose_episode_url(work_id, episode.id)
+            html = None
             try:
-                soup = get_soup(url)
+                previous = previous_episodes.get(episode.id)
+                if (
+                    previous is not None
+                    and previous.published_at == episode.published_at
+                ):
+                    chapter.episodes.append(
+                        Episode(
+                            id=episode.id,
+                            title=episode.title,
+                            published_at=episode.published_at,
+                            body=previous.body,
+                            index=index,
+                        )
+                    )
+                    number_of_reused += 1
+                    number_of_episodes += 1
+                    continue
 
-                body = retriver.episode.get_body(soup)
+                # 前回途中で打ち切った作品は、取得済みのエピソードを流用して続きから取得する
+                if max_episodes is not None and number_of_fetched >= max_episodes:
+                    stopped = True
+                    break
+
+                html = fetch_html(url)
+                if pages is not None:
+                    pages.clear()
+                    pages[url] = html
+
+                body = retriver.episode.get_body(BeautifulSoup(html, "lxml"))
 
                 chapter.episodes.append(
                     Episode(
@@ -356,75 +555,162 @@ def retrive_episodes(
                         index=index,
                     )
                 )
+                number_of_fetched += 1
+                number_of_episodes += 1
             except PageNotFound:
                 print(f"[WARNING] PageNotFound: {url}")
                 continue
+            except BudgetExhausted:
+                stopped = True
+                break
             except Exception as e:
+                # このエピソードだけ後回しにして、作品の残りは続ける
                 print(f"Error: {url}")
-                raise e
+                dead_letters.push(
+                    "episode",
+                    f"{work_id}/{episode.id}",
+                    url,
+                    e,
+                    response=html,
+                    context={
+                        "work_id": work_id,
+                        "chapter": len(chapters),
+                        "episode": Episode(
+                            id=episode.id,
+                            title=episode.title,
+                            published_at=episode.published_at,
+                            body="",
+                            index=index,
+                        ).model_dump(),
+                    },
+                )
+                continue
             finally:
                 index += 1
 
+        if stopped and len(chapter.episodes) == 0:
+            break
         chapters.append(chapter)
+        if stopped:
+            break
 
-    return chapters
+    if number_of_reused > 0:
+        print(f"| {number_of_reused} episodes reused")
+    if stopped:
+        print(f"| stopped at {number_of_episodes} episodes")
+
+    return chapters, stopped
+
+
+# キャッシュの作品のエピソードを取得して NovelWork にする。
+# pages には取得したページの html を入れていく (失敗したときに残すため)
+def retrive_novel_work(
+    cache: WorkInfoCache,
+    max_episodes: int | None = None,
+    pages: dict[str, str] | None = None,
+) -> NovelWork:
+    print("\n", cache.metadata.title, kakuyomu.compose_work_url(cache.id))
+
+    novel_work = NovelWork(
+        id=cache.id,
+        number_of_episodes=cache.metadata.info.number_of_episodes,
+        metadata=Metadata(
+            title=cache.metadata.title,
+            author_name=cache.metadata.author_name,
+            author_id=cache.metadata.author_id,
+            stars=cache.metadata.stars,
+            catchphrase=cache.metadata.catchphrase,
+            introduction=cache.metadata.introduction,
+            type=cache.metadata.info.type,
+            genre=cache.metadata.info.genre,
+            tags=cache.metadata.info.tags,
+            derivative_original_work_id=cache.metadata.info.derivative_original_work,
+            total_characters=cache.metadata.info.total_characters,
+            self_ratings=[
+                parse_rating(rating) for rating in cache.metadata.info.self_ratings
+            ],
+            is_ended=cache.metadata.info.is_ended,
+            published_at=cache.metadata.info.published_at,
+            updated_at=cache.metadata.info.updated_at,
+        ),
+        chapters=[],
+        number_of_reviews=cache.metadata.info.number_of_reviews,
+        reviews=[],  # TODO: あとでやる
+        number_of_comments=cache.metadata.info.number_of_comments,
+        comments=[
+            Comment(
+                id=comment.id,
+                episode_id=comment.target_episode_id,
+                user_id=comment.user_id,
+                is_author=comment.user_id == cache.metadata.author_id,
+                body=comment.body,
+                published_at=comment.published_at,
+            )
+            for comment in cache.comments
+        ],
+        number_of_followers=cache.metadata.info.number_of_follows,
+        access=cache.accesses,
+    )
 
+    # 更新日時が前回と同じ作品は、エピソードを 1 つも取得しない
+    unchanged_chapters = (
+        previous_snapshot.unchanged_chapters(
+            cache.id, cache.metadata.info.updated_at
+        )
+        if previous_snapshot is not None
+        else None
+    )
+    if unchanged_chapters is not None:
+        print("| unchanged since the previous snapshot")
+        chapters = unchanged_chapters
+    else:
+        # chapter について取得
+        previous_episodes = (
+            previous_snapshot.previous_episodes(cache.id)
+            if previous_snapshot is not None
+            else {}
+        )
+        # 前回の実行で途中まで取得して保存した作品は、その続きから
+        if saved_works is not None and cache.id in saved_works:
+            previous_episodes = {
+                **previous_episodes,
+                **saved_works.previous_episodes(cache.id),
+            }
+        chapters, novel_work.is_partial = retrive_episodes(
+            cache.id, cache.metadata.chapters, previous_episodes, max_episodes, pages
+        )
+
+    novel_work.chapters = chapters
+
+    return novel_work
 
+
+# chunk_indices は作品 id -> キャッシュのチャンク番号 (失敗した作品を取り直すときに使う)
 def retrive_all_episodes_from_cache(
-    caches: list[WorkInfoCache], pbar: tqdm
+    caches: list[WorkInfoCache],
+    pbar: tqdm,
+    chunk_indices: dict[str, int],
+    max_episodes: int | None = None,
 ) -> list[NovelWork]:
     novel_works: list[NovelWork] = []
 
     for cache in caches:
-        print("\n", cache.metadata.title, kakuyomu.compose_work_url(cache.id))
-
-        novel_work = NovelWork(
-            id=cache.id,
-            number_of_episodes=cache.metadata.info.number_of_episodes,
-            metadata=Metadata(
-                title=cache.metadata.title,
-                author_name=cache.metadata.author_name,
-                author_id=cache.metadata.author_id,
-                stars=cache.metadata.stars,
-                catchphrase=cache.metadata.catchphrase,
-                introduction=cache.metadata.introduction,
-                type=cache.metadata.info.type,
-                genre=cache.metadata.info.genre,
-                tags=cache.metadata.info.tags,
-                derivative_original_work_id=cache.metadata.info.derivative_original_work,
-                total_characters=cache.metadata.info.total_characters,
-                self_ratings=[
-                    parse_rating(rating) for rating in cache.metadata.info.self_ratings
-                ],
-                is_ended=cache.metadata.info.is_ended,
-                published_at=cache.metadata.info.published_at,
-                updated_at=cache.metadata.info.updated_at,
-            ),
-            chapters=[],
-            number_of_reviews=cache.metadata.info.number_of_reviews,
-            reviews=[],  # TODO: あとでやる
-            number_of_comments=cache.metadata.info.number_of_comments,
-            comments=[
-                Comment(
-                    id=comment.id,
-                    episode_id=comment.target_episode_id,
-                    user_id=comment.user_id,
-                    is_author=comment.user_id == cache.metadata.author_id,
-                    body=comment.body,
-                    published_at=comment.published_at,
-                )
-                for comment in cache.comments
-            ],
-            number_of_followers=cache.metadata.info.number_of_follows,
-            access=cache.accesses,
-        )
-
-        # chapter について取得
-        chapters = retrive_episodes(cache.id, cache.metadata.chapters)
-
-        novel_work.chapters = chapters
+        # 予算が尽きたら、まだ手をつけていない作品は次の実行に回す
+        if budget_tracker is not None and budget_tracker.exhausted:
+            break
 
-        novel_works.append(novel_work)
+        pages: dict[str, str] = {}
+        try:
+            novel_works.append(retrive_novel_work(cache, max_episodes, pages))
+        except Exception as e:
+            # この作品だけ後回しにして、残りの作品は続ける
+            print(f"Error: {kakuyomu.compose_work_url(cache.id)}")
+            push_work_dead_letter(
+                make_url_pair(cache.id),
+                work_pages(cache, pages),
+                e,
+                chunk_indices[cache.id],
+            )
 
         # print(f"total {len(novel_works)} works processed")
         pbar.update(1)
@@ -445,8 +731,8 @@ def retrive_full_works():
         for file_name in os.listdir(CACHE_PATH)
         if file_name.startswith("cache_")
     ]
-    # cache_jsons.sort(key=lambda x: int(x.stem.split("_")[-1]))  # sort by index
-    # print(cache_jsons)
+    # novel_work_{i} は cache_{i} から作るので、番号順に並べる
+    cache_jsons.sort(key=lambda x: int(x.stem.split("_")[-1]))  # sort by index
 
     current_index = get_existed_work_index() + 1
 
@@ -467,6 +753,7 @@ def retrive_full_works():
             caches = caches[:10]
         print(f"{len(caches)} works found in {cache_json.stem}")
 
+        chunk_index = int(cache_json.stem.split("_")[-1])
         chunks = np.array_split(caches, NUMBER_OF_THREADS)
 
         with tqdm(total=len(caches)) as pbar:
@@ -478,6 +765,7 @@ def retrive_full_works():
                             retrive_all_episodes_from_cache,
                             [WorkInfoCache(**data) for data in chunk],
                             pbar,
+                            {data["id"]: chunk_index for data in chunk},
                         )
                     )
 
@@ -492,14 +780,338 @@ def retrive_full_works():
     print("done")
 
 
+# キャッシュの JSON のままスコアを計算する (WorkInfoCache にはしない)
+def cache_score(data: dict) -> float:
+    return work_score(
+        SCORE_WEIGHTS,
+        stars=data["metadata"]["stars"],
+        total_pv=data["accesses"]["total_pv"],
+        followers=data["metadata"]["info"]["number_of_follows"],
+        total_characters=data["metadata"]["info"]["total_characters"],
+    )
+
+
+# キャッシュの作品のどこにあるかとスコアだけ。本文などは取得する直前に読む
+class CacheEntry(BaseModel):
+    id: str
+    score: float
+    chunk: int
+    file: str
+    offset: int
+    length: int
+
+
+def load_cache_entries(skip_ids: set[str]) -> list[CacheEntry]:
+    entries: list[CacheEntry] = []
+    for file_name in sorted(os.listdir(CACHE_PATH)):
+        if not file_name.startswith("cache_"):
+            continue
+        file = os.path.join(CACHE_PATH, file_name)
+        for data, offset, length in scan_works(file):
+            if data["id"] in skip_ids:
+                continue
+            entries.append(
+                CacheEntry(
+                    id=data["id"],
+                    score=cache_score(data),
+                    chunk=int(Path(file_name).stem.split("_")[-1]),
+                    file=file,
+                    offset=offset,
+                    length=length,
+                )
+            )
+    return entries
+
+
+def load_cache(entry: CacheEntry) -> WorkInfoCache:
+    return WorkInfoCache(**load_at(entry.file, entry.offset, entry.length))
+
+
+# 最後まで取得できた作品。途中で打ち切った作品 (is_partial) は含めない
+def load_done_work_ids(works: PreviousSnapshot) -> set[str]:
+    return {
+        work_id
+        for work_id, version in works.works.items()
+        if not version.is_partial
+    }
+
+
+# CRAWL_BUDGET を指定したときの retrive_full_works。
+# 全キャッシュの作品をスコアの高い順に並べて、予算が尽きるまで取得する。
+# 最初に読むのは作品の id とスコアだけで、キャッシュの中身はバッチごとに読む
+def retrive_prioritized_works(budget: CrawlBudget):
+    global budget_tracker, saved_works
+    budget_tracker = BudgetTracker(budget)
+    saved_works = PreviousSnapshot(OUTPUT_PATH)
+
+    done_work_ids = load_done_work_ids(saved_works)
+    entries = load_cache_entries(done_work_ids)
+    number_of_partial = sum(1 for entry in entries if entry.id in saved_works)
+    print(
+        f"{len(entries)} works remaining ({len(done_work_ids)} already done, "
+        f"{number_of_partial} partially done)"
+    )
+
+    entries.sort(key=lambda entry: -entry.score)
+    scores = {entry.id: entry.score for entry in entries}
+    chunk_indices = {entry.id: entry.chunk for entry in entries}
+
+    if DEBUG:
+        entries = entries[:10]
+        print(f"debug mode: use only {len(entries)} works")
+
+    report = CoverageReport(budget=budget)
+    current_index = get_existed_work_index() + 1
+    processed = 0
+
+    for start in range(0, len(entries), PRIORITY_BATCH_SIZE):
+        if budget_tracker.exhausted:
+            break
+
+        batch = [
+            load_cache(entry) for entry in entries[start : start + PRIORITY_BATCH_SIZE]
+        ]
+        chunks = [batch[i::NUMBER_OF_THREADS] for i in range(NUMBER_OF_THREADS)]
+
+        with tqdm(total=len(batch)) as pbar:
+            with ThreadPoolExecutor(max_workers=NUMBER_OF_THREADS) as executor:
+                futures = [
+                    executor.submit(
+                        retrive_all_episodes_from_cache,
+                        chunk,
+                        pbar,
+                        chunk_indices,
+                        budget.max_episodes_per_work,
+                    )
+                    for chunk in chunks
+                ]
+                full_works = []
+                for future in futures:
+                    full_works.extend(future.result())
+
+        # 途中で打ち切ったバッチでも、取得できた作品は保存する。
+        # 途中まで取得した作品は is_partial をつけておき、次の実行で続きから取得する
+        if len(full_works) > 0:
+            full_works.sort(key=lambda work: -scores[work.id])
+            save_works(full_works, current_index)
+            current_index += 1
+            # 前回途中まで保存していた作品は、新しく保存したほうだけを残す
+            saved_works.drop_works(
+                [work.id for work in full_works if work.id in saved_works]
+            )
+
+        for work in full_works:
+            report.works.append(
+                WorkCoverage(
+                    id=work.id,
+                    score=scores[work.id],
+                    number_of_episodes=work.number_of_episodes,
+                    number_of_fetched=sum(
+                        len(chapter.episodes) for chapter in work.chapters
+                    ),
+                    is_partial=work.is_partial,
+                )
+            )
+        processed += len(batch)
+        # バッチの中で手をつけなかった作品
+        done = {work.id for work in full_works}
+        for cache in batch:
+            if cache.id not in done:
+                report.number_of_skipped_works += 1
+                report.skipped_score += scores[cache.id]
+
+    for entry in entries[processed:]:
+        report.number_of_skipped_works += 1
+        report.skipped_score += entry.score
+
+    report.requests = budget_tracker.requests
+    report.bytes = budget_tracker.bytes
+    with open(COVERAGE_FILE_NAME, "w", encoding="utf-8") as f:
+        json.dump(report.model_dump(), f, indent=2, ensure_ascii=False)
+
+    report.summary()
+    print("done")
+
+
+# 作品を novel_work_{index}.json に足す (同じ作品があれば置き換える)
+def add_works(works: list[NovelWork], index: int):
+    path = OUTPUT_FILE_NAME(index)
+    with open(path, "r", encoding="utf-8") as f:
+        saved = [NovelWork(**data) for data in json.load(f)]
+    ids = {work.id for work in works}
+    saved = [work for work in saved if work.id not in ids] + works
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(
+            [work.model_dump() for work in saved], f, indent=2, ensure_ascii=False
+        )
+    os.replace(tmp_path, path)
+
+
+# 失敗した作品のメタデータを取り直す。
+# エピソードの取得がまだのチャンクなら、そのチャンクのキャッシュに足す。
+# もう novel_work_{chunk} を作ったチャンクはキャッシュを読み直さないので、
+# そのままエピソードまで取得して novel_work_{chunk} に足す。
+# 予算ありの実行は毎回すべてのキャッシュから未取得の作品を選ぶので、いつもキャッシュに足す
+def retry_work_dead_letters(letters: list[DeadLetter]):
+    chunks: dict[int, list[DeadLetter]] = {}
+    for letter in letters:
+        chunks.setdefault(letter.context["chunk"], []).append(letter)
+
+    for chunk_index, chunk_letters in sorted(chunks.items()):
+        recovered: list[tuple[WorkInfoCache, DeadLetter]] = []
+        resolved: list[DeadLetter] = []
+        for letter in chunk_letters:
+            url_pair = CachedURLPair(**letter.context["url_pair"])
+            pages: dict[str, str] = {}
+            try:
+                recovered.append((retrive_work_cache(url_pair, pages), letter))
+            except PageNotFound:
+                print(f"[WARNING] PageNotFound: {url_pair.metadata}")
+            except Exception as e:
+                push_work_dead_letter(
+                    url_pair, pages, e, chunk_index, attempt=letter.attempt + 1
+                )
+                continue
+            resolved.append(letter)
+
+        if len(resolved) == 0:
+            continue
+
+        if CRAWL_BUDGET is None and os.path.exists(OUTPUT_FILE_NAME(chunk_index)):
+            works: list[NovelWork] = []
+            for cache, letter in recovered:
+                pages = {}
+                try:
+                    works.append(retrive_novel_work(cache, pages=pages))
+                except Exception as e:
+                    push_work_dead_letter(
+                        make_url_pair(cache.id),
+                        work_pages(cache, pages),
+                        e,
+                        chunk_index,
+                        attempt=letter.attempt + 1,
+                    )
+                    resolved.remove(letter)
+            if len(works) > 0:
+                add_works(works, chunk_index)
+        elif len(recovered) > 0:
+            caches: dict[str, WorkInfoCache] = {}
+            if os.path.exists(CACHE_FILE_NAME(chunk_index)):
+                with open(CACHE_FILE_NAME(chunk_index), "r", encoding="utf-8") as f:
+                    caches = {
+                        data["id"]: WorkInfoCache(**data) for data in json.load(f)
+                    }
+            for cache, _ in recovered:
+                caches[cache.id] = cache
+            save_cache(list(caches.values()), chunk_index)
+
+        # 保存できてから解決済みにする
+        for letter in resolved:
+            dead_letters.resolve(letter)
+
+
+def find_work_files() -> dict[str, str]:
+    work_files = {}
+    for file_name in os.listdir(OUTPUT_PATH):
+        if not file_name.startswith("novel_work_"):
+            continue
+        path = os.path.join(OUTPUT_PATH, file_name)
+        with open(path, "r", encoding="utf-8") as f:
+            for data in json.load(f):
+                work_files[data["id"]] = path
+    return work_files
+
+
+# 失敗したエピソードを取り直して、保存済みの作品の元の位置に戻す
+def retry_episode_dead_letters(letters: list[DeadLetter]):
+    work_files = find_work_files()
+
+    files: dict[str, list[DeadLetter]] = {}
+    for letter in letters:
+        path = work_files.get(letter.context["work_id"])
+        if path is None:
+            # 作品がまだ保存されていない。次の回に回す
+            print(f"[WARNING] work not saved yet: {letter.key}")
+            continue
+        files.setdefault(path, []).append(letter)
+
+    for path, file_letters in files.items():
+        with open(path, "r", encoding="utf-8") as f:
+            works = [NovelWork(**data) for data in json.load(f)]
+        works_by_id = {work.id: work for work in works}
+
+        resolved: list[DeadLetter] = []
+        for letter in file_letters:
+            episode = Episode(**letter.context["episode"])
+            html = None
+            try:
+                html = get_html(letter.url)
+                episode.body = retriver.episode.get_body(BeautifulSoup(html, "lxml"))
+            except PageNotFound:
+                print(f"[WARNING] PageNotFound: {letter.url}")
+                resolved.append(letter)
+                continue
+            except Exception as e:
+                dead_letters.push(
+                    letter.kind,
+                    letter.key,
+                    letter.url,
+                    e,
+                    response=html,
+                    context=letter.context,
+                    attempt=letter.attempt + 1,
+                )
+                continue
+
+            chapter = works_by_id[letter.context["work_id"]].chapters[
+                letter.context["chapter"]
+            ]
+            chapter.episodes = [e for e in chapter.episodes if e.id != episode.id]
+            chapter.episodes.append(episode)
+            chapter.episodes.sort(key=lambda e: e.index)
+            resolved.append(letter)
+
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                [work.model_dump() for work in works], f, indent=2, ensure_ascii=False
+            )
+        os.replace(tmp_path, path)
+        for letter in resolved:
+            dead_letters.resolve(letter)
+
+
+# 取得を一通り終えたあとに、失敗したものだけを取り直す
+def retry_dead_letters():
+    work_letters = dead_letters.pending("work", MAX_DEAD_LETTER_ATTEMPTS)
+    episode_letters = dead_letters.pending("episode", MAX_DEAD_LETTER_ATTEMPTS)
+    print(f"retrying {len(work_letters)} works and {len(episode_letters)} episodes")
+
+    if len(work_letters) > 0:
+        retry_work_dead_letters(work_letters)
+    if len(episode_letters) > 0:
+        retry_episode_dead_letters(episode_letters)
+
+
 def main():
+    global previous_snapshot
+    if PREVIOUS_OUTPUT_PATH is not None:
+        previous_snapshot = PreviousSnapshot(PREVIOUS_OUTPUT_PATH)
+
     if not os.path.exists(OUTPUT_PATH):
         os.mkdir(OUTPUT_PATH)
     if not os.path.exists(CACHE_PATH):
         os.mkdir(CACHE_PATH)
 
     # create_cache()
-    retrive_full_works()
+    if CRAWL_BUDGET is not None:
+        retrive_prioritized_works(CRAWL_BUDGET)
+    else:
+        retrive_full_works()
+
+    retry_dead_letters()
 
 
 if __name__ == "__main__":
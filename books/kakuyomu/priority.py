@@ -0,0 +1,108 @@
+import math
+import threading
+
+from pydantic import BaseModel
+
+
+# 作品の価値 = 各指標の log(1 + x) の重み付き和。
+# 桁が違う指標 (PV と星など) を同じくらいに効かせるために log をとる
+class ScoreWeights(BaseModel):
+    stars: float = 1.0
+    total_pv: float = 0.5
+    followers: float = 0.5
+    total_characters: float = 0.1
+
+
+def work_score(
+    weights: ScoreWeights,
+    stars: int,
+    total_pv: int,
+    followers: int,
+    total_characters: int,
+) -> float:
+    return (
+        weights.stars * math.log1p(stars)
+        + weights.total_pv * math.log1p(total_pv)
+        + weights.followers * math.log1p(followers)
+        + weights.total_characters * math.log1p(total_characters)
+    )
+
+
+class CrawlBudget(BaseModel):
+    max_requests: int | None = None
+    max_bytes: int | None = None
+    max_episodes_per_work: int | None = None  # 1 作品で取得するエピソード数の上限
+
+
+# スレッドをまたいでリクエスト数とバイト数を数える
+class BudgetTracker:
+    def __init__(self, budget: CrawlBudget):
+        self.budget = budget
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.bytes = 0
+
+    @property
+    def exhausted(self) -> bool:
+        with self.lock:
+            return self._exhausted()
+
+    def _exhausted(self) -> bool:
+        return (
+            self.budget.max_requests is not None
+            and self.requests >= self.budget.max_requests
+        ) or (self.budget.max_bytes is not None and self.bytes >= self.budget.max_bytes)
+
+    # 予算が残っていれば 1 リクエスト分を確保する
+    def acquire(self) -> bool:
+        with self.lock:
+            if self._exhausted():
+                return False
+            self.requests += 1
+            return True
+
+    def record_bytes(self, num_bytes: int):
+        with self.lock:
+            self.bytes += num_bytes
+
+
+class WorkCoverage(BaseModel):
+    id: str
+    score: float
+    number_of_episodes: int
+    number_of_fetched: int  # 取得できた (または前回から流用した) エピソード数
+    is_partial: bool = False  # 途中で打ち切った。次の実行で続きから取得する
+
+
+class CoverageReport(BaseModel):
+    budget: CrawlBudget
+    requests: int = 0
+    bytes: int = 0
+    works: list[WorkCoverage] = []
+    number_of_skipped_works: int = 0  # 予算切れで手をつけなかった作品
+    skipped_score: float = 0.0
+
+    def summary(self):
+        total_episodes = sum(work.number_of_episodes for work in self.works)
+        fetched_episodes = sum(work.number_of_fetched for work in self.works)
+        covered_score = sum(
+            work.score * work.number_of_fetched / max(1, work.number_of_episodes)
+            for work in self.works
+        )
+        total_score = sum(work.score for work in self.works) + self.skipped_score
+
+        print(f"requests: {self.requests}, bytes: {self.bytes}")
+        number_of_partial = sum(1 for work in self.works if work.is_partial)
+        print(
+            f"works: {len(self.works)} processed ({number_of_partial} partial), "
+            f"{self.number_of_skipped_works} skipped"
+        )
+        print(f"episodes: {fetched_episodes}/{total_episodes}")
+        print(
+            f"score coverage: {covered_score:.1f}/{total_score:.1f} "
+            f"({covered_score / max(total_score, 1e-9):.1%})"
+        )
+
+
+class BudgetExhausted(Exception):
+    pass
@@ -0,0 +1,183 @@
+import os
+import re
+import json
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Iterator
+
+from pydantic import BaseModel
+
+from utils import NovelWork, Episode, Comment, Chapter
+
+# JSON の構造に関わる文字 (文字列の中では \ と " だけが意味を持つ)
+TOKEN = re.compile(rb'[\\"\[\]{}]')
+BACKSLASH, QUOTE = ord("\\"), ord('"')
+# ファイルを読む単位
+SCAN_CHUNK_SIZE = 1024 * 1024
+
+
+# 前回の出力の作品ごとの版。本文は持たず、どのファイルのどこにあるかだけを覚えておく
+class WorkVersion(BaseModel):
+    file: str
+    offset: int  # ファイルの先頭からのバイト数
+    length: int  # この作品の JSON のバイト数
+    updated_at: str
+    number_of_comments: int | None
+    is_partial: bool = False  # 予算などでエピソードを途中までしか取得していない
+
+
+# novel_work_*.json の配列の要素を 1 つずつ、バイト位置と一緒に返す。
+# ファイルは SCAN_CHUNK_SIZE ずつ読み、メモリに持つのは読んでいる部分と 1 作品分の JSON だけ
+def scan_works(file: str) -> Iterator[tuple[dict, int, int]]:
+    depth = 0  # 外側の配列の中が 1
+    in_string = False
+    escaped = False  # 前の部分が文字列の中の \ で終わった
+    start = 0  # 今の作品の先頭のバイト位置
+    element = bytearray()  # 今の作品の、前の部分までに読んだバイト列
+    position = 0  # 読んでいる部分の先頭のバイト位置
+
+    with open(file, "rb") as f:
+        while chunk := f.read(SCAN_CHUNK_SIZE):
+            pos = 1 if escaped else 0
+            escaped = False
+            element_start = 0  # この部分のうち、今の作品が始まる位置
+
+            while (match := TOKEN.search(chunk, pos)) is not None:
+                char = chunk[match.start()]
+                pos = match.end()
+                if in_string:
+                    if char == BACKSLASH:
+                        # エスケープされた 1 文字を飛ばす
+                        escaped = pos >= len(chunk)
+                        pos += 1
+                    elif char == QUOTE:
+                        in_string = False
+                elif char == QUOTE:
+                    in_string = True
+                elif char in b"[{":
+                    depth += 1
+                    if depth == 2:
+                        start = position + match.start()
+                        element_start = match.start()
+                elif depth == 2:
+                    element += chunk[element_start:pos]
+                    yield json.loads(element), start, len(element)
+                    element = bytearray()
+                    depth -= 1
+                else:
+                    depth -= 1
+                    if depth == 0:
+                        return
+
+            if depth >= 2:
+                element += chunk[element_start:]
+            position += len(chunk)
+
+
+def load_at(file: str, offset: int, length: int) -> dict:
+    with open(file, "rb") as f:
+        f.seek(offset)
+        return json.loads(f.read(length))
+
+
+# 前回の novel_work_*.json をまとめて引けるようにする。
+# 最初に作るのは作品 id -> (ファイル, 位置) の索引だけで、本文が必要になったときにその作品だけを読む
+class PreviousSnapshot:
+    def __init__(self, output_path: str, max_loaded_works: int = 8):
+        self.lock = threading.Lock()
+        self.works: dict[str, WorkVersion] = {}
+        self.max_loaded_works = max_loaded_works
+        self.loaded_works: OrderedDict[str, NovelWork] = OrderedDict()
+
+        # 同じ作品が複数のファイルにあるときは、番号が大きい (新しい) ファイルのものを使う
+        file_names = [
+            file_name
+            for file_name in os.listdir(output_path)
+            if file_name.startswith("novel_work_") and file_name.endswith(".json")
+        ]
+        file_names.sort(key=lambda file_name: int(Path(file_name).stem.split("_")[-1]))
+        for file_name in file_names:
+            self.index_file(str(Path(output_path, file_name).resolve()))
+
+        print(f"{len(self.works)} works found in the previous snapshot")
+
+    def index_file(self, file: str):
+        for data, offset, length in scan_works(file):
+            self.works[data["id"]] = WorkVersion(
+                file=file,
+                offset=offset,
+                length=length,
+                updated_at=data["metadata"]["updated_at"],
+                number_of_comments=data["number_of_comments"],
+                is_partial=data.get("is_partial", False),
+            )
+
+    def __contains__(self, work_id: str) -> bool:
+        return work_id in self.works
+
+    def version(self, work_id: str) -> WorkVersion | None:
+        return self.works.get(work_id)
+
+    def previous_comments(self, work_id: str) -> list[Comment] | None:
+        work = self.load_work(work_id)
+        return None if work is None else work.comments
+
+    def load_work(self, work_id: str) -> NovelWork | None:
+        version = self.works.get(work_id)
+        if version is None:
+            return None
+
+        with self.lock:
+            # コメントとエピソードで同じ作品が続けて引かれるので、最近読んだ作品だけ持っておく
+            if work_id not in self.loaded_works:
+                data = load_at(version.file, version.offset, version.length)
+                self.loaded_works[work_id] = NovelWork(**data)
+                if len(self.loaded_works) > self.max_loaded_works:
+                    self.loaded_works.popitem(last=False)
+            self.loaded_works.move_to_end(work_id)
+            return self.loaded_works[work_id]
+
+    # 作品の更新日時が前回と同じなら、エピソードは 1 つも変わっていない
+    # (前回が途中までなら、残りを取得しないといけない)
+    def unchanged_chapters(self, work_id: str, updated_at: str) -> list[Chapter] | None:
+        version = self.works.get(work_id)
+        if version is None or version.updated_at != updated_at or version.is_partial:
+            return None
+        work = self.load_work(work_id)
+        return None if work is None else work.chapters
+
+    # 前回取得したエピソード。公開日時が変わっていなければ本文をそのまま使える
+    def previous_episodes(self, work_id: str) -> dict[str, Episode]:
+        work = self.load_work(work_id)
+        if work is None:
+            return {}
+        return {
+            episode.id: episode
+            for chapter in work.chapters
+            for episode in chapter.episodes
+        }
+
+    # 作品をファイルから取り除く (取得し直して別のファイルに保存したとき)。
+    # 書き換えたファイルは位置がずれるので索引を作り直す
+    def drop_works(self, work_ids: list[str]):
+        files: dict[str, set[str]] = {}
+        for work_id in work_ids:
+            version = self.works.get(work_id)
+            if version is not None:
+                files.setdefault(version.file, set()).add(work_id)
+
+        with self.lock:
+            for file, ids in files.items():
+                kept = [
+                    data for data, _, _ in scan_works(file) if data["id"] not in ids
+                ]
+                tmp_path = file + ".tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(kept, f, indent=2, ensure_ascii=False)
+                os.replace(tmp_path, file)
+
+                for work_id in ids:
+                    del self.works[work_id]
+                    self.loaded_works.pop(work_id, None)
+                self.index_file(file)
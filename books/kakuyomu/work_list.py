@@ -1,3 +1,9 @@
+import sys
+import os
+import json
+import argparse
+from datetime import datetime
+from pathlib import Path
 from typing import Optional
 
 from pydantic import BaseModel
@@ -6,6 +12,10 @@ from bs4 import BeautifulSoup, Tag
 
 from utils import SEARCH_ORDER, get_soup, KakuyomuURL
 
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+
+from common.frontier import Frontier
+
 
 class SearchCondition(BaseModel):
     order: SEARCH_ORDER = "popular"
@@ -46,6 +56,22 @@ EMPTY_MESSAGE_CLASSNAME = "div.EmptyMessage_emptyMessage__u2slN"
 
 WORK_LINK_IN_H3 = "h3 > span:nth-child(1) > a:nth-child(1)"
 
+# 実行をまたいで既出の作品 URL を覚えておく
+FRONTIER_PATH = "work_list/frontier.sqlite"
+
+# 更新順の検索で、前回どこまで見たか
+DISCOVERY_STATE_PATH = "work_list/discovery_state.json"
+DISCOVERY_MIN_STAR = search_conditions[-1].min_star  # 作品リストと同じ範囲を見る
+
+# 検索結果の作品ごとの時刻 (更新順のときは最終更新日時)
+WORK_TIME = "time[datetime]"
+
+
+class DiscoveryState(BaseModel):
+    last_episode_published_at: str | None = None  # これより前のものは探さない
+    # last_episode_published_at ちょうどに更新された作品のうち、もう見たもの
+    urls_at_last: list[str] = []
+
 
 def is_no_result(soup: BeautifulSoup):
     return len(soup.select(EMPTY_MESSAGE_CLASSNAME)) == 1
@@ -75,6 +101,129 @@ def extract_urls(soup: BeautifulSoup):
     return links
 
 
+# 作品ごとに、リンクと結果の中にある一番新しい時刻を返す
+def extract_works(soup: BeautifulSoup) -> list[tuple[str, str | None]]:
+    result_el = results_element(soup)
+    if not isinstance(result_el, Tag):
+        raise ValueError("no result element")
+
+    works: list[tuple[str, str | None]] = []
+    for link_el in result_el.select(WORK_LINK_IN_H3):
+        href = link_el.get("href")
+        if not isinstance(href, str) or not href.startswith("/works/"):
+            continue
+
+        # 結果の一覧の直下まで上がったところが 1 作品分
+        item_el = link_el
+        while item_el.parent is not None and item_el.parent is not result_el:
+            item_el = item_el.parent
+
+        times = [time_el.get("datetime") for time_el in item_el.select(WORK_TIME)]
+        times = [time for time in times if isinstance(time, str)]
+        works.append((f"{KakuyomuURL.BASE_URL}{href}", max(times, default=None)))
+
+    return works
+
+
+def load_discovery_state(path: str) -> DiscoveryState:
+    if not os.path.exists(path):
+        return DiscoveryState()
+    with open(path, "r", encoding="utf-8") as f:
+        return DiscoveryState(**json.load(f))
+
+
+def save_discovery_state(path: str, state: DiscoveryState):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state.model_dump(), f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+# 更新順に検索して、前回の実行以降に更新・公開された作品だけを返す。
+# 更新日時が前回の最新より古い作品が出てきたところで止める。
+# 前回の最新と同じ時刻の作品は、前回見ていなかったものだけを返す
+def discover_updated_works(state: DiscoveryState) -> list[str]:
+    kakuyomu = KakuyomuURL()
+
+    last = state.last_episode_published_at
+    if last is None:
+        print("[WARNING] no previous discovery. walk all pages")
+    seen_at_last = set(state.urls_at_last)
+
+    updated: list[str] = []
+    newest = last
+    urls_at_newest = list(state.urls_at_last)
+    oldest_seen: str | None = None
+
+    for index in range(MIN_PAGE, MAX_PAGE + 1):
+        url = kakuyomu.compose_search_url(
+            order="last_episode_published_at",
+            min_star=DISCOVERY_MIN_STAR,
+            max_star=None,
+            page=index,
+        )
+        print(url)
+
+        soup = get_soup(url)
+        if is_no_result(soup):
+            print(f"no result. page: {index}")
+            break
+
+        reached = False
+        for work_url, published_at in extract_works(soup):
+            if published_at is None:
+                updated.append(work_url)  # 時刻が取れないものは念のため取り直す
+                continue
+            if last is not None and published_at < last:
+                reached = True
+                break
+            oldest_seen = published_at
+            if published_at == last and work_url in seen_at_last:
+                continue
+            updated.append(work_url)
+
+            if newest is None or published_at > newest:
+                newest = published_at
+                urls_at_newest = []
+            if published_at == newest:
+                urls_at_newest.append(work_url)
+
+        if reached:
+            print(f"reached the last discovery at page {index}")
+            break
+    else:
+        # 検索結果は MAX_PAGE までしかたどれない。その先にある更新は取りこぼしている
+        if last is not None:
+            print(
+                f"[WARNING] stopped at page {MAX_PAGE} before reaching the last "
+                f"discovery ({last}). works updated between {last} and "
+                f"{oldest_seen} are missed"
+            )
+
+    state.last_episode_published_at = newest
+    state.urls_at_last = list(dict.fromkeys(urls_at_newest))
+    return list(dict.fromkeys(updated))
+
+
+def discover():
+    state = load_discovery_state(DISCOVERY_STATE_PATH)
+    urls = discover_updated_works(state)
+
+    frontier = Frontier(FRONTIER_PATH)
+    new_urls = frontier.add_many(urls)
+    print(f"found {len(urls)} updated works ({len(new_urls)} new)")
+
+    # クローラーにはこのファイルを URL_LIST_PATH として渡す
+    path = f"work_list/updated_{datetime.now().strftime('%Y%m%d%H%M%S')}.txt"
+    with open(path, "w", encoding="utf-8") as f:
+        for url in urls:
+            f.write(url + "\n")
+    print(f"saved to {path}")
+
+    # URL を書き出してから進める
+    save_discovery_state(DISCOVERY_STATE_PATH, state)
+
+
 def main():
     kakuyomu = KakuyomuURL()
 
@@ -99,15 +248,18 @@ def main():
 
             soups.append(soup)
 
-    urls: list[str] = []
+    frontier = Frontier(FRONTIER_PATH)
 
-    # まとめて抽出
+    # まとめて抽出する。urls.txt にはこの検索で見つかった作品だけを見つけた順に書く
+    # (前回までの実行や --discover で frontier に入った作品は含めない)
+    urls: list[str] = []
     for soup in soups:
-        urls.extend(extract_urls(soup))
-        print(f"found {len(urls)} works")
+        found = extract_urls(soup)
+        new_urls = frontier.add_many(found)
+        print(f"found {len(new_urls)} new works")
+        urls.extend(found)
 
-    # 重複除去
-    urls = list(set(urls))
+    urls = list(dict.fromkeys(urls))
 
     print(f"found {len(urls)} works")
 
@@ -118,4 +270,15 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--discover",
+        action="store_true",
+        help="前回の実行以降に更新された作品だけを探す",
+    )
+    args = parser.parse_args()
+
+    if args.discover:
+        discover()
+    else:
+        main()
@@ -0,0 +1,12 @@
+from . import (
+    frontier,
+    scheduler,
+    shard_writer,
+    dead_letter,
+    encoding,
+    near_dedup,
+    content_hash,
+    text_quality,
+    response_cache,
+    adapter,
+)
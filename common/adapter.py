@@ -0,0 +1,362 @@
+import json
+from abc import ABC, abstractmethod
+from collections import deque
+from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator, TypeVar
+
+import pyarrow as pa
+import requests
+from bs4 import BeautifulSoup
+from pydantic import BaseModel
+from tqdm import tqdm
+
+from .content_hash import ContentIndex
+from .dead_letter import DeadLetterQueue
+from .encoding import decode_html
+from .frontier import Frontier
+from .response_cache import CachedResponse, ResponseCache
+from .scheduler import FetchTask, HostPolicy, HostScheduler, HostStats
+from .shard_writer import ShardWriter
+
+R = TypeVar("R")
+
+
+# 取得するページ。payload にはページを見つけたときの情報 (一覧にあったタイトルなど) を入れる
+class Ref(BaseModel):
+    url: str
+    key: str | None = None  # 重複除去の単位。None なら url
+    payload: dict[str, Any] = {}
+
+    @property
+    def dedupe_key(self) -> str:
+        return self.key if self.key is not None else self.url
+
+
+# 一覧ページからわかったもの。listings は続けて読む一覧ページ (次のページなど)
+class Listing(BaseModel):
+    items: list[Ref] = []
+    listings: list[Ref] = []
+
+
+# 取得したページ。サイトへ取りに行ったものとキャッシュのものを区別せずに扱う
+class Page:
+    def __init__(self, res: requests.Response | CachedResponse, from_cache: bool):
+        self.url = res.url
+        self.status_code = res.status_code
+        self.headers = res.headers
+        self.content = res.content
+        self.from_cache = from_cache
+        self._text: str | None = None
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text, _ = decode_html(self.content, self.headers.get("Content-Type"))
+        return self._text
+
+    def soup(self, parser: str = "lxml") -> BeautifulSoup:
+        return BeautifulSoup(self.text, parser)
+
+    def json(self) -> Any:
+        return json.loads(self.content)
+
+
+# サイトごとに書くのはこれだけ。
+# listings で最初の一覧ページを返し、一覧ページから記事などのページを見つけて、
+# そのページをレコードにする。取得・キャッシュ・間隔・保存・再開は collect が行う。
+# 種類の違うレコードを混ぜるときは schema で全部の列を決めておく
+class SiteAdapter(ABC):
+    name: str = "site"
+    policy: HostPolicy = HostPolicy()
+    schema: pa.Schema | None = None
+
+    @abstractmethod
+    def listings(self) -> Iterable[Ref]: ...
+
+    @abstractmethod
+    def parse_listing(self, page: Page, ref: Ref) -> Listing: ...
+
+    # 前回たどり終えた一覧ページを、次にたどり始めるときにもう一度読むか。
+    # 新しいページが増えていく一覧 (検索結果など) だけを True にすると、それ以外の一覧ページは
+    # 前回見つけたページをそのまま使い、取り直さない
+    def refresh_listing(self, ref: Ref) -> bool:
+        return True
+
+    # 1 ページから 0 個以上のレコード
+    @abstractmethod
+    def parse_item(self, page: Page, ref: Ref) -> dict | list[dict] | None: ...
+
+    # ページがないものとして扱うレスポンス。失敗にせず (dead letter にも入れず) not_found に数える。
+    # 408 と 429 は取り直せば取れるので失敗にする
+    def is_missing(self, page: Page) -> bool:
+        return 400 <= page.status_code < 500 and page.status_code not in (408, 429)
+
+    # 取得済みのページと同じ内容だったページ (collect に content_index を渡したとき) は
+    # parse_item の代わりにこれを書く。最初のページの URL を duplicate_of に持つ参照にする。
+    # schema を決めていないときは parse_item と同じ列を返すように上書きする
+    def duplicate_record(self, ref: Ref, duplicate_of: str) -> dict | list[dict] | None:
+        return {"url": ref.url, "duplicate_of": duplicate_of}
+
+
+class CollectStats(BaseModel):
+    listings: int = 0
+    items: int = 0  # 一覧から見つかったページ (重複除去後)
+    done: int = 0  # 前回までに保存済み
+    cached: int = 0  # キャッシュから読んだページ
+    not_found: int = 0
+    duplicates: int = 0  # 取得済みのページと同じ内容だったページ
+    failed: int = 0
+    records: int = 0
+    hosts: dict[str, HostStats] = {}
+
+    def summary(self):
+        print(
+            f"{self.listings} listings, {self.items} items ({self.done} already done), "
+            f"{self.records} records, {self.cached} from cache, "
+            f"{self.not_found} not found, {self.duplicates} duplicates, "
+            f"{self.failed} failed"
+        )
+        for host, stats in self.hosts.items():
+            print(f"  {host}: {stats}")
+
+
+class NotFound(Exception):
+    pass
+
+
+# frontier に入れた Ref を戻す。data のないものは、ほかのツールが URL だけを入れたもの
+def ref_from_entry(url: str, data: str | None) -> Ref:
+    return Ref(url=url) if data is None else Ref.model_validate_json(data)
+
+
+# directory の中に、サイトごとの状態をまとめて持つ
+class Collector:
+    def __init__(
+        self,
+        adapter: SiteAdapter,
+        directory: str | Path,
+        scheduler: HostScheduler | None = None,
+        content_index: ContentIndex | None = None,
+        cache_listings: bool = False,  # 一覧ページもキャッシュから読むか
+        batch_size: int = 1000,  # 未取得キューから一度に取り出して並行に取得する数
+    ):
+        self.adapter = adapter
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        self.scheduler = scheduler or HostScheduler(default_policy=adapter.policy)
+        self.cache = ResponseCache(self.directory / "cache.sqlite")
+        self.frontier = Frontier(self.directory / "frontier.sqlite")
+        self.listing_frontier = Frontier(self.directory / "listings.sqlite")
+        self.dead_letters = DeadLetterQueue(self.directory / "dead_letter.jsonl")
+        self.content_index = content_index
+        self.cache_listings = cache_listings
+        self.batch_size = batch_size
+        self.stats = CollectStats()
+
+    # ref のページを parse に渡して、(ref, 結果) を終わった順に返す。失敗したものは返さない。
+    # キャッシュにあるものはその場で、ないものはスケジューラーで並行して取得する
+    def fetch(
+        self,
+        refs: list[Ref],
+        parse: Callable[[Page, Ref], R],
+        kind: str,
+        use_cache: bool,
+    ) -> Iterator[tuple[Ref, R | None]]:
+        def handle_page(page: Page, ref: Ref) -> R | None:
+            if self.adapter.is_missing(page):
+                raise NotFound(page.url)
+            try:
+                if page.status_code != 200:
+                    raise Exception(f"{ref.url} got {page.status_code}!!")
+                return parse(page, ref)
+            except Exception as e:
+                self.dead_letters.push(
+                    kind, ref.dedupe_key, ref.url, e, response=page.text
+                )
+                raise
+
+        def handle(task: FetchTask, res: requests.Response):
+            ref = refs[task.payload]
+            if res.status_code == 200:
+                self.cache.put(res, ref.url)
+            # ページのないものは失敗にしない。(見つかったか, 結果) を返す
+            try:
+                return True, handle_page(Page(res, from_cache=False), ref)
+            except NotFound:
+                return False, None
+
+        tasks = []
+        for index, ref in enumerate(refs):
+            cached = self.cache.get(ref.url) if use_cache else None
+            if cached is None:
+                tasks.append(FetchTask(url=ref.url, payload=index))
+                continue
+
+            self.stats.cached += 1
+            try:
+                yield ref, handle_page(Page(cached, from_cache=True), ref)
+            except NotFound:
+                self.stats.not_found += 1
+                yield ref, None
+            except Exception as e:
+                print(f"[WARNING] failed to parse {ref.url}: {e!r}")
+                self.stats.failed += 1
+
+        for result in self.scheduler.run(tasks, handle):
+            ref = refs[result.task.payload]
+            if result.error is not None:
+                # レスポンスが返ってきたものは handle_page で記録済み
+                if result.error.startswith("Max retry exceeded"):
+                    self.dead_letters.push(
+                        kind, ref.dedupe_key, ref.url, Exception(result.error)
+                    )
+                print(f"[WARNING] failed: {ref.url}: {result.error}")
+                self.stats.failed += 1
+                continue
+            found, value = result.result
+            if not found:
+                self.stats.not_found += 1
+            yield ref, value
+
+    # 一覧ページをたどり、見つけた記事などのページを frontier の未取得キューに入れる。
+    # たどった一覧ページは listings.sqlite に記録するので、途中で止まっても続きからたどる。
+    # 前回たどり終えていれば最初の一覧ページからたどり直すが、たどり終えた一覧ページのうち
+    # adapter.refresh_listing が False のものは読まない。
+    # 一覧ページは追加順にたどるので、実行ごとに順番は変わらない。
+    # 新しく見つかったページの数を返す
+    def discover(self) -> int:
+        listings = self.listing_frontier
+        listings.recover()  # 前回の取得中に落ちたもの
+        if listings.pending_count() == 0:
+            listings.remove(
+                *(
+                    url
+                    for url, data in listings.entries("done")
+                    if self.adapter.refresh_listing(ref_from_entry(url, data))
+                )
+            )
+            listings.add_entries(
+                (ref.url, ref.model_dump_json()) for ref in self.adapter.listings()
+            )
+
+        num_added = 0
+        failed: list[str] = []
+        with tqdm(desc="listings") as pbar:
+            while batch := listings.pop_entries(self.batch_size):
+                refs = [ref_from_entry(url, data) for url, data in batch]
+                results: list[Listing | None] = [None] * len(refs)
+                positions = {id(ref): i for i, ref in enumerate(refs)}
+                fetched: set[str] = set()
+                for ref, listing in self.fetch(
+                    refs, self.adapter.parse_listing, "listing", self.cache_listings
+                ):
+                    results[positions[id(ref)]] = listing
+                    fetched.add(ref.url)
+                    pbar.update()
+                self.stats.listings += len(fetched)
+
+                # 一覧の順番で足す
+                for listing in results:
+                    if listing is None:
+                        continue
+                    num_added += len(
+                        self.frontier.add_entries(
+                            (ref.dedupe_key, ref.model_dump_json())
+                            for ref in listing.items
+                        )
+                    )
+                    listings.add_entries(
+                        (ref.url, ref.model_dump_json()) for ref in listing.listings
+                    )
+                listings.done(*fetched)
+                failed.extend(ref.url for ref in refs if ref.url not in fetched)
+
+        # 失敗した一覧ページは記録から消し、次にたどり直したときに親の一覧ページから見つけ直す
+        listings.remove(*failed)
+        return num_added
+
+    # 見つけたページを frontier の未取得キューに入れ、キューから取り出して取得しシャードに書く。
+    # frontier にはシャードが確定したページだけを取得済みとして記録する。
+    # 失敗したページはキューに戻して、次の実行で取り直す
+    def collect(self, items: list[Ref] | None = None) -> CollectStats:
+        if items is None:
+            self.discover()
+        else:
+            self.frontier.add_entries(
+                (ref.dedupe_key, ref.model_dump_json()) for ref in items
+            )
+        self.frontier.recover()  # 前回の取得中に落ちたもの
+        num_pending = self.frontier.pending_count()
+        self.stats.items = len(self.frontier)
+        self.stats.done = self.stats.items - num_pending
+
+        # (レコード, 取得済みのページと同じ内容だったか)
+        def parse_item(page: Page, ref: Ref) -> tuple[list[dict], bool]:
+            duplicate_of = None
+            if self.content_index is not None and not page.from_cache:
+                duplicate_of = self.content_index.add_raw(
+                    page.content, self.adapter.name, ref.url
+                )
+            if duplicate_of is not None:
+                records = self.adapter.duplicate_record(ref, duplicate_of)
+            else:
+                records = self.adapter.parse_item(page, ref)
+            if records is None:
+                return [], duplicate_of is not None
+            records = records if isinstance(records, list) else [records]
+            return records, duplicate_of is not None
+
+        # (そのページのレコードを書き終えたときの行数, キー)。
+        # シャードが確定して行数がそこまで届いたページから取得済みにする
+        uncommitted: deque[tuple[int, str]] = deque()
+
+        def mark_done(num_rows: int):
+            keys = []
+            while len(uncommitted) > 0 and uncommitted[0][0] <= num_rows:
+                keys.append(uncommitted.popleft()[1])
+            self.frontier.done(*keys)
+
+        failed: list[str] = []
+        with ShardWriter(
+            self.directory / "items", schema=self.adapter.schema, on_commit=mark_done
+        ) as writer, tqdm(total=num_pending, desc="items") as pbar:
+            num_rows = writer.num_rows
+            while batch := self.frontier.pop_entries(self.batch_size):
+                refs = [ref_from_entry(key, data) for key, data in batch]
+
+                fetched: set[str] = set()
+                for ref, result in self.fetch(refs, parse_item, "item", True):
+                    records, duplicate = result or ([], False)
+                    if duplicate:
+                        self.stats.duplicates += 1
+                    fetched.add(ref.dedupe_key)
+                    num_rows += len(records)
+                    uncommitted.append((num_rows, ref.dedupe_key))
+                    for record in records:
+                        self.stats.records += 1
+                        writer.write(record)
+                    pbar.update()
+                failed.extend(
+                    ref.dedupe_key for ref in refs if ref.dedupe_key not in fetched
+                )
+
+        # 最後のシャードに何も書かなかったときは on_commit が呼ばれない
+        mark_done(writer.num_rows)
+        self.frontier.release(*failed)
+
+        self.stats.hosts = self.scheduler.report()
+        self.stats.summary()
+        return self.stats
+
+
+def collect(
+    adapter: SiteAdapter,
+    directory: str | Path,
+    scheduler: HostScheduler | None = None,
+    content_index: ContentIndex | None = None,
+    cache_listings: bool = False,
+) -> CollectStats:
+    return Collector(
+        adapter, directory, scheduler, content_index, cache_listings
+    ).collect()
@@ -0,0 +1,120 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Literal
+
+from pydantic import BaseModel
+
+CONTENT_KIND = Literal[
+    "raw",  # レスポンスのバイト列そのもの
+    "text",  # 抽出した本文
+]
+
+
+def content_digest(content: bytes) -> bytes:
+    return hashlib.blake2b(content, digest_size=16).digest()
+
+
+class DuplicateStats(BaseModel):
+    seen: int = 0
+    duplicates: int = 0
+
+    @property
+    def ratio(self) -> float:
+        return self.duplicates / self.seen if self.seen > 0 else 0.0
+
+
+# 一度見た内容のハッシュと、それを最初に保存したもの (URL など) を覚えておく。
+# パースや保存の前に引いて、同じ内容なら最初のものへの参照だけで済ませる
+class ContentIndex:
+    def __init__(self, path: str | Path):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(
+            str(path), timeout=60, isolation_level=None, check_same_thread=False
+        )
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS contents (
+                kind TEXT NOT NULL,
+                digest BLOB NOT NULL,
+                ref TEXT NOT NULL,
+                added_at REAL NOT NULL,
+                PRIMARY KEY (kind, digest)
+            ) WITHOUT ROWID
+            """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS stats (
+                source TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                seen INTEGER NOT NULL DEFAULT 0,
+                duplicates INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (source, kind)
+            )
+            """)
+
+    def close(self):
+        self.conn.close()
+
+    # 初めて見た内容なら ref で登録して None、見たことがあれば最初の ref を返す。
+    # 同じ ref で登録済みのもの (保存前に落ちて取り直したときなど) は重複にしない
+    def add(
+        self, kind: CONTENT_KIND, content: bytes, source: str, ref: str
+    ) -> str | None:
+        digest = content_digest(content)
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.execute(
+                    "INSERT OR IGNORE INTO contents VALUES (?, ?, ?, ?)",
+                    (kind, digest, ref, time.time()),
+                )
+                (first_ref,) = self.conn.execute(
+                    "SELECT ref FROM contents WHERE kind = ? AND digest = ?",
+                    (kind, digest),
+                ).fetchone()
+                duplicate_of = first_ref if first_ref != ref else None
+                self.conn.execute(
+                    """
+                    INSERT INTO stats VALUES (?, ?, 1, ?)
+                    ON CONFLICT (source, kind) DO UPDATE SET
+                        seen = seen + 1,
+                        duplicates = duplicates + excluded.duplicates
+                    """,
+                    (source, kind, int(duplicate_of is not None)),
+                )
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+        return duplicate_of
+
+    def add_raw(self, content: bytes, source: str, ref: str) -> str | None:
+        return self.add("raw", content, source, ref)
+
+    def add_text(self, text: str, source: str, ref: str) -> str | None:
+        return self.add("text", text.encode("utf-8"), source, ref)
+
+    # ソースごと、種類ごとの重複の割合
+    def report(self) -> dict[str, dict[str, DuplicateStats]]:
+        report: dict[str, dict[str, DuplicateStats]] = {}
+        with self.lock:
+            for source, kind, seen, duplicates in self.conn.execute(
+                "SELECT source, kind, seen, duplicates FROM stats ORDER BY source, kind"
+            ):
+                report.setdefault(source, {})[kind] = DuplicateStats(
+                    seen=seen, duplicates=duplicates
+                )
+        return report
+
+    def summary(self):
+        for source, kinds in self.report().items():
+            for kind, stats in kinds.items():
+                print(
+                    f"{source} {kind}: {stats.duplicates}/{stats.seen} duplicates "
+                    f"({stats.ratio:.1%})"
+                )
@@ -0,0 +1,102 @@
+import json
+import threading
+import time
+import traceback
+from pathlib import Path
+from typing import Any, Literal
+
+from pydantic import BaseModel
+
+DEAD_LETTER_STATUS = Literal[
+    "failed",  # 取り直しを待っている
+    "resolved",  # 取り直せた
+]
+
+
+class DeadLetter(BaseModel):
+    kind: str  # "work", "episode" など、取り直し方の区別
+    key: str  # kind の中で一意な識別子
+    url: str
+    status: DEAD_LETTER_STATUS = "failed"
+    error: str | None = None
+    traceback: str | None = None
+    response: str | None = None  # 失敗したときに手元にあった生の応答
+    context: dict[str, Any] = {}  # 取り直して元の場所に戻すための情報
+    attempt: int = 1
+    recorded_at: float = 0.0
+
+
+# 取得や解析に失敗したものを JSONL に追記していく。
+# 同じ (kind, key) は最後に書かれた行が現在の状態
+class DeadLetterQueue:
+    def __init__(self, path: str | Path):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.path = Path(path)
+        self.lock = threading.Lock()
+
+    def _append(self, letter: DeadLetter):
+        letter.recorded_at = time.time()
+        with self.lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(letter.model_dump(), ensure_ascii=False) + "\n")
+
+    def push(
+        self,
+        kind: str,
+        key: str,
+        url: str,
+        error: BaseException,
+        response: str | None = None,
+        context: dict[str, Any] | None = None,
+        attempt: int = 1,
+    ):
+        print(f"[WARNING] dead letter ({kind} {key}): {error!r}")
+        self._append(
+            DeadLetter(
+                kind=kind,
+                key=key,
+                url=url,
+                error=repr(error),
+                traceback="".join(traceback.format_exception(error)),
+                response=response,
+                context=context or {},
+                attempt=attempt,
+            )
+        )
+
+    def resolve(self, letter: DeadLetter):
+        self._append(
+            DeadLetter(
+                kind=letter.kind,
+                key=letter.key,
+                url=letter.url,
+                status="resolved",
+                context=letter.context,
+                attempt=letter.attempt,
+            )
+        )
+
+    def latest(self) -> dict[tuple[str, str], DeadLetter]:
+        letters: dict[tuple[str, str], DeadLetter] = {}
+        if not self.path.exists():
+            return letters
+        with self.lock:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    letter = DeadLetter(**json.loads(line))
+                    letters[(letter.kind, letter.key)] = letter
+        return letters
+
+    # まだ取り直せていないもの。max_attempts 回失敗したものは諦める
+    def pending(
+        self, kind: str | None = None, max_attempts: int | None = None
+    ) -> list[DeadLetter]:
+        return [
+            letter
+            for letter in self.latest().values()
+            if letter.status == "failed"
+            and (kind is None or letter.kind == kind)
+            and (max_attempts is None or letter.attempt < max_attempts)
+        ]
@@ -0,0 +1,121 @@
+import re
+import codecs
+import threading
+from collections import Counter
+from typing import Callable, Literal
+
+import requests
+from charset_normalizer import from_bytes
+
+DECODE_PATH = Literal[
+    "header",  # Content-Type の charset
+    "meta",  # <meta charset> / <meta http-equiv>
+    "detected",  # 先頭だけを統計的に推定
+    "fallback",  # どれも駄目だったので utf-8 で置換しながら読む
+]
+
+# meta タグは先頭にあるはずなので、ここまでしか探さない
+MAX_META_BYTES = 4096
+# 推定に使う先頭のバイト数。全体を見ると大きなページで遅い
+MAX_DETECT_BYTES = 64 * 1024
+
+CHARSET_IN_CONTENT_TYPE = re.compile(r"charset\s*=\s*[\"']?([^\s;\"']+)", re.I)
+META_CHARSET = re.compile(
+    rb"<meta[^>]+charset\s*=\s*[\"']?\s*([A-Za-z0-9_.:\-]+)", re.I
+)
+
+# Shift_JIS と宣言していても機種依存文字が入っていることが多い
+ENCODING_ALIASES = {
+    "shift_jis": "cp932",
+}
+
+
+# どのページをどの経路で decode したかを数える
+class EncodingStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts: Counter[DECODE_PATH] = Counter()
+
+    def record(self, path: DECODE_PATH):
+        with self.lock:
+            self.counts[path] += 1
+
+    def report(self) -> dict[str, int]:
+        with self.lock:
+            return dict(self.counts)
+
+    def __repr__(self) -> str:
+        return f"EncodingStats({self.report()})"
+
+
+# stats を渡さなかったときはここに数える
+encoding_stats = EncodingStats()
+
+
+def normalize_encoding(name: str | None) -> str | None:
+    if name is None:
+        return None
+    try:
+        name = codecs.lookup(name.strip()).name
+    except LookupError:
+        return None
+    return ENCODING_ALIASES.get(name, name)
+
+
+def header_encoding(content_type: str | None) -> str | None:
+    if content_type is None:
+        return None
+    match = CHARSET_IN_CONTENT_TYPE.search(content_type)
+    return normalize_encoding(match.group(1)) if match else None
+
+
+def meta_encoding(content: bytes) -> str | None:
+    match = META_CHARSET.search(content[:MAX_META_BYTES])
+    return normalize_encoding(match.group(1).decode("ascii")) if match else None
+
+
+def detect_encoding(content: bytes) -> str | None:
+    best = from_bytes(content[:MAX_DETECT_BYTES]).best()
+    return normalize_encoding(best.encoding) if best is not None else None
+
+
+def try_decode(content: bytes, encoding: str) -> str | None:
+    try:
+        return content.decode(encoding)
+    except (UnicodeDecodeError, LookupError):
+        return None
+
+
+# 宣言されている charset を信じて decode し、読めなかったときだけ推定する。
+# (文字列, 使った encoding) を返す
+def decode_html(
+    content: bytes,
+    content_type: str | None = None,
+    stats: EncodingStats | None = None,
+) -> tuple[str, str]:
+    stats = stats or encoding_stats
+
+    # 推定は前の 2 つで読めなかったときだけ行う
+    candidates: list[tuple[DECODE_PATH, Callable[[], str | None]]] = [
+        ("header", lambda: header_encoding(content_type)),
+        ("meta", lambda: meta_encoding(content)),
+        ("detected", lambda: detect_encoding(content)),
+    ]
+    for path, find_encoding in candidates:
+        encoding = find_encoding()
+        if encoding is None:
+            continue
+        text = try_decode(content, encoding)
+        if text is not None:
+            stats.record(path)
+            return text, encoding
+
+    stats.record("fallback")
+    return content.decode("utf-8", errors="replace"), "utf-8"
+
+
+# res.encoding = res.apparent_encoding の代わり。res.text も同じ encoding になる
+def decode_response(res: requests.Response, stats: EncodingStats | None = None) -> str:
+    text, encoding = decode_html(res.content, res.headers.get("Content-Type"), stats)
+    res.encoding = encoding
+    return text
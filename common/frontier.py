@@ -0,0 +1,262 @@
+import hashlib
+import math
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Iterable, Iterator, Literal
+
+URL_STATUS = Literal[
+    "pending",  # まだ取得していない
+    "claimed",  # どこかのワーカーが取得中
+    "done",  # 取得済み
+]
+
+
+class BloomFilter:
+    def __init__(self, capacity: int = 1_000_000, error_rate: float = 0.001):
+        self.num_bits = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, key: str):
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key: str) -> bool:
+        return all(
+            self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key)
+        )
+
+
+# SQLite に永続化される URL の既出集合 + 優先度付きの未取得キュー。
+# カーネルを再起動しても、複数プロセスから同じファイルを開いても重複しない。
+# URL ごとに data (JSON など) を持たせておくと、取り出すときに一緒に返す
+class Frontier:
+    def __init__(
+        self,
+        path: str | Path,
+        bloom: bool = False,
+        bloom_capacity: int = 1_000_000,
+    ):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+
+        self.path = str(path)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(
+            self.path,
+            timeout=60,
+            isolation_level=None,  # トランザクションは自前で管理する
+            check_same_thread=False,
+        )
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS urls (
+                url TEXT NOT NULL UNIQUE,
+                priority INTEGER NOT NULL DEFAULT 0,
+                status TEXT NOT NULL DEFAULT 'pending',
+                data TEXT,
+                added_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """)
+        # 列が足りない古いファイルは列を足して使う
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(urls)")}
+        if "priority" not in columns:
+            self.conn.execute(
+                "ALTER TABLE urls ADD COLUMN priority INTEGER NOT NULL DEFAULT 0"
+            )
+        if "data" not in columns:
+            self.conn.execute("ALTER TABLE urls ADD COLUMN data TEXT")
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS urls_queue ON urls (status, priority DESC)"
+        )
+
+        # Bloom filter はこのプロセスから見えている URL のみを持つ。
+        # 否定の結果だけを信用し、追加の判定は常に SQLite の UNIQUE 制約で行う
+        self.bloom: BloomFilter | None = None
+        if bloom:
+            self.bloom = BloomFilter(
+                capacity=max(bloom_capacity, len(self) * 2),
+            )
+            for (url,) in self.conn.execute("SELECT url FROM urls"):
+                self.bloom.add(url)
+
+    def __len__(self) -> int:
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM urls").fetchone()[0]
+
+    def __contains__(self, url: str) -> bool:
+        return self.seen(url)
+
+    def seen(self, url: str) -> bool:
+        if self.bloom is not None and url not in self.bloom:
+            return False
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT 1 FROM urls WHERE url = ?", (url,)
+            ).fetchone()
+        return row is not None
+
+    def is_done(self, url: str) -> bool:
+        return self.status(url) == "done"
+
+    def status(self, url: str) -> URL_STATUS | None:
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT status FROM urls WHERE url = ?", (url,)
+            ).fetchone()
+        return None if row is None else row[0]
+
+    def add(self, url: str, priority: int = 0) -> bool:
+        return len(self.add_many([url], priority=priority)) == 1
+
+    # 新しく追加された URL のみを入力順で返す
+    def add_many(self, urls: Iterable[str], priority: int = 0) -> list[str]:
+        return self.add_entries(((url, None) for url in urls), priority=priority)
+
+    # (URL, data) を追加する。既出の URL の data は書き換えない
+    def add_entries(
+        self, entries: Iterable[tuple[str, str | None]], priority: int = 0
+    ) -> list[str]:
+        added: list[str] = []
+        now = time.time()
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                for url, data in entries:
+                    cursor = self.conn.execute(
+                        "INSERT OR IGNORE INTO urls "
+                        "(url, priority, status, data, added_at, updated_at) "
+                        "VALUES (?, ?, 'pending', ?, ?, ?)",
+                        (url, priority, data, now, now),
+                    )
+                    if cursor.rowcount == 1:
+                        added.append(url)
+                    if self.bloom is not None:
+                        self.bloom.add(url)
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+        return added
+
+    # 優先度の高い順 (同じなら追加順) に未取得の URL を取り出して claimed にする
+    def pop(self, n: int = 1) -> list[str]:
+        return [url for url, _ in self.pop_entries(n)]
+
+    def pop_entries(self, n: int = 1) -> list[tuple[str, str | None]]:
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self.conn.execute(
+                    "SELECT rowid, url, data FROM urls WHERE status = 'pending' "
+                    "ORDER BY priority DESC, rowid LIMIT ?",
+                    (n,),
+                ).fetchall()
+                self.conn.executemany(
+                    "UPDATE urls SET status = 'claimed', updated_at = ? WHERE rowid = ?",
+                    [(time.time(), rowid) for rowid, _, _ in rows],
+                )
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+        return [(url, data) for _, url, data in rows]
+
+    def done(self, *urls: str):
+        self._set_status(urls, "done")
+
+    # 取得に失敗したものなどをキューに戻す
+    def release(self, *urls: str):
+        self._set_status(urls, "pending")
+
+    # 途中で落ちたプロセスが claimed のまま残したものを戻す
+    def recover(self):
+        with self.lock:
+            self.conn.execute(
+                "UPDATE urls SET status = 'pending', updated_at = ? WHERE status = 'claimed'",
+                (time.time(),),
+            )
+
+    def _set_status(self, urls: Iterable[str], status: URL_STATUS):
+        now = time.time()
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                for url in urls:
+                    # add_many を通さずに処理したものも既出として記録する
+                    self.conn.execute(
+                        "INSERT INTO urls (url, status, added_at, updated_at) "
+                        "VALUES (?, ?, ?, ?) "
+                        "ON CONFLICT (url) DO UPDATE SET status = excluded.status, "
+                        "updated_at = excluded.updated_at",
+                        (url, status, now, now),
+                    )
+                    if self.bloom is not None:
+                        self.bloom.add(url)
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    # 記録から消す。次に add されたときは新しい URL として扱う
+    def remove(self, *urls: str):
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.executemany(
+                    "DELETE FROM urls WHERE url = ?", [(url,) for url in urls]
+                )
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def pending_count(self) -> int:
+        with self.lock:
+            return self.conn.execute(
+                "SELECT COUNT(*) FROM urls WHERE status = 'pending'"
+            ).fetchone()[0]
+
+    # 追加順にすべての URL を返す
+    def urls(self, status: URL_STATUS | None = None) -> list[str]:
+        with self.lock:
+            if status is None:
+                rows = self.conn.execute("SELECT url FROM urls ORDER BY rowid")
+            else:
+                rows = self.conn.execute(
+                    "SELECT url FROM urls WHERE status = ? ORDER BY rowid", (status,)
+                )
+            return [url for (url,) in rows]
+
+    # 追加順に (URL, data) を返す。batch_size 件ずつ読むので、全部をメモリに載せない
+    def entries(
+        self, status: URL_STATUS | None = None, batch_size: int = 1000
+    ) -> Iterator[tuple[str, str | None]]:
+        last_rowid = 0
+        while True:
+            with self.lock:
+                rows = self.conn.execute(
+                    "SELECT rowid, url, data FROM urls "
+                    "WHERE rowid > ? AND (? IS NULL OR status = ?) "
+                    "ORDER BY rowid LIMIT ?",
+                    (last_rowid, status, status, batch_size),
+                ).fetchall()
+            if len(rows) == 0:
+                return
+            for _, url, data in rows:
+                yield url, data
+            last_rowid = rows[-1][0]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
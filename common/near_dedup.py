@@ -0,0 +1,460 @@
+import os
+import json
+import sqlite3
+import itertools
+from collections import defaultdict
+from concurrent.futures import Executor, ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterable, Iterator
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+from pydantic import BaseModel
+
+from .shard_writer import ShardWriter, iter_batches, load_manifest
+
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+MAX_HASH = np.uint64((1 << 32) - 1)
+
+# n-gram のハッシュに使う基数 (奇数ならなんでもよい)
+NGRAM_BASE = 0x9E3779B97F4A7C15
+# 長い文書で n-gram x 置換数 の行列が大きくなりすぎないように分けて計算する
+MINHASH_CHUNK_SIZE = 4096
+# 1 つのバンドのキーが大量の文書に共有されている (定型文など) ときに、候補として見る数
+MAX_CANDIDATES_PER_KEY = 8
+# SQLite の IN (...) に一度に渡す数
+MAX_SQL_VARIABLES = 500
+
+
+# 単語で区切れない日本語でも使えるように、文字 n-gram で MinHash をとる。
+# bands x rows = num_perm で、推定 Jaccard がおおよそ (1 / bands) ** (1 / rows) を
+# 超える組が候補になる。候補は threshold で確認してから同じクラスタにする
+class MinHashConfig(BaseModel):
+    ngram: int = 5
+    num_perm: int = 128
+    bands: int = 16
+    threshold: float = 0.7
+    seed: int = 42
+
+    @property
+    def rows(self) -> int:
+        return self.num_perm // self.bands
+
+
+class DedupStats(BaseModel):
+    num_docs: int = 0
+    num_dropped: int = 0
+    num_indexed: int = 0  # 前回までに索引に入っていたもの
+
+
+def mix64(h: np.ndarray) -> np.ndarray:
+    h = h ^ (h >> np.uint64(33))
+    h = h * np.uint64(0xFF51AFD7ED558CCD)
+    return h ^ (h >> np.uint64(33))
+
+
+def powers(base: int, n: int) -> np.ndarray:
+    return np.array(
+        [pow(base, i, 1 << 64) for i in range(n)], dtype=np.uint64
+    )  # uint64 の掛け算は 2^64 で折り返す
+
+
+def permutations(config: MinHashConfig) -> tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(config.seed)
+    a = rng.integers(1, 1 << 32, config.num_perm, dtype=np.uint64)
+    b = rng.integers(0, 1 << 32, config.num_perm, dtype=np.uint64)
+    return a, b
+
+
+# 文字 n-gram ごとの 32bit のハッシュ (重複なし)
+def ngram_hashes(text: str, n: int) -> np.ndarray:
+    codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    if len(codes) == 0:
+        return codes
+    n = min(n, len(codes))  # n 文字より短い文書は全体を 1 つの n-gram にする
+
+    windows = np.lib.stride_tricks.sliding_window_view(codes, n)
+    hashes = mix64((windows * powers(NGRAM_BASE, n)).sum(axis=1, dtype=np.uint64))
+    return np.unique(hashes & MAX_HASH)
+
+
+# hashes, a, b はどれも 32bit に収まるので、chunk * a + b は 2^64 - 2^32 を超えない
+# (uint64 で折り返さずに MERSENNE_PRIME で割れる)
+def minhash(hashes: np.ndarray, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    signature = np.full(len(a), MAX_HASH, dtype=np.uint64)
+    a, b = a & MAX_HASH, b & MAX_HASH
+    for start in range(0, len(hashes), MINHASH_CHUNK_SIZE):
+        chunk = hashes[start : start + MINHASH_CHUNK_SIZE, None] & MAX_HASH
+        values = ((chunk * a + b) % MERSENNE_PRIME) & MAX_HASH
+        signature = np.minimum(signature, values.min(axis=0))
+    return signature.astype(np.uint32)
+
+
+# 本文が空の文書は n-gram がなく、署名がすべて MAX_HASH になる
+def empty_signatures(signatures: np.ndarray) -> np.ndarray:
+    return (signatures == MAX_HASH).all(axis=1)
+
+
+# プロセスプールのワーカーで動く
+def compute_signatures(texts: list[str | None], config: MinHashConfig) -> np.ndarray:
+    a, b = permutations(config)
+    signatures = np.empty((len(texts), config.num_perm), dtype=np.uint32)
+    for i, text in enumerate(texts):
+        signatures[i] = minhash(ngram_hashes(text or "", config.ngram), a, b)
+    return signatures
+
+
+def parallel_signatures(
+    texts: list[str | None],
+    config: MinHashConfig,
+    executor: Executor | None = None,
+    chunk_size: int = 256,
+) -> np.ndarray:
+    if executor is None:
+        return compute_signatures(texts, config)
+    chunks = [texts[i : i + chunk_size] for i in range(0, len(texts), chunk_size)]
+    results = list(executor.map(compute_signatures, chunks, itertools.repeat(config)))
+    if len(results) == 0:
+        return np.empty((0, config.num_perm), dtype=np.uint32)
+    return np.concatenate(results)
+
+
+# バンドごとの署名をまとめて 1 つの整数のキーにする (バンドの番号も混ぜる)
+def band_keys(signatures: np.ndarray, config: MinHashConfig) -> np.ndarray:
+    rows = signatures[:, : config.bands * config.rows].astype(np.uint64)
+    rows = rows.reshape(len(signatures), config.bands, config.rows)
+    keys = (rows * powers(NGRAM_BASE, config.rows)).sum(axis=2, dtype=np.uint64)
+    keys = mix64(keys + np.arange(config.bands, dtype=np.uint64))
+    return keys.view(np.int64)  # SQLite の INTEGER は符号付き
+
+
+def batched(iterable: Iterable, batch_size: int) -> Iterator[list]:
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, batch_size)):
+        yield batch
+
+
+# 文書の署名と LSH のバンドを SQLite に持っておき、新しい文書をこれまでの全文書と比べる。
+# クラスタの番号はクラスタで最初に索引に入った文書の番号で、その文書だけを残す
+class NearDedupIndex:
+    def __init__(self, path: str | Path, config: MinHashConfig = MinHashConfig()):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+
+        self.config = config
+        self.conn = sqlite3.connect(str(path), timeout=60)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS docs (
+                id INTEGER PRIMARY KEY,
+                doc_id TEXT NOT NULL UNIQUE,
+                source TEXT,
+                cluster INTEGER NOT NULL,
+                signature BLOB NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS docs_cluster ON docs (cluster);
+            CREATE TABLE IF NOT EXISTS bands (
+                key INTEGER NOT NULL,
+                doc INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS bands_key ON bands (key, doc);
+            """)
+
+        # 設定が違う署名は比べられない
+        row = self.conn.execute(
+            "SELECT value FROM meta WHERE key = 'config'"
+        ).fetchone()
+        if row is None:
+            with self.conn:
+                self.conn.execute(
+                    "INSERT INTO meta VALUES ('config', ?)", (config.model_dump_json(),)
+                )
+        elif MinHashConfig(**json.loads(row[0])) != config:
+            raise ValueError(f"index {path} was built with {row[0]}, not {config}")
+
+    def close(self):
+        self.conn.close()
+
+    def _select_in(self, sql: str, values: list) -> list[tuple]:
+        rows = []
+        for chunk in batched(values, MAX_SQL_VARIABLES):
+            placeholders = ",".join("?" * len(chunk))
+            rows.extend(self.conn.execute(sql.format(placeholders), chunk))
+        return rows
+
+    # 索引に入っている文書の (番号, クラスタ)
+    def lookup(self, doc_ids: list[str]) -> dict[str, tuple[int, int]]:
+        rows = self._select_in(
+            "SELECT doc_id, id, cluster FROM docs WHERE doc_id IN ({})",
+            list(set(doc_ids)),
+        )
+        return {doc_id: (id, cluster) for doc_id, id, cluster in rows}
+
+    # 文書を索引に足して、各文書の (クラスタ, 残すか) を返す。
+    # すでに索引にある doc_id は足し直さずに今のクラスタを返す。
+    # 本文が空の文書は署名がすべて同じになるので、比べずにそれぞれ別のクラスタにする
+    def add_batch(
+        self,
+        doc_ids: list[str],
+        signatures: np.ndarray,
+        source: str | None = None,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        config = self.config
+        keys = band_keys(signatures, config)
+        empty = empty_signatures(signatures)
+        indexed = self.lookup(doc_ids)
+
+        # これまでの文書のうち、どれかのバンドが一致するもの
+        key_docs: dict[int, list[int]] = defaultdict(list)
+        for key, doc in self._select_in(
+            f"""
+            SELECT key, doc FROM (
+                SELECT key, doc, ROW_NUMBER() OVER (PARTITION BY key ORDER BY doc) AS n
+                FROM bands WHERE key IN ({{}})
+            ) WHERE n <= {MAX_CANDIDATES_PER_KEY}
+            """,
+            np.unique(keys[~empty]).tolist(),
+        ):
+            key_docs[key].append(doc)
+
+        candidates: dict[int, tuple[int, np.ndarray]] = {
+            id: (cluster, np.frombuffer(signature, dtype=np.uint32))
+            for id, cluster, signature in self._select_in(
+                "SELECT id, cluster, signature FROM docs WHERE id IN ({})",
+                list({doc for docs in key_docs.values() for doc in docs}),
+            )
+        }
+
+        # クラスタ同士がつながったときは大きい番号を小さい番号に寄せる
+        renamed: dict[int, int] = {}
+
+        def find(cluster: int) -> int:
+            while cluster in renamed:
+                cluster = renamed[cluster]
+            return cluster
+
+        (next_id,) = self.conn.execute(
+            "SELECT COALESCE(MAX(id), 0) + 1 FROM docs"
+        ).fetchone()
+
+        ids = np.empty(len(doc_ids), dtype=np.int64)
+        clusters = np.empty(len(doc_ids), dtype=np.int64)
+        new_docs: list[tuple] = []
+        new_bands: list[tuple[int, int]] = []
+        seen: dict[str, int] = {}
+
+        for i, doc_id in enumerate(doc_ids):
+            if doc_id in indexed:
+                ids[i], clusters[i] = indexed[doc_id]
+                continue
+            if doc_id in seen:  # 同じバッチに同じ文書が 2 回
+                ids[i], clusters[i] = ids[seen[doc_id]], clusters[seen[doc_id]]
+                continue
+            seen[doc_id] = i
+
+            id = next_id
+            next_id += 1
+            if empty[i]:
+                ids[i], clusters[i] = id, id
+                new_docs.append(
+                    (id, doc_id, source, id, signatures[i].astype(np.uint32).tobytes())
+                )
+                continue
+
+            matched = set()
+            for key in keys[i].tolist():
+                for doc in key_docs.get(key, []):
+                    if doc in matched:
+                        continue
+                    cluster, signature = candidates[doc]
+                    if np.mean(signature == signatures[i]) >= config.threshold:
+                        matched.add(doc)
+
+            cluster = id
+            if len(matched) > 0:
+                matched_clusters = {find(candidates[doc][0]) for doc in matched}
+                cluster = min(matched_clusters)
+                for other in matched_clusters - {cluster}:
+                    renamed[other] = cluster
+
+            ids[i], clusters[i] = id, cluster
+            new_docs.append(
+                (id, doc_id, source, cluster, signatures[i].astype(np.uint32).tobytes())
+            )
+            for key in keys[i].tolist():
+                new_bands.append((key, id))
+                # 同じバッチの後ろの文書からも候補として見えるようにする
+                if len(key_docs[key]) < MAX_CANDIDATES_PER_KEY:
+                    key_docs[key].append(id)
+            candidates[id] = (cluster, signatures[i])
+
+        clusters = np.array([find(cluster) for cluster in clusters], dtype=np.int64)
+
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO docs VALUES (?, ?, ?, ?, ?)",
+                [(*doc[:3], find(doc[3]), doc[4]) for doc in new_docs],
+            )
+            self.conn.executemany("INSERT INTO bands VALUES (?, ?)", new_bands)
+            # 索引にある文書のクラスタもつなぎ直す (大きい番号から順に)
+            for old in sorted(renamed, reverse=True):
+                self.conn.execute(
+                    "UPDATE docs SET cluster = ? WHERE cluster = ?", (find(old), old)
+                )
+
+        return clusters, clusters == ids
+
+    # 2 文書以上のクラスタ。最初の doc_id が残す文書
+    def duplicate_clusters(self, min_size: int = 2) -> Iterator[list[str]]:
+        cursor = self.conn.execute(
+            """
+            SELECT cluster, doc_id FROM docs
+            WHERE cluster IN (
+                SELECT cluster FROM docs GROUP BY cluster HAVING COUNT(*) >= ?
+            )
+            ORDER BY cluster, id
+            """,
+            (min_size,),
+        )
+        for _, rows in itertools.groupby(cursor, key=lambda row: row[0]):
+            yield [doc_id for _, doc_id in rows]
+
+    # ソースごとの文書数と、捨てる文書の数
+    def report(self) -> dict[str, DedupStats]:
+        return {
+            source: DedupStats(num_docs=num_docs, num_dropped=num_dropped)
+            for source, num_docs, num_dropped in self.conn.execute("""
+                SELECT source, COUNT(*), SUM(cluster != id) FROM docs GROUP BY source
+                """)
+        }
+
+
+def make_doc_ids(table: pa.Table, id_column: str, source: str | None) -> list[str]:
+    prefix = f"{source}:" if source is not None else ""
+    return [f"{prefix}{id}" for id in table[id_column].to_pylist()]
+
+
+# table に dup_cluster と keep の列を足す
+def dedup_table(
+    table: pa.Table | pa.RecordBatch,
+    index: NearDedupIndex,
+    text_column: str,
+    id_column: str,
+    source: str | None = None,
+    executor: Executor | None = None,
+) -> pa.Table:
+    if isinstance(table, pa.RecordBatch):
+        table = pa.Table.from_batches([table])
+
+    doc_ids = make_doc_ids(table, id_column, source)
+    signatures = parallel_signatures(
+        table[text_column].to_pylist(), index.config, executor
+    )
+    clusters, keep = index.add_batch(doc_ids, signatures, source)
+
+    return table.append_column("dup_cluster", pa.array(clusters)).append_column(
+        "keep", pa.array(keep)
+    )
+
+
+def iter_tables(
+    batches: Iterable[pa.RecordBatch], batch_size: int
+) -> Iterator[pa.Table]:
+    buffer: list[pa.RecordBatch] = []
+    num_rows = 0
+    for batch in batches:
+        buffer.append(batch)
+        num_rows += batch.num_rows
+        if num_rows >= batch_size:
+            yield pa.Table.from_batches(buffer)
+            buffer, num_rows = [], 0
+    if len(buffer) > 0:
+        yield pa.Table.from_batches(buffer)
+
+
+# 書いたあとでクラスタがつながると、先に書いたシャードの dup_cluster と keep は古くなる。
+# 索引の今のクラスタで書き直し、書き直したシャードの数を返す。
+# 別のソースを後から dedup してつながることもあるので、全ソースを終えてからもう一度呼ぶ
+def refresh_shards(
+    directory: str | Path,
+    index: NearDedupIndex,
+    id_column: str,
+    source: str | None = None,
+) -> int:
+    directory = Path(directory)
+    num_rewritten = 0
+    for shard in load_manifest(directory).shards:
+        path = directory / shard.file
+        with pa.OSFile(str(path)) as f:  # 同じファイルに書き戻すので map しない
+            table = pa.ipc.open_stream(f).read_all()
+
+        doc_ids = make_doc_ids(table, id_column, source)
+        indexed = index.lookup(doc_ids)
+        ids = pa.array([indexed[doc_id][0] for doc_id in doc_ids], pa.int64())
+        clusters = pa.array([indexed[doc_id][1] for doc_id in doc_ids], pa.int64())
+        if clusters.equals(table["dup_cluster"].combine_chunks()):
+            continue
+
+        keep = pc.equal(clusters, ids)
+        table = table.set_column(
+            table.schema.get_field_index("dup_cluster"), "dup_cluster", clusters
+        ).set_column(table.schema.get_field_index("keep"), "keep", keep)
+
+        # 行数も型も変わらないので、同じ名前のまま入れ替える
+        tmp_path = path.with_suffix(".arrow.tmp")
+        with pa.ipc.new_stream(str(tmp_path), table.schema) as writer:
+            writer.write_table(table)
+        os.replace(tmp_path, path)
+        num_rewritten += 1
+    return num_rewritten
+
+
+# input_dir のシャードを順に読んで、dup_cluster と keep を足したシャードを output_dir に書く。
+# 書き込み済みの行は飛ばすので、途中で止めても続きから再開できる。
+# 最後に refresh_shards で、途中でつながったクラスタを先に書いたシャードにも反映する
+def dedup_shards(
+    input_dir: str | Path,
+    output_dir: str | Path,
+    index: NearDedupIndex,
+    text_column: str,
+    id_column: str,
+    source: str | None = None,
+    batch_size: int = 10000,
+    num_workers: int | None = None,
+) -> DedupStats:
+    stats = DedupStats()
+
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        with ShardWriter(output_dir) as writer:
+            skip = writer.num_rows
+            for table in iter_tables(iter_batches(input_dir), batch_size):
+                if skip >= len(table):
+                    skip -= len(table)
+                    continue
+                table = table.slice(skip)
+                skip = 0
+
+                num_indexed = len(index.lookup(make_doc_ids(table, id_column, source)))
+                table = dedup_table(
+                    table, index, text_column, id_column, source, executor
+                )
+                writer.write_table(table)
+
+                stats.num_indexed += num_indexed
+
+    # 書き直したあとの keep で、前回までに書いた分も含めて数える
+    num_rewritten = refresh_shards(output_dir, index, id_column, source)
+    for batch in iter_batches(output_dir):
+        stats.num_docs += len(batch)
+        stats.num_dropped += len(batch) - (pc.sum(batch["keep"]).as_py() or 0)
+
+    print(
+        f"{stats.num_docs} docs, {stats.num_dropped} dropped "
+        f"({stats.num_indexed} already indexed, {num_rewritten} shards refreshed)"
+    )
+    return stats
@@ -0,0 +1,81 @@
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+
+class CachedResponse:
+    def __init__(
+        self, url: str, status_code: int, headers: dict[str, str], content: bytes
+    ):
+        self.url = url
+        self.status_code = status_code
+        self.headers = CaseInsensitiveDict(headers)
+        self.content = content
+
+
+# 取得したレスポンスを SQLite に圧縮して持っておく。
+# パーサーを直して取り直すときや、途中で止めて再開するときにサイトへ取りに行かずに済む
+class ResponseCache:
+    def __init__(self, path: str | Path):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(str(path), timeout=60, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                url TEXT PRIMARY KEY,
+                status_code INTEGER NOT NULL,
+                headers TEXT NOT NULL,
+                content BLOB NOT NULL,
+                fetched_at REAL NOT NULL
+            )
+            """)
+
+    def close(self):
+        self.conn.close()
+
+    def __contains__(self, url: str) -> bool:
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT 1 FROM responses WHERE url = ?", (url,)
+            ).fetchone()
+        return row is not None
+
+    # max_age 秒より古いものは無いものとして扱う (None なら古くても使う)
+    def get(self, url: str, max_age: float | None = None) -> CachedResponse | None:
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT status_code, headers, content, fetched_at FROM responses WHERE url = ?",
+                (url,),
+            ).fetchone()
+        if row is None:
+            return None
+
+        status_code, headers, content, fetched_at = row
+        if max_age is not None and time.time() - fetched_at > max_age:
+            return None
+        return CachedResponse(
+            url, status_code, json.loads(headers), zlib.decompress(content)
+        )
+
+    def put(self, res: requests.Response, url: str | None = None):
+        # 呼び出し側が指定した URL で覚える (リダイレクト後の URL ではなく)
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (
+                    url or res.url,
+                    res.status_code,
+                    json.dumps(dict(res.headers)),
+                    zlib.compress(res.content),
+                    time.time(),
+                ),
+            )
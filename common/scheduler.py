@@ -0,0 +1,248 @@
+import time
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Generic, Iterable, Iterator, TypeVar
+from urllib.parse import urlsplit
+
+import requests
+from pydantic import BaseModel
+
+R = TypeVar("R")
+
+# 時間をおけば成功しそうなステータス
+RETRY_STATUS_CODES = [429, 500, 502, 503, 504]
+
+
+class HostPolicy(BaseModel):
+    delay: float = 0.1  # 同じホストへのリクエスト間隔 (秒)
+    max_concurrency: int = 1  # 同じホストへの同時接続数
+    max_retries: int = 3
+    backoff: float = 2.0  # 最初のバックオフ (秒)。失敗が続くと倍になる
+    max_backoff: float = 120.0
+
+
+class FetchTask(BaseModel):
+    url: str
+    payload: Any = None
+    attempt: int = 0
+
+
+class FetchResult(BaseModel, Generic[R]):
+    task: FetchTask
+    result: R | None = None
+    error: str | None = None
+
+
+class HostStats(BaseModel):
+    requests: int = 0
+    retries: int = 0
+    failures: int = 0
+    bytes: int = 0
+    elapsed: float = 0.0  # 最初のリクエストから最後のレスポンスまで
+
+
+# 実行をまたいで持つホストごとの状態 (間隔・バックオフ・統計)
+class HostState:
+    def __init__(self, policy: HostPolicy):
+        self.policy = policy
+        self.next_request_at = 0.0
+        self.backoff = 0.0
+        self.backoff_until = 0.0
+        self.started_at: float | None = None
+        self.stats = HostStats()
+
+    def ready_at(self) -> float:
+        return max(self.next_request_at, self.backoff_until)
+
+
+# 1 回の run の中だけで使うホストごとのキュー。
+# run が途中で止められても、残ったタスクが次の run に持ち越されない
+class HostQueue:
+    def __init__(self, state: HostState):
+        self.state = state
+        self.tasks: deque[FetchTask] = deque()
+        self.in_flight = 0
+
+
+class Attempt:
+    def __init__(
+        self,
+        retry: bool,
+        result: Any = None,
+        error: str | None = None,
+        retry_after: float | None = None,
+        num_bytes: int = 0,
+    ):
+        self.retry = retry
+        self.result = result
+        self.error = error
+        self.retry_after = retry_after
+        self.num_bytes = num_bytes
+
+
+def get_host(url: str) -> str:
+    return urlsplit(url).netloc
+
+
+def parse_retry_after(res: requests.Response) -> float | None:
+    value = res.headers.get("Retry-After")
+    if value is None or not value.isdigit():
+        return None
+    return float(value)
+
+
+# ホストごとにキュー・間隔・同時接続数・バックオフを持ち、ホストをまたいで交互にリクエストする。
+# 全体の所要時間は各ホストの合計ではなく、一番遅いホストの時間に近づく
+class HostScheduler:
+    def __init__(
+        self,
+        default_policy: HostPolicy = HostPolicy(),
+        policies: dict[str, HostPolicy] | None = None,
+        max_workers: int = 16,
+        timeout: float = 60,
+    ):
+        self.default_policy = default_policy
+        self.policies = policies if policies is not None else {}
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.local = threading.local()
+        self.hosts: dict[str, HostState] = {}
+
+    def policy_for(self, host: str) -> HostPolicy:
+        return self.policies.get(host, self.default_policy)
+
+    def session(self) -> requests.Session:
+        if not hasattr(self.local, "session"):
+            self.local.session = requests.Session()
+        return self.local.session
+
+    def report(self) -> dict[str, HostStats]:
+        return {host: state.stats for host, state in self.hosts.items()}
+
+    def _attempt(
+        self,
+        task: FetchTask,
+        handle: Callable[[FetchTask, requests.Response], R],
+    ) -> Attempt:
+        try:
+            res = self.session().get(task.url, timeout=self.timeout)
+        except requests.RequestException as e:
+            return Attempt(retry=True, error=repr(e))
+
+        if res.status_code in RETRY_STATUS_CODES:
+            return Attempt(
+                retry=True,
+                error=f"{task.url} got {res.status_code}",
+                retry_after=parse_retry_after(res),
+                num_bytes=len(res.content),
+            )
+
+        # パースなどもワーカー側で済ませて、小さい結果だけを返す
+        try:
+            return Attempt(
+                retry=False, result=handle(task, res), num_bytes=len(res.content)
+            )
+        except Exception as e:
+            return Attempt(retry=False, error=repr(e), num_bytes=len(res.content))
+
+    def _dispatch(
+        self,
+        executor: ThreadPoolExecutor,
+        queues: dict[str, HostQueue],
+        running: dict[Future, tuple[HostQueue, FetchTask]],
+        handle: Callable[[FetchTask, requests.Response], R],
+    ) -> float | None:
+        now = time.monotonic()
+        wake_at: float | None = None
+
+        # 全ホストを順番に見るので、ホスト同士は並行して進む
+        for queue in queues.values():
+            state = queue.state
+            while queue.tasks and queue.in_flight < state.policy.max_concurrency:
+                ready_at = state.ready_at()
+                if ready_at > now:
+                    wake_at = ready_at if wake_at is None else min(wake_at, ready_at)
+                    break
+
+                task = queue.tasks.popleft()
+                queue.in_flight += 1
+                state.next_request_at = now + state.policy.delay
+                if state.started_at is None:
+                    state.started_at = now
+                state.stats.requests += 1
+
+                future = executor.submit(self._attempt, task, handle)
+                running[future] = (queue, task)
+
+        return wake_at
+
+    def _complete(
+        self, queue: HostQueue, task: FetchTask, attempt: Attempt
+    ) -> FetchResult | None:
+        now = time.monotonic()
+        state = queue.state
+        queue.in_flight -= 1
+        state.stats.bytes += attempt.num_bytes
+        if state.started_at is not None:
+            state.stats.elapsed = now - state.started_at
+
+        if not attempt.retry:
+            state.backoff = 0.0
+            if attempt.error is not None:
+                state.stats.failures += 1
+            return FetchResult(task=task, result=attempt.result, error=attempt.error)
+
+        # 失敗が続くほど長く待つ
+        policy = state.policy
+        state.backoff = min(
+            policy.max_backoff,
+            state.backoff * 2 if state.backoff > 0 else policy.backoff,
+        )
+        state.backoff_until = now + (attempt.retry_after or state.backoff)
+
+        task.attempt += 1
+        if task.attempt > policy.max_retries:
+            state.stats.failures += 1
+            return FetchResult(
+                task=task, error=f"Max retry exceeded: {task.url} ({attempt.error})"
+            )
+
+        state.stats.retries += 1
+        queue.tasks.appendleft(task)
+        return None
+
+    # 終わった順に結果を返す。handle はワーカースレッドで呼ばれる
+    def run(
+        self,
+        tasks: Iterable[FetchTask],
+        handle: Callable[[FetchTask, requests.Response], R],
+    ) -> Iterator[FetchResult[R]]:
+        queues: dict[str, HostQueue] = {}
+        for task in tasks:
+            host = get_host(task.url)
+            if host not in self.hosts:
+                self.hosts[host] = HostState(self.policy_for(host))
+            if host not in queues:
+                queues[host] = HostQueue(self.hosts[host])
+            queues[host].tasks.append(task)
+
+        running: dict[Future, tuple[HostQueue, FetchTask]] = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while running or any(queue.tasks for queue in queues.values()):
+                wake_at = self._dispatch(executor, queues, running, handle)
+                timeout = (
+                    None if wake_at is None else max(0.0, wake_at - time.monotonic())
+                )
+
+                if len(running) == 0:
+                    time.sleep(timeout or 0.0)
+                    continue
+
+                done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    queue, task = running.pop(future)
+                    result = self._complete(queue, task, future.result())
+                    if result is not None:
+                        yield result
@@ -0,0 +1,238 @@
+import os
+import json
+from pathlib import Path
+from typing import Callable, Iterable, Iterator
+
+import pyarrow as pa
+from pydantic import BaseModel
+
+from datasets import Dataset, concatenate_datasets
+
+MANIFEST_FILE_NAME = "manifest.json"
+
+
+class ShardInfo(BaseModel):
+    file: str
+    num_rows: int
+    num_bytes: int
+
+
+class Manifest(BaseModel):
+    shards: list[ShardInfo] = []
+
+    @property
+    def num_rows(self) -> int:
+        return sum(shard.num_rows for shard in self.shards)
+
+
+def load_manifest(directory: str | Path) -> Manifest:
+    path = Path(directory) / MANIFEST_FILE_NAME
+    if not path.exists():
+        return Manifest()
+    with open(path, "r", encoding="utf-8") as f:
+        return Manifest(**json.load(f))
+
+
+def save_manifest(directory: str | Path, manifest: Manifest):
+    path = Path(directory) / MANIFEST_FILE_NAME
+    tmp_path = path.with_suffix(".json.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest.model_dump(), f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)  # 書き込み途中で落ちても壊れないように
+
+
+# レコードを少しずつ Arrow ファイル (datasets と同じ stream 形式) のシャードに書き出す。
+# メモリに載るのは書き込み前のバッチ 1 つ分だけ。
+# manifest.json に載っているシャードだけが完成品で、途中のシャードは再開時に捨てられる。
+# on_commit はシャードが確定するたびに、確定済みの行数 (num_rows) を渡して呼ばれる
+class ShardWriter:
+    def __init__(
+        self,
+        directory: str | Path,
+        max_shard_bytes: int = 256 * 1024 * 1024,
+        batch_size: int = 1000,
+        schema: pa.Schema | None = None,
+        on_commit: Callable[[int], None] | None = None,
+    ):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        self.max_shard_bytes = max_shard_bytes
+        self.batch_size = batch_size
+        self.schema = schema
+        self.fixed_schema = schema is not None
+        self.on_commit = on_commit
+
+        self.manifest = load_manifest(self.directory)
+
+        # 既存のシャードに追記するときは、同じ schema で書き始める
+        if self.schema is None and len(self.manifest.shards) > 0:
+            last_shard = self.directory / self.manifest.shards[-1].file
+            with pa.memory_map(str(last_shard)) as source:
+                self.schema = pa.ipc.open_stream(source).schema
+
+        # 前回の書きかけは捨てる
+        for tmp_file in self.directory.glob("*.arrow.tmp"):
+            tmp_file.unlink()
+
+        self.buffer: list[dict] = []
+        self.stream: pa.RecordBatchStreamWriter | None = None
+        self.shard_rows = 0
+        self.shard_bytes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            # 例外のときは完成しているシャードだけを残す
+            self.abort()
+
+    # 完成済みのシャードに入っている行数
+    @property
+    def num_rows(self) -> int:
+        return self.manifest.num_rows
+
+    def _shard_path(self, index: int) -> Path:
+        return self.directory / f"shard-{index:05d}.arrow"
+
+    def _flush_buffer(self):
+        if len(self.buffer) == 0:
+            return
+
+        try:
+            table = pa.Table.from_pylist(self.buffer, schema=self.schema)
+        except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+            if self.fixed_schema or self.schema is None:
+                raise ValueError(
+                    f"record does not match the shard schema: {self.schema}"
+                ) from e
+
+            # 最初のバッチで全部 None だった列などは、型が決まった時点でシャードを切り替える。
+            # このとき確定するのは buffer より前のレコードだけなので、write は True を返さない
+            schema = pa.unify_schemas(
+                [self.schema, pa.Table.from_pylist(self.buffer).schema],
+                promote_options="permissive",
+            )
+            self._commit_shard()
+            self.schema = schema
+            table = pa.Table.from_pylist(self.buffer, schema=self.schema)
+        self.buffer = []
+
+        if self.schema is None:
+            self.schema = table.schema
+
+        for batch in table.to_batches():
+            self._write_batch(batch)
+
+    def _write_batch(self, batch: pa.RecordBatch):
+        if self.stream is None:
+            tmp_path = self._shard_path(len(self.manifest.shards)).with_suffix(
+                ".arrow.tmp"
+            )
+            self.stream = pa.ipc.new_stream(str(tmp_path), self.schema)
+
+        self.stream.write_batch(batch)
+        self.shard_rows += batch.num_rows
+        self.shard_bytes += batch.nbytes
+
+    def _commit_shard(self):
+        if self.stream is None:
+            return
+
+        self.stream.close()
+        self.stream = None
+
+        shard_path = self._shard_path(len(self.manifest.shards))
+        os.replace(shard_path.with_suffix(".arrow.tmp"), shard_path)
+
+        self.manifest.shards.append(
+            ShardInfo(
+                file=shard_path.name,
+                num_rows=self.shard_rows,
+                num_bytes=self.shard_bytes,
+            )
+        )
+        save_manifest(self.directory, self.manifest)
+
+        self.shard_rows = 0
+        self.shard_bytes = 0
+
+        if self.on_commit is not None:
+            self.on_commit(self.num_rows)
+
+    # シャードが確定したら True を返す (それまでに書いたレコードはすべて保存済み)。
+    # schema の切り替えで確定したシャードも知りたいときは on_commit を使う
+    def write(self, record: dict) -> bool:
+        self.buffer.append(record)
+        if len(self.buffer) < self.batch_size:
+            return False
+
+        self._flush_buffer()
+        if self.shard_bytes < self.max_shard_bytes:
+            return False
+
+        self._commit_shard()
+        return True
+
+    def write_many(self, records: Iterable[dict]) -> int:
+        committed = 0
+        for record in records:
+            committed += self.write(record)
+        return committed
+
+    # すでに Arrow の表になっているものは、レコードに戻さずにそのまま書く
+    def write_table(self, table: pa.Table) -> int:
+        self._flush_buffer()
+
+        if self.schema is None:
+            self.schema = table.schema
+        elif table.schema != self.schema:
+            table = table.cast(self.schema)
+
+        committed = 0
+        for batch in table.to_batches(max_chunksize=self.batch_size):
+            self._write_batch(batch)
+            if self.shard_bytes >= self.max_shard_bytes:
+                self._commit_shard()
+                committed += 1
+        return committed
+
+    def close(self):
+        self._flush_buffer()
+        self._commit_shard()
+
+    def abort(self):
+        self.buffer = []
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+        for tmp_file in self.directory.glob("*.arrow.tmp"):
+            tmp_file.unlink()
+        self.shard_rows = 0
+        self.shard_bytes = 0
+
+
+# シャードを memory map して結合するだけなので、データ量によらずすぐ終わる
+def load_shards(directory: str | Path) -> Dataset:
+    manifest = load_manifest(directory)
+    if len(manifest.shards) == 0:
+        raise FileNotFoundError(f"no completed shards in {directory}")
+
+    return concatenate_datasets(
+        [
+            Dataset.from_file(str(Path(directory) / shard.file))
+            for shard in manifest.shards
+        ]
+    )
+
+
+# シャードを 1 つずつ memory map して、書いたときの RecordBatch を順番に返す。
+# load_shards と違って全体を結合しないので、巨大なデータを順に舐めるとき用
+def iter_batches(directory: str | Path) -> Iterator[pa.RecordBatch]:
+    manifest = load_manifest(directory)
+    for shard in manifest.shards:
+        with pa.memory_map(str(Path(directory) / shard.file)) as source:
+            yield from pa.ipc.open_stream(source)
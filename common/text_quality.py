@@ -0,0 +1,211 @@
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+from pydantic import BaseModel
+
+from datasets import Dataset
+
+from .shard_writer import ShardWriter, iter_batches
+
+# 文字の種類ごとの正規表現 (RE2)。1 文字ずつ数える
+CHAR_CLASSES = {
+    "hiragana": r"\p{Hiragana}",
+    "katakana": r"[\p{Katakana}ー]",  # 長音符は Katakana に入っていない
+    "kanji": r"\p{Han}",
+    "ascii": r"[\x21-\x7e]",
+    "symbol": r"[\p{P}\p{S}]",
+}
+
+
+# min 以上 max 以下なら通る。値が null の行は通らない
+class Threshold(BaseModel):
+    min: float | None = None
+    max: float | None = None
+
+
+# 特徴量の列名 -> しきい値。すべてを満たした行だけを残す
+class QualityFilter(BaseModel):
+    thresholds: dict[str, Threshold] = {}
+
+    def mask(self, table: pa.Table) -> pa.ChunkedArray | pa.Array:
+        mask = pa.array(np.ones(len(table), dtype=bool))
+        for column, threshold in self.thresholds.items():
+            if threshold.min is not None:
+                mask = pc.and_(mask, pc.greater_equal(table[column], threshold.min))
+            if threshold.max is not None:
+                mask = pc.and_(mask, pc.less_equal(table[column], threshold.max))
+        return pc.fill_null(mask, False)
+
+
+def to_array(texts: pa.Array | pa.ChunkedArray) -> pa.Array:
+    if isinstance(texts, pa.ChunkedArray):
+        texts = texts.combine_chunks()
+    return texts.cast(pa.large_string())
+
+
+# 空行を除いた行のうち、同じ文書の中で 2 回目以降に出てきた行の割合
+def line_repetition_ratio(texts: pa.Array) -> pa.Array:
+    lines = pc.split_pattern_regex(texts, r"\r?\n")
+    flat = pc.utf8_trim_whitespace(pc.list_flatten(lines))
+    parents = pc.list_parent_indices(lines)
+
+    non_empty = pc.greater(pc.utf8_length(flat), 0)
+    flat = flat.filter(non_empty)
+    parents = parents.filter(non_empty)
+
+    counts = (
+        pa.table({"doc": parents, "line": flat})
+        .group_by(["doc", "line"])
+        .aggregate([([], "count_all")])
+    )
+    duplicated = pc.subtract(counts["count_all"], 1)
+    per_doc = (
+        pa.table(
+            {
+                "doc": counts["doc"],
+                "duplicated": duplicated,
+                "lines": counts["count_all"],
+            }
+        )
+        .group_by("doc")
+        .aggregate([("duplicated", "sum"), ("lines", "sum")])
+    )
+
+    ratio = pc.divide(
+        pc.cast(per_doc["duplicated_sum"], pa.float64()), per_doc["lines_sum"]
+    )
+    # 行のない文書は 0、null の文書は null
+    result = np.zeros(len(texts))
+    result[per_doc["doc"].to_numpy()] = ratio.to_numpy()
+    return pa.array(result, mask=pc.is_null(texts).to_numpy(zero_copy_only=False))
+
+
+# 文字列の列から品質の特徴量を計算する。正規表現も集計もすべて Arrow の中で行う
+def text_stats(texts: pa.Array | pa.ChunkedArray, prefix: str = "") -> pa.Table:
+    texts = to_array(texts)
+    length = pc.utf8_length(texts)
+    lines = pc.add(pc.count_substring(texts, "\n"), 1)
+
+    columns: dict[str, pa.Array] = {
+        "length": length,
+        "lines": lines,
+        "mean_line_length": pc.divide(pc.cast(length, pa.float64()), lines),
+    }
+    for name, pattern in CHAR_CLASSES.items():
+        count = pc.count_substring_regex(texts, pattern)
+        # 長さ 0 の文書の割合は 0 にする
+        columns[f"{name}_ratio"] = pc.if_else(
+            pc.equal(length, 0),
+            0.0,
+            pc.divide(pc.cast(count, pa.float64()), length),
+        )
+    columns["japanese_ratio"] = pc.add(
+        pc.add(columns["hiragana_ratio"], columns["katakana_ratio"]),
+        columns["kanji_ratio"],
+    )
+    columns["line_repetition_ratio"] = line_repetition_ratio(texts)
+
+    return pa.table({f"{prefix}{name}": array for name, array in columns.items()})
+
+
+# add_text_stats が column に足す列の名前 (アップロード前に取り除くとき用)
+def text_stat_columns(column: str) -> list[str]:
+    return text_stats(pa.array([""]), prefix=f"{column}_").column_names
+
+
+# table に column の特徴量を "{column}_length" などの列として足す
+def add_text_stats(table: pa.Table, column: str) -> pa.Table:
+    stats = text_stats(table[column], prefix=f"{column}_")
+    for name in stats.column_names:
+        table = table.append_column(name, stats[name])
+    return table
+
+
+# datasets の Dataset に特徴量の列を足す (Arrow の表のままバッチで渡す)
+def dataset_text_stats(
+    ds: Dataset,
+    columns: list[str],
+    batch_size: int = 10000,
+    num_proc: int | None = None,
+) -> Dataset:
+    def add_stats(table: pa.Table) -> pa.Table:
+        for column in columns:
+            table = add_text_stats(table, column)
+        return table
+
+    return (
+        ds.with_format("arrow")
+        .map(add_stats, batched=True, batch_size=batch_size, num_proc=num_proc)
+        .with_format(None)
+    )
+
+
+def filter_dataset(
+    ds: Dataset,
+    quality_filter: QualityFilter,
+    batch_size: int = 10000,
+    num_proc: int | None = None,
+) -> Dataset:
+    return (
+        ds.with_format("arrow")
+        .filter(
+            lambda table: quality_filter.mask(table),
+            batched=True,
+            batch_size=batch_size,
+            num_proc=num_proc,
+        )
+        .with_format(None)
+    )
+
+
+# input_dir のシャードに特徴量の列を足して output_dir に書く。
+# quality_filter を渡すと、通ったかどうかを "passed" 列に入れる。
+# Arrow の計算は GIL を離すので、バッチをスレッドで並列に処理する。
+# 書き込み済みの行は飛ばすので、途中で止めても続きから再開できる
+def text_stats_shards(
+    input_dir: str | Path,
+    output_dir: str | Path,
+    columns: list[str],
+    quality_filter: QualityFilter | None = None,
+    num_workers: int = 4,
+) -> int:
+    def process(batch: pa.RecordBatch) -> pa.Table:
+        table = pa.Table.from_batches([batch])
+        for column in columns:
+            table = add_text_stats(table, column)
+        if quality_filter is not None:
+            table = table.append_column("passed", quality_filter.mask(table))
+        return table
+
+    num_rows = 0
+    max_pending = num_workers * 2
+
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        with ShardWriter(output_dir) as writer:
+            pending: deque[Future[pa.Table]] = deque()
+
+            def write_next():
+                nonlocal num_rows
+                table = pending.popleft().result()
+                writer.write_table(table)
+                num_rows += len(table)
+
+            skip = writer.num_rows
+            for batch in iter_batches(input_dir):
+                if skip >= batch.num_rows:
+                    skip -= batch.num_rows
+                    continue
+                batch = batch.slice(skip)
+                skip = 0
+
+                pending.append(executor.submit(process, batch))
+                if len(pending) >= max_pending:
+                    write_next()
+            while pending:
+                write_next()
+
+    return num_rows
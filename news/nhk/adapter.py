@@ -0,0 +1,106 @@
+import threading
+
+from common.adapter import Listing, Page, Ref, SiteAdapter
+from common.content_hash import ContentIndex
+from common.scheduler import HostPolicy
+
+from archtag import (
+    BASE_URL,
+    MAX_PAGE,
+    ArchtagState,
+    compose_archtag_url,
+    is_known,
+    item_key,
+    newest_tag_state,
+)
+from article import duplicate_article, extract_article
+
+
+# タグごとに archtag の json を 1 ページ目から順にたどり (200 以外で終わり)、記事を抽出する。
+# state を渡すと前回見た記事に届いたところで止め、state を最新に更新する
+# (保存は collect が終わってから呼び出し側で行う)。
+# content_index を渡すと、別のタグの一覧から来た同じ記事など、本文が取得済みの記事と
+# 同じものは本文を持たず、最初の記事の URL だけを duplicate_of に持つ
+class NhkAdapter(SiteAdapter):
+    name = "nhk"
+    policy = HostPolicy(
+        delay=0.1,  # avoid 429
+        max_concurrency=4,
+    )
+
+    def __init__(
+        self,
+        tags: list[str],
+        max_page: int = MAX_PAGE,
+        state: ArchtagState | None = None,
+        store_html: bool = False,
+        content_index: ContentIndex | None = None,
+    ):
+        self.tags = list(dict.fromkeys(tags))  # 同じタグは 1 回だけ
+        self.max_page = max_page
+        self.state = state
+        # 一覧の判定には実行前の位置を使う (state は読みながら更新する)
+        self.previous = {} if state is None else dict(state.tags)
+        self.store_html = store_html
+        self.content_index = content_index
+        self.lock = threading.Lock()
+
+    def listings(self):
+        return [
+            Ref(url=compose_archtag_url(tag, 1), payload={"tag": tag, "page": 1})
+            for tag in self.tags
+        ]
+
+    def parse_listing(self, page: Page, ref: Ref) -> Listing:
+        tag, page_num = ref.payload["tag"], ref.payload["page"]
+        page_items = page.json()["channel"]["item"]
+
+        has_next = page_num < self.max_page
+        if self.state is not None:
+            tag_state = self.previous.get(tag)
+            if tag_state is not None:
+                new_items = [
+                    item for item in page_items if not is_known(item, tag_state)
+                ]
+                if len(new_items) < len(page_items):
+                    has_next = False  # ここから先は前回取得済み
+                page_items = new_items
+
+            with self.lock:
+                newest = newest_tag_state(page_items, self.state.tags.get(tag))
+                if newest is not None:
+                    self.state.tags[tag] = newest
+
+        # 同じ記事が複数のタグに載っているので link で重複除去する
+        items = [
+            Ref(url=BASE_URL + item["link"], key=item_key(item), payload=item)
+            for item in page_items
+        ]
+        listings = []
+        if has_next:
+            listings.append(
+                Ref(
+                    url=compose_archtag_url(tag, page_num + 1),
+                    payload={"tag": tag, "page": page_num + 1},
+                )
+            )
+        return Listing(items=items, listings=listings)
+
+    def parse_item(self, page: Page, ref: Ref) -> dict:
+        article = extract_article(
+            page.content, page.headers.get("Content-Type"), store_html=self.store_html
+        )
+        if self.content_index is None:
+            return {**ref.payload, **article}
+
+        if article["summary"] is not None or article["detail"] is not None:
+            duplicate_of = self.content_index.add_text(
+                f"{article['summary']}\n{article['detail']}", self.name, ref.url
+            )
+            if duplicate_of is not None:
+                return {**ref.payload, **duplicate_article(duplicate_of)}
+        return {**ref.payload, **article, "duplicate_of": None}
+
+    # html がまったく同じ記事 (collect に content_index を渡したとき)
+    def duplicate_record(self, ref: Ref, duplicate_of: str) -> dict:
+        return {**ref.payload, **duplicate_article(duplicate_of)}
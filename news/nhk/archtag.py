@@ -0,0 +1,67 @@
+import os
+import json
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+
+from pydantic import BaseModel
+
+BASE_URL = "https://www3.nhk.or.jp"
+
+# archtag は 1 タグあたり最大 49 ページ
+MAX_PAGE = 49
+
+
+def compose_archtag_url(tag: str, page: int) -> str:
+    return f"{BASE_URL}/news/archtag/{tag}_00{page:02d}.json"
+
+
+# タグごとに前回見た一番新しい記事
+class TagState(BaseModel):
+    newest_id: str
+    newest_pub_date: str  # e.g. "Mon, 04 Dec 2023 19:53:00 +0900"
+
+
+class ArchtagState(BaseModel):
+    tags: dict[str, TagState] = {}
+
+
+def load_state(path: str | Path) -> ArchtagState:
+    if not os.path.exists(path):
+        return ArchtagState()
+    with open(path, "r", encoding="utf-8") as f:
+        return ArchtagState(**json.load(f))
+
+
+def save_state(path: str | Path, state: ArchtagState):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state.model_dump(), f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def parse_pub_date(pub_date: str) -> datetime:
+    return parsedate_to_datetime(pub_date)
+
+
+# 前回より古い記事か。同じ時刻のものは frontier 側の重複除去に任せる
+def is_known(item: dict, tag_state: TagState) -> bool:
+    return item["id"] == tag_state.newest_id or parse_pub_date(
+        item["pubDate"]
+    ) < parse_pub_date(tag_state.newest_pub_date)
+
+
+def newest_tag_state(items: list[dict], previous: TagState | None) -> TagState | None:
+    candidates = [
+        TagState(newest_id=item["id"], newest_pub_date=item["pubDate"])
+        for item in items
+    ]
+    if previous is not None:
+        candidates.append(previous)
+    if len(candidates) == 0:
+        return None
+    return max(candidates, key=lambda state: parse_pub_date(state.newest_pub_date))
+
+
+def item_key(item: dict) -> str:
+    return item["link"]
@@ -0,0 +1,42 @@
+import gzip
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+from common.encoding import decode_html
+
+# 要約と本文の要素だけを木にする (ページ全体は組み立てない)
+ARTICLE_STRAINER = SoupStrainer(class_=["content--summary", "content--detail-more"])
+
+
+def extract_article(
+    content: bytes, content_type: str | None = None, store_html: bool = False
+) -> dict:
+    text, _ = decode_html(content, content_type)
+    soup = BeautifulSoup(text, "lxml", parse_only=ARTICLE_STRAINER)
+
+    summary_el = soup.select_one("p.content--summary")
+    if summary_el is not None:
+        summary = summary_el.get_text(strip=True)
+    else:
+        summary = None
+
+    detail = soup.select_one("div.content--detail-more")
+    if detail is not None:
+        detail = detail.get_text(strip=True)
+    else:
+        detail = None
+
+    article = {
+        "summary": summary,
+        "detail": detail,
+    }
+    if store_html:
+        # 生の html は必要なときだけ、圧縮して持つ
+        article["html_gzip"] = gzip.compress(content)
+
+    return article
+
+
+# 同じ内容の記事は本文を持たず、最初の記事の URL だけを持つ
+def duplicate_article(duplicate_of: str) -> dict:
+    return {"summary": None, "detail": None, "duplicate_of": duplicate_of}
@@ -0,0 +1,68 @@
+import shutil
+import subprocess
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+from typing import IO, Iterator
+
+# p7zip / 7-Zip のどれか 1 つがあればよい
+SEVEN_ZIP_COMMANDS = ["7z", "7za", "7zz"]
+
+
+def find_7z() -> str:
+    for command in SEVEN_ZIP_COMMANDS:
+        path = shutil.which(command)
+        if path is not None:
+            return path
+    raise Exception(
+        "7z command not found. Please install p7zip (e.g. `apt install p7zip-full`)"
+    )
+
+
+def list_members(archive_path: str | Path) -> list[str]:
+    res = subprocess.run(
+        [find_7z(), "l", "-slt", "-ba", str(archive_path)],
+        capture_output=True,
+        text=True,
+    )
+    if res.returncode != 0:
+        raise Exception(f"Failed to list {archive_path}: {res.stderr.strip()}")
+
+    return [
+        line.removeprefix("Path = ")
+        for line in res.stdout.splitlines()
+        if line.startswith("Path = ")
+    ]
+
+
+# アーカイブの 1 ファイルを展開せずに stdout から読む。ディスクに書くのは圧縮されたままの .7z だけ
+@contextmanager
+def open_member(archive_path: str | Path, member: str) -> Iterator[IO[bytes]]:
+    if member not in list_members(archive_path):
+        raise Exception(f"{member} not found in {archive_path}")
+
+    # stderr をパイプにすると、読まれないまま溜まったときに 7z が止まってしまうのでファイルに書かせる
+    with tempfile.TemporaryFile() as stderr:
+        process = subprocess.Popen(
+            [find_7z(), "e", "-so", str(archive_path), member],
+            stdout=subprocess.PIPE,
+            stderr=stderr,
+        )
+        assert process.stdout is not None
+
+        try:
+            yield process.stdout
+        finally:
+            # 途中で読むのをやめたときは 7z を止める
+            finished = process.poll() is not None or process.stdout.read(1) == b""
+            process.stdout.close()
+            if not finished:
+                process.terminate()
+            process.wait()
+
+        if finished and process.returncode != 0:
+            stderr.seek(0)
+            raise Exception(
+                f"Failed to extract {member} from {archive_path}: "
+                + stderr.read().decode(errors="replace").strip()
+            )
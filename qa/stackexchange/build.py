@@ -0,0 +1,279 @@
+import os
+import json
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Literal
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pydantic import BaseModel
+
+from posts import StackExchange
+from download import METADATA_URL, RemoteFile, download_archive, fetch_file_list
+from qa_table import build_qa_table, build_simple_table
+from incremental import build_post_tables
+from enrich import EnrichIndex, enrich_posts
+from sites import validate_sites
+
+REPORT_FILE_NAME = "report.json"
+
+SITE_STATUS = Literal[
+    "built",
+    "skipped",  # 同じダンプから出力済み
+    "failed",
+]
+
+
+class SiteResult(BaseModel):
+    domain: str
+    status: SITE_STATUS
+    num_rows: int = 0
+    num_converted: int = 0  # body を変換し直した post の数
+    dump_bytes: int = 0
+    elapsed: float = 0.0
+    attempts: int = 0
+    error: str | None = None
+
+
+class BuildReport(BaseModel):
+    sites: list[SiteResult] = []
+    elapsed: float = 0.0
+
+    def failed(self) -> list[SiteResult]:
+        return [site for site in self.sites if site.status == "failed"]
+
+    def summary(self):
+        built = [site for site in self.sites if site.status == "built"]
+        skipped = [site for site in self.sites if site.status == "skipped"]
+        print(
+            f"{len(built)} built, {len(skipped)} skipped, {len(self.failed())} failed "
+            f"({sum(site.num_rows for site in built)} rows, {self.elapsed:.0f}s)"
+        )
+        for site in sorted(self.sites, key=lambda site: -site.elapsed):
+            print(
+                f"  {site.domain}: {site.status} rows={site.num_rows} "
+                f"converted={site.num_converted} "
+                f"elapsed={site.elapsed:.0f}s attempts={site.attempts}"
+                + (f" error={site.error}" if site.error else "")
+            )
+
+
+# 出力を作ったときのダンプ。archive.org の md5 がわかるときは md5 で、
+# わからないときはローカルの .7z の大きさと mtime で比べる
+class DumpSignature(BaseModel):
+    size: int | None = None
+    md5: str | None = None
+    mtime: float | None = None
+
+    def matches(self, other: "DumpSignature") -> bool:
+        if self.md5 is not None and other.md5 is not None:
+            return self.md5 == other.md5
+        return self.size is not None and (self.size, self.mtime) == (
+            other.size,
+            other.mtime,
+        )
+
+
+def dump_signature(
+    domain: str, directory: str, files: dict[str, RemoteFile]
+) -> DumpSignature:
+    remote = files.get(f"{domain}.7z")
+    path = Path(directory) / f"{domain}.7z"
+    if remote is not None and remote.md5 is not None:
+        return DumpSignature(size=remote.size, md5=remote.md5)
+    if not path.exists():
+        return DumpSignature()
+    stat = path.stat()
+    return DumpSignature(size=stat.st_size, mtime=stat.st_mtime)
+
+
+def signature_path(output_dir: str | Path, domain: str) -> Path:
+    return Path(output_dir) / f"{domain}.source.json"
+
+
+def load_signature(output_dir: str | Path, domain: str) -> DumpSignature | None:
+    path = signature_path(output_dir, domain)
+    if not path.exists():
+        return None
+    return DumpSignature.model_validate_json(path.read_text(encoding="utf-8"))
+
+
+def save_signature(output_dir: str | Path, domain: str, signature: DumpSignature):
+    path = signature_path(output_dir, domain)
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.write_text(signature.model_dump_json(), encoding="utf-8")
+    os.replace(tmp_path, path)
+
+
+# 出力がそろっていて、前回と同じダンプから作ったものなら作り直さない
+def is_up_to_date(
+    output_dir: str | Path, domain: str, signature: DumpSignature
+) -> bool:
+    if not all(path.exists() for path in output_paths(output_dir, domain)):
+        return False
+    previous = load_signature(output_dir, domain)
+    return previous is not None and previous.matches(signature)
+
+
+def output_paths(output_dir: str | Path, domain: str) -> tuple[Path, Path]:
+    return (
+        Path(output_dir) / f"{domain}.parquet",
+        Path(output_dir) / f"{domain}_simple.parquet",
+    )
+
+
+def write_parquet(table: pa.Table, path: Path):
+    tmp_path = path.with_name(path.name + ".tmp")
+    pq.write_table(table, tmp_path)
+    os.replace(tmp_path, path)  # 書き込み途中のファイルは完成品として扱わない
+
+
+# 1 サイト分をダウンロードから出力まで行う。プロセスプールのワーカーで動く。
+# サイト同士を並列にするので、body の変換はこのプロセスの中で順番に行う
+def build_site(
+    domain: str,
+    directory: str,
+    output_dir: str,
+    files: dict[str, RemoteFile],
+) -> SiteResult:
+    start = time.time()
+
+    download = download_archive(domain, directory, "7z", files)
+    if download.error is not None:
+        raise Exception(download.error)
+
+    # 前回の出力があれば、変わっていない post の body は変換し直さない
+    site = StackExchange(directory=directory, site=domain, source="7z")
+    questions, answers, stats = build_post_tables(
+        site, Path(directory) / domain / "qa", num_workers=1
+    )
+
+    # 新しいダンプを取得していたら、Users / Votes / Comments は読み直される
+    index = EnrichIndex(Path(directory) / domain / "enrich.sqlite")
+    try:
+        index.load_site(site)
+        questions = enrich_posts(questions, index)
+        answers = enrich_posts(answers, index)
+    finally:
+        index.close()
+
+    full_path, simple_path = output_paths(output_dir, domain)
+    write_parquet(build_qa_table(questions, answers), full_path)
+    write_parquet(build_simple_table(questions, answers), simple_path)
+    # parquet を書き終えてから、どのダンプから作ったかを残す
+    save_signature(output_dir, domain, dump_signature(domain, directory, files))
+
+    return SiteResult(
+        domain=domain,
+        status="built",
+        num_rows=len(questions),
+        num_converted=sum(stat.num_converted for stat in stats.values()),
+        elapsed=time.time() - start,
+    )
+
+
+def dump_size(domain: str, directory: str, files: dict[str, RemoteFile]) -> int:
+    remote = files.get(f"{domain}.7z")
+    if remote is not None and remote.size is not None:
+        return remote.size
+    path = Path(directory) / f"{domain}.7z"
+    return path.stat().st_size if path.exists() else 0
+
+
+# 大きいサイトから順に、同時に処理しているダンプの合計が max_inflight_bytes を
+# 超えないように投入する (1 つで超えるサイトは単独で処理する)。
+# 失敗したサイトは最後にまとめて max_retries 回までやり直す。
+# ダンプが前回の出力のときと変わっていたら作り直す (変わっていない post の body は変換し直さない)
+def build_sites(
+    domains: list[str],
+    directory: str = "./",
+    output_dir: str = "./outputs",
+    max_workers: int = 4,
+    max_inflight_bytes: int = 2 * 1024 * 1024 * 1024,
+    max_retries: int = 2,
+    metadata_url: str | None = METADATA_URL,
+) -> BuildReport:
+    start = time.time()
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+
+    files = fetch_file_list(metadata_url) if metadata_url is not None else {}
+    validate_sites(domains, files if files else None)
+
+    results: dict[str, SiteResult] = {}
+    pending: list[tuple[str, int]] = []
+    for domain in domains:
+        size = dump_size(domain, directory, files)
+        if is_up_to_date(output_dir, domain, dump_signature(domain, directory, files)):
+            results[domain] = SiteResult(
+                domain=domain, status="skipped", dump_bytes=size
+            )
+        else:
+            pending.append((domain, size))
+    pending.sort(key=lambda item: -item[1])
+
+    attempts = {domain: 0 for domain, _ in pending}
+
+    for _ in range(max_retries + 1):
+        if len(pending) == 0:
+            break
+
+        failed: list[tuple[str, int]] = []
+        running: dict[Future, tuple[str, int]] = {}
+        inflight_bytes = 0
+
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            while pending or running:
+                # 入るものから入れる
+                for item in list(pending):
+                    domain, size = item
+                    if len(running) >= max_workers:
+                        break
+                    if running and inflight_bytes + size > max_inflight_bytes:
+                        continue
+                    pending.remove(item)
+                    attempts[domain] += 1
+                    try:
+                        future = executor.submit(
+                            build_site, domain, directory, output_dir, files
+                        )
+                    except BrokenProcessPool as e:
+                        # ワーカーが落ちた (メモリ不足など)。残りは次の回にやり直す
+                        failed.append(item)
+                        results[domain] = SiteResult(
+                            domain=domain, status="failed", error=repr(e)
+                        )
+                        continue
+                    inflight_bytes += size
+                    running[future] = item
+
+                if len(running) == 0:
+                    continue
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    domain, size = running.pop(future)
+                    inflight_bytes -= size
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        print(f"[WARNING] failed to build {domain}: {e!r}")
+                        failed.append((domain, size))
+                        result = SiteResult(
+                            domain=domain, status="failed", error=repr(e)
+                        )
+                    result.dump_bytes = size
+                    result.attempts = attempts[domain]
+                    results[domain] = result
+
+        pending = failed
+
+    report = BuildReport(
+        sites=[results[domain] for domain in domains], elapsed=time.time() - start
+    )
+    with open(Path(output_dir) / REPORT_FILE_NAME, "w", encoding="utf-8") as f:
+        json.dump(report.model_dump(), f, indent=2, ensure_ascii=False)
+
+    report.summary()
+    return report
@@ -0,0 +1,63 @@
+import os
+import itertools
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Iterable, Iterator, TypeVar
+
+from html2text import HTML2Text
+
+from posts import create_converter
+
+T = TypeVar("T")
+
+# ワーカープロセスごとに 1 つ持つ
+converter: HTML2Text | None = None
+
+
+def init_worker():
+    global converter
+    converter = create_converter()
+
+
+def convert_batch(htmls: list[str]) -> list[str]:
+    assert converter is not None
+    return [converter.handle(html).strip() for html in htmls]
+
+
+def batched(iterable: Iterable[T], batch_size: int) -> Iterator[list[T]]:
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, batch_size)):
+        yield batch
+
+
+# html をプロセスプールでまとめて markdown に変換し、入力と同じ順番で返す。
+# htmls は必要な分だけ読む
+def convert_htmls(
+    htmls: Iterable[str],
+    num_workers: int | None = None,
+    batch_size: int = 256,
+) -> Iterator[str]:
+    num_workers = num_workers or os.cpu_count() or 1
+
+    # 1 プロセスのときはプールを作らない (build.py のワーカーの中など)
+    if num_workers == 1:
+        h2t = create_converter()
+        for html in htmls:
+            yield h2t.handle(html).strip()
+        return
+
+    # 溜め込みすぎないように、同時に投げるバッチ数を制限する
+    max_pending = num_workers * 2
+
+    with ProcessPoolExecutor(
+        max_workers=num_workers, initializer=init_worker
+    ) as executor:
+        pending: deque[Future[list[str]]] = deque()
+
+        for batch in batched(htmls, batch_size):
+            pending.append(executor.submit(convert_batch, batch))
+            if len(pending) >= max_pending:
+                yield from pending.popleft().result()
+
+        while pending:
+            yield from pending.popleft().result()
@@ -0,0 +1,220 @@
+import os
+import time
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Literal
+
+import requests
+from pydantic import BaseModel
+
+ARCHIVE_BASE_URL = "https://archive.org/download/stackexchange"
+METADATA_URL = "https://archive.org/metadata/stackexchange"
+
+CHUNK_SIZE = 1024 * 1024  # 1 MiB
+
+# 4xx のうち、時間をおけば成功しそうなもの。それ以外の 4xx はやり直しても同じ
+RETRY_CLIENT_ERRORS = [408, 429]
+
+ARCHIVE_KIND = Literal[
+    "7z",  # {domain}.7z そのもの (md5 で検証できる)
+    "posts_xml",  # archive.org が展開して返す {domain}.7z/Posts.xml
+]
+
+
+class RemoteFile(BaseModel):
+    name: str
+    size: int | None = None
+    md5: str | None = None
+
+
+class DownloadResult(BaseModel):
+    domain: str
+    path: str | None = None
+    skipped: bool = False
+    error: str | None = None
+    elapsed: float = 0.0
+
+
+# archive.org のメタデータから、各ファイルのサイズと md5 を取得する
+def fetch_file_list(metadata_url: str = METADATA_URL) -> dict[str, RemoteFile]:
+    res = requests.get(metadata_url)
+    res.raise_for_status()
+
+    files: dict[str, RemoteFile] = {}
+    for file in res.json()["files"]:
+        files[file["name"]] = RemoteFile(
+            name=file["name"],
+            size=int(file["size"]) if "size" in file else None,
+            md5=file.get("md5"),
+        )
+    return files
+
+
+def convert_to_archive_link(
+    domain: str, kind: ARCHIVE_KIND = "7z", base_url: str = ARCHIVE_BASE_URL
+) -> str:
+    if domain == "stackoverflow.com":
+        raise Exception("currentry not supported")
+    if kind == "7z":
+        return f"{base_url}/{domain}.7z"
+    return f"{base_url}/{domain}.7z/Posts.xml"
+
+
+def archive_path(directory: str | Path, domain: str, kind: ARCHIVE_KIND) -> Path:
+    if kind == "7z":
+        return Path(directory) / f"{domain}.7z"
+    return Path(directory) / domain / "Posts.xml"
+
+
+def file_md5(path: Path) -> str:
+    md5 = hashlib.md5()
+    with open(path, "rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+def is_complete(path: Path, expected: RemoteFile | None) -> bool:
+    if not path.exists():
+        return False
+    if expected is None or expected.size is None:
+        return True  # 検証済みのものしか .part から改名しない
+    return path.stat().st_size == expected.size
+
+
+# Content-Range か Content-Length からファイル全体の大きさを得る
+def total_size(res: requests.Response, offset: int) -> int | None:
+    content_range = res.headers.get("Content-Range")
+    if content_range is not None and "/" in content_range:
+        total = content_range.split("/")[-1]
+        if total.isdigit():
+            return int(total)
+    content_length = res.headers.get("Content-Length")
+    if content_length is not None and content_length.isdigit():
+        return int(content_length) + (offset if res.status_code == 206 else 0)
+    return None
+
+
+# チャンクごとに .part に書き足していく。途中で切れたら Range で続きから取得する。
+# 足りないまま終わった .part は消さずに残すので、次の実行でも続きから取得できる
+def download_file(
+    url: str,
+    path: Path,
+    expected: RemoteFile | None = None,
+    session: requests.Session | None = None,
+    max_retry: int = 5,
+    timeout: float = 60,
+    retry_delay: float = 10,
+) -> Path:
+    session = session or requests.Session()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    part_path = path.with_name(path.name + ".part")
+
+    size = expected.size if expected is not None else None
+
+    for i in range(max_retry):
+        offset = part_path.stat().st_size if part_path.exists() else 0
+        if size is not None and offset >= size:
+            break
+
+        headers = {"Range": f"bytes={offset}-"} if offset > 0 else {}
+        try:
+            with session.get(url, headers=headers, stream=True, timeout=timeout) as res:
+                if res.status_code == 416:  # もう全部ある
+                    break
+                if (
+                    400 <= res.status_code < 500
+                    and res.status_code not in RETRY_CLIENT_ERRORS
+                ):
+                    raise Exception(f"{url} got {res.status_code}")
+                res.raise_for_status()
+
+                if offset > 0 and res.status_code != 206:
+                    offset = 0  # Range に対応していないので最初から
+                size = size or total_size(res, offset)
+
+                with open(part_path, "ab" if offset > 0 else "wb") as f:
+                    for chunk in res.iter_content(chunk_size=CHUNK_SIZE):
+                        f.write(chunk)
+
+            # 接続が閉じられただけだと例外にならないので、大きさで確かめる
+            if size is None or part_path.stat().st_size >= size:
+                break
+            print(f"Incomplete: {url} ({part_path.stat().st_size}/{size} bytes)")
+        except requests.RequestException as e:
+            print(e)
+        print(f"Retry {i+1}/{max_retry}")
+        time.sleep(retry_delay)
+    else:
+        raise Exception(f"Max retry exceeded: {url}")
+
+    # 大きさと md5 を確認してから本来の名前にする。
+    # 大きすぎるものと md5 が違うものは続きから取得しても直らないので捨てる
+    actual_size = part_path.stat().st_size
+    if size is not None and actual_size != size:
+        if actual_size > size:
+            part_path.unlink()
+        raise Exception(f"Size mismatch: {url} ({actual_size} != {size})")
+    if expected is not None and expected.md5 is not None:
+        actual_md5 = file_md5(part_path)
+        if actual_md5 != expected.md5:
+            part_path.unlink()
+            raise Exception(f"MD5 mismatch: {url} ({actual_md5} != {expected.md5})")
+
+    os.replace(part_path, path)
+    return path
+
+
+def download_archive(
+    domain: str,
+    directory: str | Path = "./",
+    kind: ARCHIVE_KIND = "7z",
+    files: dict[str, RemoteFile] = {},
+    base_url: str = ARCHIVE_BASE_URL,
+) -> DownloadResult:
+    start = time.time()
+    path = archive_path(directory, domain, kind)
+
+    # Posts.xml だけを取得するときは md5 がないので、大きさだけを確認する
+    expected = files.get(f"{domain}.7z") if kind == "7z" else None
+
+    try:
+        if is_complete(path, expected):
+            return DownloadResult(domain=domain, path=str(path), skipped=True)
+
+        print(f"Downloading {domain}...")
+        download_file(convert_to_archive_link(domain, kind, base_url), path, expected)
+        return DownloadResult(
+            domain=domain, path=str(path), elapsed=time.time() - start
+        )
+    except Exception as e:
+        return DownloadResult(domain=domain, error=repr(e), elapsed=time.time() - start)
+
+
+# 複数のサイトを並行してダウンロードする。失敗したサイトがあっても他は続ける
+def download_archives(
+    domains: list[str],
+    directory: str | Path = "./",
+    kind: ARCHIVE_KIND = "7z",
+    max_workers: int = 4,
+    base_url: str = ARCHIVE_BASE_URL,
+    metadata_url: str | None = METADATA_URL,
+) -> list[DownloadResult]:
+    # md5 があるのは .7z だけ
+    files = {}
+    if kind == "7z" and metadata_url is not None:
+        files = fetch_file_list(metadata_url)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(download_archive, domain, directory, kind, files, base_url)
+            for domain in domains
+        ]
+        results = [future.result() for future in futures]
+
+    for result in results:
+        if result.error is not None:
+            print(f"[WARNING] failed to download {result.domain}: {result.error}")
+
+    return results
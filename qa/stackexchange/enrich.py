@@ -0,0 +1,288 @@
+import sqlite3
+import itertools
+from pathlib import Path
+from typing import Iterable, Iterator
+from xml.etree.ElementTree import Element
+
+import pyarrow as pa
+
+from posts import StackExchange
+
+# Votes.xml の VoteTypeId
+UP_MOD = 2
+DOWN_MOD = 3
+
+# 1 回の IN (...) に渡す id の数 (SQLite の変数の上限より小さくする)
+LOOKUP_CHUNK_SIZE = 500
+
+COMMENT_TYPE = pa.struct(
+    [
+        pa.field("id", pa.string()),
+        pa.field("score", pa.int64()),
+        pa.field("text", pa.string()),
+        pa.field("user_id", pa.string()),
+    ]
+)
+
+
+def chunked(iterable: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(iterable)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+
+def placeholders(values: list) -> str:
+    return ", ".join("?" for _ in values)
+
+
+def source_signature(path: str | Path) -> tuple[float, int]:
+    stat = Path(path).stat()
+    return stat.st_mtime, stat.st_size
+
+
+# Users / Votes / Comments をディスク上の SQLite に流し込んで、post や user の id で引けるようにする。
+# どのテーブルも 1 行ずつ読むので、大きいサイトでもメモリに全体を載せない
+class EnrichIndex:
+    def __init__(self, path: str | Path):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+
+        self.path = str(path)
+        self.conn = sqlite3.connect(self.path, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=OFF")  # 壊れても作り直せばよい
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS users (
+                id TEXT PRIMARY KEY,
+                reputation INTEGER NOT NULL
+            ) WITHOUT ROWID
+            """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS votes (
+                post_id TEXT PRIMARY KEY,
+                up_votes INTEGER NOT NULL DEFAULT 0,
+                down_votes INTEGER NOT NULL DEFAULT 0
+            ) WITHOUT ROWID
+            """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS comments (
+                id TEXT PRIMARY KEY,
+                post_id TEXT NOT NULL,
+                score INTEGER NOT NULL,
+                text TEXT NOT NULL,
+                user_id TEXT
+            )
+            """)
+        # 読み込みが終わったテーブルと、そのとき読んだファイルの mtime と大きさ
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(loaded)")]
+        if columns and "source_mtime" not in columns:
+            self.conn.execute("DROP TABLE loaded")  # 古い形式。全部読み直す
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS loaded (
+                name TEXT PRIMARY KEY,
+                source_mtime REAL,
+                source_size INTEGER
+            )
+            """)
+
+    # source が読み込んだときから変わっていたら (新しいダンプを取得したら) 読み直す
+    def is_loaded(self, name: str, source: str | Path | None = None) -> bool:
+        row = self.conn.execute(
+            "SELECT source_mtime, source_size FROM loaded WHERE name = ?", (name,)
+        ).fetchone()
+        if row is None:
+            return False
+        return source is None or row == source_signature(source)
+
+    def _load(
+        self,
+        name: str,
+        rows: Iterable[Element],
+        sql: str,
+        to_params,
+        batch_size: int,
+        source: str | Path | None,
+    ):
+        if self.is_loaded(name, source):
+            return
+        signature = source_signature(source) if source else (None, None)
+
+        # 途中で落ちたときはやり直すので、1 つのトランザクションで入れる
+        self.conn.execute("BEGIN")
+        try:
+            self.conn.execute(f"DELETE FROM {name}")
+            for chunk in chunked(rows, batch_size):
+                self.conn.executemany(
+                    sql, [params for el in chunk if (params := to_params(el))]
+                )
+            self.conn.execute(
+                "INSERT OR REPLACE INTO loaded (name, source_mtime, source_size) "
+                "VALUES (?, ?, ?)",
+                (name, *signature),
+            )
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    def load_users(
+        self,
+        rows: Iterable[Element],
+        batch_size: int = 10000,
+        source: str | Path | None = None,
+    ):
+        self._load(
+            "users",
+            rows,
+            "INSERT OR REPLACE INTO users (id, reputation) VALUES (?, ?)",
+            lambda el: (el.attrib["Id"], int(el.attrib["Reputation"])),
+            batch_size,
+            source,
+        )
+
+    # 投票は 1 票ずつ持たず、post ごとの賛成・反対の数だけを持つ
+    def load_votes(
+        self,
+        rows: Iterable[Element],
+        batch_size: int = 10000,
+        source: str | Path | None = None,
+    ):
+        def to_params(el: Element):
+            vote_type = int(el.attrib["VoteTypeId"])
+            if vote_type not in (UP_MOD, DOWN_MOD) or "PostId" not in el.attrib:
+                return None
+            return (
+                el.attrib["PostId"],
+                int(vote_type == UP_MOD),
+                int(vote_type == DOWN_MOD),
+            )
+
+        self._load(
+            "votes",
+            rows,
+            "INSERT INTO votes (post_id, up_votes, down_votes) VALUES (?, ?, ?) "
+            "ON CONFLICT (post_id) DO UPDATE SET "
+            "up_votes = up_votes + excluded.up_votes, "
+            "down_votes = down_votes + excluded.down_votes",
+            to_params,
+            batch_size,
+            source,
+        )
+
+    def load_comments(
+        self,
+        rows: Iterable[Element],
+        batch_size: int = 10000,
+        source: str | Path | None = None,
+    ):
+        self._load(
+            "comments",
+            rows,
+            "INSERT OR REPLACE INTO comments (id, post_id, score, text, user_id) "
+            "VALUES (?, ?, ?, ?, ?)",
+            lambda el: (
+                el.attrib["Id"],
+                el.attrib["PostId"],
+                int(el.attrib.get("Score") or 0),
+                el.attrib.get("Text", ""),
+                el.attrib.get("UserId"),
+            ),
+            batch_size,
+            source,
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS comments_post ON comments (post_id, score DESC)"
+        )
+
+    # ダンプが前回読み込んだときと違えば、そのテーブルだけ読み直す
+    def load_site(self, site: StackExchange):
+        self.load_users(site.rows("Users"), source=site.table_path("Users"))
+        self.load_votes(site.rows("Votes"), source=site.table_path("Votes"))
+        self.load_comments(site.rows("Comments"), source=site.table_path("Comments"))
+
+    def reputations(self, user_ids: list[str | None]) -> list[int | None]:
+        found: dict[str, int] = {}
+        for chunk in chunked(
+            {id for id in user_ids if id is not None}, LOOKUP_CHUNK_SIZE
+        ):
+            found.update(
+                self.conn.execute(
+                    f"SELECT id, reputation FROM users WHERE id IN ({placeholders(chunk)})",
+                    chunk,
+                )
+            )
+        return [None if id is None else found.get(id) for id in user_ids]
+
+    def vote_counts(self, post_ids: list[str]) -> list[tuple[int, int]]:
+        found: dict[str, tuple[int, int]] = {}
+        for chunk in chunked(set(post_ids), LOOKUP_CHUNK_SIZE):
+            for post_id, up_votes, down_votes in self.conn.execute(
+                "SELECT post_id, up_votes, down_votes FROM votes "
+                f"WHERE post_id IN ({placeholders(chunk)})",
+                chunk,
+            ):
+                found[post_id] = (up_votes, down_votes)
+        return [found.get(id, (0, 0)) for id in post_ids]
+
+    # スコアの高い順 (同じなら古い順) に上位 n 件
+    def top_comments(self, post_ids: list[str], n: int = 3) -> list[list[dict]]:
+        found: dict[str, list[dict]] = {}
+        for chunk in chunked(set(post_ids), LOOKUP_CHUNK_SIZE):
+            rows = self.conn.execute(
+                "SELECT post_id, id, score, text, user_id FROM ("
+                "  SELECT *, ROW_NUMBER() OVER ("
+                "    PARTITION BY post_id ORDER BY score DESC, CAST(id AS INTEGER)"
+                "  ) AS rank FROM comments "
+                f"  WHERE post_id IN ({placeholders(chunk)})"
+                ") WHERE rank <= ? ORDER BY post_id, rank",
+                [*chunk, n],
+            )
+            for post_id, id, score, text, user_id in rows:
+                found.setdefault(post_id, []).append(
+                    {"id": id, "score": score, "text": text, "user_id": user_id}
+                )
+        return [found.get(id, []) for id in post_ids]
+
+    def close(self):
+        self.conn.close()
+
+
+ENRICH_FIELDS = [
+    pa.field("owner_reputation", pa.int64()),
+    pa.field("up_votes", pa.int64()),
+    pa.field("down_votes", pa.int64()),
+    pa.field("top_comments", pa.list_(COMMENT_TYPE)),
+]
+
+
+# batch の行について、足す列を Arrow の配列で返す (Python のリストはこの batch 分だけ)
+def enrich_batch(
+    batch: pa.RecordBatch, index: EnrichIndex, num_comments: int
+) -> list[pa.Array]:
+    post_ids = batch.column("id").to_pylist()
+    votes = index.vote_counts(post_ids)
+    values = [
+        index.reputations(batch.column("owner_user_id").to_pylist()),
+        [up for up, _ in votes],
+        [down for _, down in votes],
+        index.top_comments(post_ids, num_comments),
+    ]
+    return [pa.array(value, field.type) for value, field in zip(values, ENRICH_FIELDS)]
+
+
+# 質問や回答の表に owner_reputation, up_votes, down_votes, top_comments の列を足す。
+# 一度に引くのは batch_size 行分だけで、batch ごとに Arrow の配列にする
+def enrich_posts(
+    table: pa.Table,
+    index: EnrichIndex,
+    num_comments: int = 3,
+    batch_size: int = 10000,
+) -> pa.Table:
+    chunks: list[list[pa.Array]] = [[] for _ in ENRICH_FIELDS]
+
+    for batch in table.select(["id", "owner_user_id"]).to_batches(batch_size):
+        for column, array in zip(chunks, enrich_batch(batch, index, num_comments)):
+            column.append(array)
+
+    for field, column in zip(ENRICH_FIELDS, chunks):
+        table = table.append_column(field, pa.chunked_array(column, field.type))
+    return table
@@ -0,0 +1,125 @@
+import os
+import shutil
+import itertools
+from pathlib import Path
+from typing import Iterator
+
+import pyarrow as pa
+import pyarrow.compute as pc
+from pydantic import BaseModel
+
+from common.shard_writer import ShardWriter
+
+from posts import Question, Answer, StackExchange
+from convert import convert_htmls
+from qa_table import (
+    QUESTION_SCHEMA,
+    ANSWER_SCHEMA,
+    load_table,
+    lookup_index,
+    write_post_tables,
+)
+
+# この 3 つが前回と同じ post は、前回変換した body をそのまま使う
+VERSION_KEYS = ["id", "last_activity_date", "last_edit_date"]
+
+
+class IncrementalStats(BaseModel):
+    num_posts: int = 0
+    num_reused: int = 0
+    num_converted: int = 0
+
+
+def post_versions(table: pa.Table) -> pa.Table:
+    # null 同士は join で一致しないので空文字にしておく
+    return pa.table({key: pc.fill_null(table[key], "") for key in VERSION_KEYS})
+
+
+# new の各行について、同じ版の post が old にあればその行番号 (なければ null)
+def reuse_index(new: pa.Table, old: pa.Table) -> pa.ChunkedArray:
+    return lookup_index(
+        post_versions(new), post_versions(old), VERSION_KEYS, VERSION_KEYS
+    )
+
+
+# new の body のうち、index が null (前回の出力にない) ものだけを batch_size 行ずつ返す
+def changed_htmls(new: pa.Table, index: pa.Array, batch_size: int) -> Iterator[str]:
+    for start in range(0, len(new), batch_size):
+        changed = pc.is_null(index.slice(start, batch_size))
+        yield from new["body"].slice(start, batch_size).filter(changed).to_pylist()
+
+
+# body が html のままの new のうち、新しい post と変わった post だけを変換して directory に書き出す。
+# batch_size 行ずつ変換して書くので、Python の文字列として持つのは 1 batch 分だけ
+def convert_changed(
+    new: pa.Table,
+    old: pa.Table,
+    directory: str | Path,
+    num_workers: int | None = None,
+    batch_size: int = 10000,
+) -> IncrementalStats:
+    index = reuse_index(new, old).combine_chunks()
+    markdowns = convert_htmls(changed_htmls(new, index, batch_size), num_workers)
+    body_index = new.schema.get_field_index("body")
+
+    stats = IncrementalStats(num_posts=len(new))
+    try:
+        with ShardWriter(directory, schema=new.schema) as writer:
+            for start in range(0, len(new), batch_size):
+                batch = new.slice(start, batch_size)
+                batch_index = index.slice(start, batch_size)
+                changed = pc.is_null(batch_index)
+
+                num_changed = pc.sum(changed).as_py() or 0
+                converted = pa.array(
+                    list(itertools.islice(markdowns, num_changed)), pa.string()
+                )
+                bodies = old["body"].take(batch_index).combine_chunks()
+                bodies = pc.replace_with_mask(bodies, changed, converted)
+
+                writer.write_table(batch.set_column(body_index, "body", bodies))
+                stats.num_converted += num_changed
+    finally:
+        markdowns.close()  # プロセスプールを閉じる
+
+    stats.num_reused = stats.num_posts - stats.num_converted
+    return stats
+
+
+# {qa_dir}/questions, {qa_dir}/answers を新しいダンプで作り直す。
+# 前回の出力があれば、変わっていない post の body はそこから持ってくる
+def build_post_tables(
+    site: StackExchange, qa_dir: str | Path, num_workers: int | None = None
+) -> tuple[pa.Table, pa.Table, dict[str, IncrementalStats]]:
+    qa_dir = Path(qa_dir)
+    raw_dir = qa_dir.with_name(qa_dir.name + ".raw")
+    new_dir = qa_dir.with_name(qa_dir.name + ".new")
+    shutil.rmtree(raw_dir, ignore_errors=True)
+    shutil.rmtree(new_dir, ignore_errors=True)
+
+    # まず html のままの表を作る (パースだけなので速い)
+    posts = (post for post in site.posts() if isinstance(post, (Question, Answer)))
+    raw_questions, raw_answers = write_post_tables(posts, raw_dir)
+
+    stats: dict[str, IncrementalStats] = {}
+    for name, raw, schema in [
+        ("questions", raw_questions, QUESTION_SCHEMA),
+        ("answers", raw_answers, ANSWER_SCHEMA),
+    ]:
+        old = load_table(qa_dir / name, schema)
+        stats[name] = convert_changed(raw, old, new_dir / name, num_workers)
+        print(
+            f"{site.site} {name}: {stats[name].num_converted} converted, "
+            f"{stats[name].num_reused} reused"
+        )
+
+    # 全部書き終わってから入れ替える
+    shutil.rmtree(qa_dir, ignore_errors=True)
+    os.replace(new_dir, qa_dir)
+    shutil.rmtree(raw_dir, ignore_errors=True)
+
+    return (
+        load_table(qa_dir / "questions", QUESTION_SCHEMA),
+        load_table(qa_dir / "answers", ANSWER_SCHEMA),
+        stats,
+    )
@@ -0,0 +1,190 @@
+from typing import IO, Iterator, Literal
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from xml.etree.ElementTree import Element
+
+from pydantic import BaseModel
+
+from html2text import HTML2Text
+
+from archive import open_member
+
+
+def create_converter() -> HTML2Text:
+    converter = HTML2Text()
+    converter.mark_code = True
+    return converter
+
+
+POST_TYPE = Literal[
+    "question",
+    "answer",
+    "wiki",
+    "tag_wiki_excerpt",
+    "tag_wiki",
+    "moderator_nomination",
+    "wiki_placeholder",
+]
+
+POST_TYPE_MAP: dict[int, POST_TYPE] = {
+    1: "question",
+    2: "answer",
+    # 3: "Wiki",
+    4: "tag_wiki_excerpt",
+    5: "tag_wiki",
+    6: "moderator_nomination",
+    7: "wiki_placeholder",
+}
+
+
+class Post(BaseModel):
+    id: str
+    post_type: POST_TYPE
+    creation_date: str
+    last_edit_date: str | None
+    last_activity_date: str
+    owner_user_id: str | None
+    last_editor_user_id: str | None
+
+    score: int
+    comment_count: int
+    content_license: str
+    body: str
+
+
+class Question(Post):
+    title: str
+    accepted_answer_id: str | None
+    answer_count: int
+    view_count: int
+    tags: list[str]
+    favorite_count: int
+
+
+class Answer(Post):
+    parent_id: str
+
+
+class TagWikiExcerpt(Post):
+    pass
+
+
+class TagWiki(Post):
+    pass
+
+
+# body は html のまま持つ (あとで convert.py でまとめて変換する)
+def parse_common(el: Element) -> Post:
+    id = el.attrib["Id"]
+    post_type = POST_TYPE_MAP[int(el.attrib["PostTypeId"])]
+    creation_date = el.attrib["CreationDate"]
+    last_edit_date = el.attrib.get("LastEditDate")
+    last_activity_date = el.attrib["LastActivityDate"]
+    owner_user_id = el.attrib.get("OwnerUserId")
+    last_editor_user_id = el.attrib.get("LastEditorUserId")
+    score = int(el.attrib["Score"])
+    comment_count = int(el.attrib["CommentCount"])
+    content_license = el.attrib["ContentLicense"]
+    body = el.attrib["Body"]
+
+    return Post(
+        id=id,
+        post_type=post_type,
+        creation_date=creation_date,
+        last_edit_date=last_edit_date,
+        last_activity_date=last_activity_date,
+        owner_user_id=owner_user_id,
+        last_editor_user_id=last_editor_user_id,
+        score=score,
+        comment_count=comment_count,
+        content_license=content_license,
+        body=body,
+    )
+
+
+def parse_question(el: Element) -> Question:
+    common = parse_common(el)
+    title = el.attrib["Title"]
+    accepted_answer_id = el.attrib.get("AcceptedAnswerId")
+    answer_count = int(el.attrib["AnswerCount"])
+    view_count = int(el.attrib["ViewCount"])
+    tags = el.attrib["Tags"].strip("<>").split("><")
+    favorite_count = int(el.attrib.get("FavoriteCount") or 0)
+
+    return Question(
+        **common.model_dump(),
+        title=title,
+        accepted_answer_id=accepted_answer_id,
+        answer_count=answer_count,
+        view_count=view_count,
+        tags=tags,
+        favorite_count=favorite_count,
+    )
+
+
+def parse_answer(el: Element) -> Answer:
+    common = parse_common(el)
+    parent_id = el.attrib["ParentId"]
+
+    return Answer(
+        **common.model_dump(),
+        parent_id=parent_id,
+    )
+
+
+def parse_post(el: Element) -> Post | None:
+    post_type_id = int(el.attrib["PostTypeId"])
+
+    post_type = POST_TYPE_MAP[post_type_id]
+
+    if post_type == "question":
+        return parse_question(el)
+    elif post_type == "answer":
+        return parse_answer(el)
+    elif post_type == "tag_wiki":
+        return TagWiki(**parse_common(el).model_dump())
+    elif post_type == "tag_wiki_excerpt":
+        return TagWikiExcerpt(**parse_common(el).model_dump())
+    else:
+        return None
+
+
+# <row> を 1 つずつ返す。返し終わった要素は root から消すので、ファイルの大きさによらずメモリは一定
+def iter_rows(source: str | IO[bytes], root_tag: str) -> Iterator[Element]:
+    context = ET.iterparse(source, events=("start", "end"))
+
+    _, root = next(context)
+    if root.tag != root_tag:
+        raise Exception(f"Invalid xml: {source}")
+
+    for event, el in context:
+        if event == "end" and el.tag == "row":
+            yield el
+            root.clear()
+
+
+# source="7z" のときは {directory}/{site}.7z から直接読む (展開した xml は置かない)
+class StackExchange(BaseModel):
+    directory: str = "./"
+    site: str
+    source: Literal["xml", "7z"] = "xml"
+
+    # table を読み出すファイル。7z のときはどの table も同じ .7z になる
+    def table_path(self, table: str) -> Path:
+        if self.source == "7z":
+            return Path(self.directory) / f"{self.site}.7z"
+        return Path(self.directory) / self.site / f"{table}.xml"
+
+    # table は "Posts", "Comments", "Users" など
+    def rows(self, table: str) -> Iterator[Element]:
+        if self.source == "7z":
+            with open_member(self.table_path(table), f"{table}.xml") as file:
+                yield from iter_rows(file, table.lower())
+        else:
+            yield from iter_rows(str(self.table_path(table)), table.lower())
+
+    def posts(self) -> Iterator[Post]:
+        for el in self.rows("Posts"):
+            post = parse_post(el)
+            if post:
+                yield post
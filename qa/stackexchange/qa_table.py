@@ -0,0 +1,178 @@
+from pathlib import Path
+from typing import Iterable
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from common.shard_writer import ShardWriter, load_manifest, load_shards
+
+from posts import Post, Question, Answer
+
+POST_FIELDS = [
+    pa.field("id", pa.string()),
+    pa.field("post_type", pa.string()),
+    pa.field("creation_date", pa.string()),
+    pa.field("last_edit_date", pa.string()),
+    pa.field("last_activity_date", pa.string()),
+    pa.field("owner_user_id", pa.string()),
+    pa.field("last_editor_user_id", pa.string()),
+    pa.field("score", pa.int64()),
+    pa.field("comment_count", pa.int64()),
+    pa.field("content_license", pa.string()),
+    pa.field("body", pa.string()),
+]
+
+QUESTION_SCHEMA = pa.schema(
+    POST_FIELDS
+    + [
+        pa.field("title", pa.string()),
+        pa.field("accepted_answer_id", pa.string()),
+        pa.field("answer_count", pa.int64()),
+        pa.field("view_count", pa.int64()),
+        pa.field("tags", pa.list_(pa.string())),
+        pa.field("favorite_count", pa.int64()),
+    ]
+)
+
+ANSWER_SCHEMA = pa.schema(POST_FIELDS + [pa.field("parent_id", pa.string())])
+
+
+def load_table(directory: str | Path, schema: pa.Schema) -> pa.Table:
+    if len(load_manifest(directory).shards) == 0:
+        return schema.empty_table()
+    return load_shards(directory).data.table
+
+
+# 質問と回答を別々の表としてシャードに書き出す (posts は 1 回だけ読む)
+def write_post_tables(
+    posts: Iterable[Post], directory: str | Path
+) -> tuple[pa.Table, pa.Table]:
+    questions_dir = Path(directory) / "questions"
+    answers_dir = Path(directory) / "answers"
+
+    with ShardWriter(questions_dir, schema=QUESTION_SCHEMA) as questions, ShardWriter(
+        answers_dir, schema=ANSWER_SCHEMA
+    ) as answers:
+        for post in posts:
+            if isinstance(post, Question):
+                questions.write(post.model_dump())
+            elif isinstance(post, Answer):
+                answers.write(post.model_dump())
+
+    return load_table(questions_dir, QUESTION_SCHEMA), load_table(
+        answers_dir, ANSWER_SCHEMA
+    )
+
+
+def with_index(table: pa.Table, name: str) -> pa.Table:
+    return table.append_column(name, pa.array(np.arange(len(table), dtype=np.int64)))
+
+
+# left の各行について、keys が一致する right の行番号を返す (見つからなければ null)
+def lookup_index(
+    left: pa.Table, right: pa.Table, left_keys: list[str], right_keys: list[str]
+) -> pa.ChunkedArray:
+    left = with_index(left.select(left_keys), "left_index")
+    right = with_index(right.select(right_keys), "right_index")
+
+    joined = left.join(right, left_keys, right_keys, join_type="left outer")
+    return joined.sort_by("left_index")["right_index"]
+
+
+def accepted_answer_index(questions: pa.Table, answers: pa.Table) -> pa.ChunkedArray:
+    return lookup_index(
+        questions, answers, ["accepted_answer_id", "id"], ["id", "parent_id"]
+    )
+
+
+# 一番スコアの高い回答。同点なら id が一番小さい (古い) もの
+def popular_answer_index(questions: pa.Table, answers: pa.Table) -> pa.ChunkedArray:
+    scores = with_index(answers.select(["parent_id", "score"]), "answer_index")
+    scores = scores.append_column("id_number", pc.cast(answers["id"], pa.int64()))
+
+    max_scores = scores.group_by("parent_id").aggregate([("score", "max")])
+    top = scores.join(max_scores, "parent_id").filter(
+        pc.field("score") == pc.field("score_max")
+    )
+    top = top.sort_by([("parent_id", "ascending"), ("id_number", "ascending")])
+    popular = top.group_by("parent_id", use_threads=False).aggregate(
+        [("answer_index", "first")]
+    )
+
+    left = with_index(questions.select(["id"]), "question_index")
+    joined = left.join(popular, "id", "parent_id", join_type="left outer")
+    return joined.sort_by("question_index")["answer_index_first"]
+
+
+def take_answers(answers: pa.Table, index: pa.ChunkedArray) -> pa.Table:
+    return answers.take(index.combine_chunks())
+
+
+# 質問ごとに回答をリストにまとめる。回答の順番は元のファイルの順番
+def group_answers(questions: pa.Table, answers: pa.Table) -> pa.ListArray:
+    question_index = lookup_index(answers, questions, ["parent_id"], ["id"])
+    answer_rows = with_index(answers, "answer_index").append_column(
+        "question_index", question_index
+    )
+
+    # 質問が見つからない回答は捨てる
+    answer_rows = answer_rows.filter(pc.is_valid(answer_rows["question_index"]))
+    answer_rows = answer_rows.sort_by(
+        [("question_index", "ascending"), ("answer_index", "ascending")]
+    )
+
+    counts = np.bincount(
+        answer_rows["question_index"].to_numpy(), minlength=len(questions)
+    )
+    offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int32)
+
+    values = pa.StructArray.from_arrays(
+        [answer_rows[name].combine_chunks() for name in answers.column_names],
+        fields=list(answers.schema),
+    )
+    return pa.ListArray.from_arrays(pa.array(offsets), values)
+
+
+def to_struct(table: pa.Table) -> pa.StructArray:
+    return pa.StructArray.from_arrays(
+        [column.combine_chunks() for column in table.columns],
+        fields=list(table.schema),
+    )
+
+
+# format_row を通したあとの ds と同じ列
+def build_qa_table(questions: pa.Table, answers: pa.Table) -> pa.Table:
+    popular = take_answers(answers, popular_answer_index(questions, answers))
+
+    return pa.table(
+        {
+            "question": to_struct(questions),
+            "answers": group_answers(questions, answers),
+            "id": questions["id"],
+            "accepted_answer_id": questions["accepted_answer_id"],
+            "popular_answer_id": popular["id"],
+        }
+    )
+
+
+# simplify_ds と同じ列
+def build_simple_table(questions: pa.Table, answers: pa.Table) -> pa.Table:
+    accepted = take_answers(answers, accepted_answer_index(questions, answers))
+    popular = take_answers(answers, popular_answer_index(questions, answers))
+
+    return pa.table(
+        {
+            "id": questions["id"],
+            "accepted_answer_id": questions["accepted_answer_id"],
+            "popular_answer_id": popular["id"],
+            "title": questions["title"],
+            "question_body": questions["body"],
+            "question_score": questions["score"],
+            "accepted_answer_body": accepted["body"],
+            "accepted_answer_score": accepted["score"],
+            "popular_answer_body": popular["body"],
+            "popular_answer_score": popular["score"],
+            "tags": questions["tags"],
+        }
+    )
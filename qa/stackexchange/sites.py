@@ -0,0 +1,239 @@
+import re
+import difflib
+
+from download import RemoteFile
+
+ALL_STACKOVERFLOW = [
+    f"{lang}.stackoverflow.com"
+    for lang in [
+        "es",
+        "ja",
+        "pt",
+        "ru",
+    ]
+]
+
+ALL_SPECIAL_SITES = [
+    "askubuntu.com",
+    "mathoverflow.net",
+    "serverfault.com",
+    "stackapps.com",
+    "superuser.com",
+]
+
+ALL_STACKEXCHANGE = [
+    f"{name}.stackexchange.com"
+    for name in [
+        "3dprinting",
+        "academia",
+        "ai",
+        "android",
+        "anime",
+        "apple",
+        "arduino",
+        "astronomy",
+        "aviation",
+        "avp",
+        "beer",
+        "bicycles",
+        "bioacoustics",
+        "bioinformatics",
+        "biology",
+        "bitcoin",
+        "blender",
+        "boardgames",
+        "bricks",
+        "buddhism",
+        "cardano",
+        "chemistry",
+        "chess",
+        "chinese",
+        "christianity",
+        "civicrm",
+        "codegolf",
+        "codereview",
+        "coffee",
+        "cogsci",
+        "computergraphics",
+        "conlang",
+        "cooking",
+        "craftcms",
+        "crafts",
+        "crypto",
+        "cs",
+        "cseducators",
+        "cstheory",
+        "datascience",
+        "dba",
+        "devops",
+        "diy",
+        "drones",
+        "drupal",
+        "dsp",
+        "earthscience",
+        "ebooks",
+        "economics",
+        "electronics",
+        "elementaryos",
+        "ell",
+        "emacs",
+        "engineering",
+        "english",
+        "eosio",
+        "esperanto",
+        "ethereum",
+        "expatriates",
+        "expressionengine",
+        "fitness",
+        "freelancing",
+        "french",
+        "gamedev",
+        "gaming",
+        "gardening",
+        "genai",
+        "genealogy",
+        "german",
+        "gis",
+        "graphicdesign",
+        "ham",
+        "hardwarerecs",
+        "health",
+        "hermeneutics",
+        "hinduism",
+        "history",
+        "homebrew",
+        "hsm",
+        "interpersonal",
+        "iot",
+        "iota",
+        "islam",
+        "italian",
+        "japanese",
+        "joomla",
+        "judaism",
+        "korean",
+        "langdev",
+        "languagelearning",
+        "latin",
+        "law",
+        "lifehacks",
+        "linguistics",
+        "literature",
+        "magento",
+        "martialarts",
+        "materials",
+        "math",
+        "matheducators",
+        "mathematica",
+        "mechanics",
+        "moderators",
+        "monero",
+        "money",
+        "movies",
+        "music",
+        "musicfans",
+        "mythology",
+        "networkengineering",
+        "opendata",
+        "opensource",
+        "or",
+        "outdoors",
+        "parenting",
+        "patents",
+        "pets",
+        "philosophy",
+        "photo",
+        "physics",
+        "pm",
+        "poker",
+        "politics",
+        "portuguese",
+        "proofassistants",
+        "puzzling",
+        "quant",
+        "quantumcomputing",
+        "raspberrypi",
+        "retrocomputing",
+        "reverseengineering",
+        "robotics",
+        "rpg",
+        "rus",
+        "russian",
+        "salesforce",
+        "scicomp",
+        "scifi",
+        "security",
+        "sharepoint",
+        "sitecore",
+        "skeptics",
+        "softwareengineering",
+        "softwarerecs",
+        "solana",
+        "sound",
+        "space",
+        "spanish",
+        "sports",
+        "sqa",
+        "stats",
+        "stellar",
+        "substrate",
+        "sustainability",
+        "tex",
+        "tezos",
+        "tor",
+        "travel",
+        "tridion",
+        "ukrainian",
+        "unix",
+        "ux",
+        "vegetarianism",
+        "vi",
+        "webapps",
+        "webmasters",
+        "windowsphone",
+        "woodworking",
+        "wordpress",
+        "workplace",
+        "worldbuilding",
+        "writers",
+    ]
+]
+
+ALL_SITES = ALL_STACKOVERFLOW + ALL_SPECIAL_SITES + ALL_STACKEXCHANGE
+
+DOMAIN_PATTERN = re.compile(r"^[a-z0-9-]+(\.[a-z0-9-]+)+$")
+
+
+# 重複・ドメインとして不正な名前・ダンプにないサイトをまとめて報告する。
+# files (download.fetch_file_list の結果) を渡すと、archive.org にあるかも確認する
+def validate_sites(
+    domains: list[str], files: dict[str, RemoteFile] | None = None
+) -> list[str]:
+    errors: list[str] = []
+
+    seen: set[str] = set()
+    for domain in domains:
+        if domain in seen:
+            errors.append(f"{domain}: duplicated")
+        seen.add(domain)
+
+        if not DOMAIN_PATTERN.match(domain):
+            errors.append(f"{domain}: invalid domain")
+        elif domain == "stackoverflow.com":
+            errors.append(f"{domain}: currentry not supported")
+
+    if files is not None:
+        available = [name.removesuffix(".7z") for name in files if name.endswith(".7z")]
+        for domain in seen:
+            if f"{domain}.7z" not in files:
+                matches = difflib.get_close_matches(domain, available, n=1)
+                hint = f" (did you mean {matches[0]}?)" if matches else ""
+                errors.append(f"{domain}: not found in the dump{hint}")
+
+    if errors:
+        raise ValueError("Invalid sites:\n" + "\n".join(sorted(errors)))
+
+    return domains
+
+
+validate_sites(ALL_SITES)
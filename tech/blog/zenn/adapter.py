@@ -0,0 +1,52 @@
+import time
+
+from common.adapter import Listing, Page, Ref, SiteAdapter
+from common.scheduler import HostPolicy
+
+BASE_URL = "https://zenn.dev"
+
+
+def compose_articles_url(page: int) -> str:
+    return f"{BASE_URL}/articles?page={page}"
+
+
+# 記事一覧を 1 ページ目から順にたどり (404 で終わり)、記事の html をそのまま保存する
+class ZennAdapter(SiteAdapter):
+    name = "zenn"
+    policy = HostPolicy(delay=0.05)  # 申し訳程度の間隔
+
+    def listings(self):
+        return [Ref(url=compose_articles_url(1), payload={"page": 1})]
+
+    def parse_listing(self, page: Page, ref: Ref) -> Listing:
+        urls = [a.get("href") for a in page.soup().select("article > a")]
+        assert all([url is not None for url in urls])
+
+        items = [Ref(url=f"{BASE_URL}{url}") for url in urls]
+        if len(items) == 0:
+            return Listing()
+
+        next_page = ref.payload["page"] + 1
+        return Listing(
+            items=items,
+            listings=[
+                Ref(url=compose_articles_url(next_page), payload={"page": next_page})
+            ],
+        )
+
+    def parse_item(self, page: Page, ref: Ref) -> dict:
+        return {
+            "url": ref.url,
+            "html": str(page.soup()),
+            "timestamp": time.time(),
+            "duplicate_of": None,
+        }
+
+    # 取得済みの記事と同じ html だった記事は html を持たない
+    def duplicate_record(self, ref: Ref, duplicate_of: str) -> dict:
+        return {
+            "url": ref.url,
+            "html": None,
+            "timestamp": time.time(),
+            "duplicate_of": duplicate_of,
+        }
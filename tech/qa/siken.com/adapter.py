@@ -0,0 +1,59 @@
+from common.adapter import Listing, Page, Ref, SiteAdapter
+from common.scheduler import HostPolicy
+
+from siken import (
+    ParserStats,
+    get_past_exam_urls,
+    get_question_details,
+    get_questions,
+    parse_page,
+)
+
+
+# 各サイトのトップページ -> 過去問のページ -> 解説のある問題のページ の順にたどる
+class SikenAdapter(SiteAdapter):
+    name = "siken"
+    policy = HostPolicy(
+        delay=0.1,  # avoid 429
+        max_concurrency=2,
+    )
+
+    def __init__(self, target_sites: list[str], stats: ParserStats | None = None):
+        self.target_sites = target_sites
+        self.stats = stats
+
+    def listings(self):
+        return [Ref(url=url, payload={"kind": "top"}) for url in self.target_sites]
+
+    def parse_listing(self, page: Page, ref: Ref) -> Listing:
+        if ref.payload["kind"] == "top":
+            past_exam_urls = get_past_exam_urls(ref.url, page.soup())
+            return Listing(
+                listings=[
+                    Ref(url=url_data["url"], payload={"kind": "past_exam", **url_data})
+                    for url_data in past_exam_urls
+                ]
+            )
+
+        soup = parse_page(page.text, "past_exam", self.stats)
+        questions = get_questions(ref.payload["base_url"], ref.url, soup)
+        # 同じ問題は最初のものだけ残す
+        return Listing(
+            items=[
+                Ref(
+                    url=question["url"],
+                    key=f"{question['category']}.{question['title']}",
+                    payload=question,
+                )
+                for question in questions
+            ]
+        )
+
+    def parse_item(self, page: Page, ref: Ref) -> dict | None:
+        soup = parse_page(page.text, "question", self.stats)
+        question = get_question_details(soup)
+        if question is None:
+            return None
+        question["base_url"] = ref.payload["base_url"]
+        question["url"] = ref.url
+        return question
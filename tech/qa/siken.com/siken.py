@@ -0,0 +1,203 @@
+import threading
+from collections import Counter
+from typing import Literal
+
+from bs4 import BeautifulSoup, Tag
+
+PAGE_KIND = Literal[
+    "past_exam",  # 過去問の一覧 (table.qtable)
+    "question",  # 問題ごとのページ
+]
+
+PARSER = Literal["lxml", "html5lib"]
+
+
+# どのページをどのパーサーで読んだかを数える
+class ParserStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts: Counter[tuple[PAGE_KIND, PARSER]] = Counter()
+
+    def record(self, kind: PAGE_KIND, parser: PARSER):
+        with self.lock:
+            self.counts[(kind, parser)] += 1
+
+    def report(self) -> dict[str, dict[str, int]]:
+        with self.lock:
+            report: dict[str, dict[str, int]] = {}
+            for (kind, parser), count in sorted(self.counts.items()):
+                report.setdefault(kind, {})[parser] = count
+            return report
+
+    def __repr__(self) -> str:
+        return f"ParserStats({self.report()})"
+
+
+def select_mondai(soup: BeautifulSoup) -> Tag | None:
+    mondai = soup.select_one("section#mondai")
+    if mondai is None:
+        mondai = soup.select_one("div#mondai")
+    if mondai is None:
+        mondai = soup.select_one("article#mondai")
+    return mondai
+
+
+def is_afternoon_question(soup: BeautifulSoup) -> bool:
+    return soup.select_one("a#splitWindowBtn") is not None
+
+
+# lxml は壊れた html で要素を途中で閉じてしまうことがあるので、
+# 抽出に使う要素がちゃんと残っているかを確認する
+def has_required_anchors(soup: BeautifulSoup, kind: PAGE_KIND) -> bool:
+    if kind == "past_exam":
+        return len(soup.select("table.qtable tr")) > 0
+
+    if select_mondai(soup) is None:
+        return False
+
+    # 午後問題は使わないので問題文があれば十分
+    if is_afternoon_question(soup):
+        return True
+
+    return (
+        len(soup.select("div.ansbg > ul > li > span")) > 0
+        and soup.select_one("span#answerChar") is not None
+        and soup.select_one("div#kaisetsu") is not None
+    )
+
+
+# まず速い lxml で読み、必要な要素が欠けていたときだけ html5lib で読み直す
+def parse_page(
+    content: bytes | str,
+    kind: PAGE_KIND,
+    stats: ParserStats | None = None,
+) -> BeautifulSoup:
+    soup = BeautifulSoup(content, "lxml")
+    if has_required_anchors(soup, kind):
+        if stats is not None:
+            stats.record(kind, "lxml")
+        return soup
+
+    # html が不正なので html5lib を使う
+    soup = BeautifulSoup(content, "html5lib")
+    if stats is not None:
+        stats.record(kind, "html5lib")
+    return soup
+
+
+answer_char_map = {
+    "ア": 0,
+    "イ": 1,
+    "ウ": 2,
+    "エ": 3,
+}
+
+
+def get_question_details(soup: BeautifulSoup):
+    # 午後問題かも
+    if is_afternoon_question(soup):
+        return None
+
+    question: dict = {
+        "question_body": None,
+        "choice_0": None,
+        "choice_1": None,
+        "choice_2": None,
+        "choice_3": None,
+        # "answer_char": None,
+        "answer_num": None,
+        "explanation": None,
+        "explanation_choice_0": None,
+        "explanation_choice_1": None,
+        "explanation_choice_2": None,
+        "explanation_choice_3": None,
+    }
+
+    mondai = select_mondai(soup)
+    assert mondai is not None, soup
+
+    mondai_text = mondai.text
+    question["question_body"] = mondai_text
+
+    choices = soup.select("div.ansbg > ul > li > span")
+    if len(choices) == 0:
+        return None
+
+    for i, choice in enumerate(choices):
+        question[f"choice_{i}"] = choice.text
+
+    answer_char_el = soup.select_one("span#answerChar")
+    assert answer_char_el is not None
+
+    answer_num = answer_char_map[answer_char_el.text]
+
+    # question["answer_char"] = answer_char
+    question["answer_num"] = answer_num
+
+    kaisetsu = soup.select_one("div#kaisetsu")
+    assert kaisetsu is not None
+
+    if kaisetsu.select_one("ul > li.lia") is not None:
+        kaisetsu_choice_els = kaisetsu.select("ul > li")
+        assert len(kaisetsu_choice_els) > 0
+
+        for i, el in enumerate(kaisetsu_choice_els):
+            question[f"explanation_choice_{i}"] = el.text
+            el.decompose()
+
+    question["explanation"] = kaisetsu.text
+
+    return question
+
+
+def get_past_exam_urls(base_url: str, soup: BeautifulSoup) -> list[dict[str, str]]:
+    link_els = soup.select("ul#testMenu > li > a")
+    if len(link_els) == 0:
+        link_els = soup.select("el#test_menu > li > a")
+
+    return [
+        {
+            "base_url": base_url,
+            "url": f"{base_url}{el.get('href')}",
+        }
+        for el in link_els
+    ]
+
+
+def get_questions(base_url: str, url: str, soup: BeautifulSoup) -> list[dict]:
+    qtables = soup.select("table.qtable")
+    assert len(qtables) > 0, soup
+
+    tr_els = []
+    for qtable in qtables:
+        if qtable.select_one("tbody") is not None:
+            tr_els.extend(qtable.select("tbody > tr"))
+        else:
+            tr_els.extend(qtable.select("tr"))
+
+    questions = []
+    for tr in tr_els:
+        if tr.select_one("th") is not None:
+            # 見出しはスキップ
+            continue
+
+        is_ok_explanation = tr.select_one("i.ok") is not None
+        # 解説なければスキップ
+        if not is_ok_explanation:
+            continue
+
+        td_els = tr.select("td")
+        link = td_els[0].select_one("a").get("href")
+        title = td_els[1].text
+        category = td_els[2].text
+
+        questions.append(
+            {
+                "base_url": base_url,
+                "url": url + link,
+                "title": title,
+                "category": category,
+            }
+        )
+
+    return questions
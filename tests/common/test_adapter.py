@@ -0,0 +1,303 @@
+import json
+import shutil
+from functools import partial
+
+import pyarrow as pa
+import pytest
+
+from helpers import Route
+
+from common.adapter import Collector, Listing, Page, Ref, SiteAdapter
+from common.content_hash import ContentIndex
+from common.scheduler import HostPolicy
+from common.shard_writer import ShardWriter, load_manifest, load_shards
+
+
+class Crash(BaseException):
+    pass
+
+
+# /list-{n} の json に記事の path と次の一覧ページが入っている。記事も json
+class JsonAdapter(SiteAdapter):
+    name = "test"
+    policy = HostPolicy(delay=0.0, max_concurrency=1, backoff=0.01, max_backoff=0.01)
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+
+    def listings(self):
+        return [Ref(url=f"{self.base_url}/list-1")]
+
+    def parse_listing(self, page: Page, ref: Ref) -> Listing:
+        data = page.json()
+        return Listing(
+            items=[Ref(url=self.base_url + path) for path in data["items"]],
+            listings=[Ref(url=self.base_url + path) for path in data["next"]],
+        )
+
+    def parse_item(self, page: Page, ref: Ref) -> dict | list[dict] | None:
+        data = page.json()
+        if data == "crash":
+            raise Crash
+        return data
+
+
+def listing(items: list[str], next: list[str] = []) -> Route:
+    return Route(json.dumps({"items": items, "next": next}).encode())
+
+
+def record(data) -> Route:
+    return Route(json.dumps(data).encode())
+
+
+def item_requests(server) -> list[str]:
+    return [path for path, _ in server.requests if not path.startswith("/list")]
+
+
+def test_site_adapter_requires_all_methods():
+    class Incomplete(SiteAdapter):
+        def listings(self):
+            return []
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_collects_items_across_listings(server, tmp_path):
+    server.routes["/list-1"] = listing(["/a", "/b"], ["/list-2"])
+    server.routes["/list-2"] = listing(["/b", "/c", "/missing", "/broken"])
+    server.routes["/a"] = record({"id": "a"})
+    server.routes["/b"] = record([{"id": "b1"}, {"id": "b2"}])
+    server.routes["/c"] = record(None)
+    server.routes["/broken"] = Route(b"not json")
+
+    collector = Collector(JsonAdapter(server.base_url), tmp_path)
+    stats = collector.collect()
+
+    assert sorted(load_shards(tmp_path / "items")["id"]) == ["a", "b1", "b2"]
+    assert stats.items == 5
+    assert stats.records == 3
+    assert stats.not_found == 1
+    assert stats.failed == 1
+    assert [letter.url for letter in collector.dead_letters.pending()] == [
+        server.url("/broken")
+    ]
+
+    # 失敗したページ以外は取得済み。ページのないものも保存できたものとして扱う
+    for path in ["/a", "/b", "/c", "/missing"]:
+        assert collector.frontier.is_done(server.url(path))
+    # 失敗したページはキューに戻っている
+    assert collector.frontier.status(server.url("/broken")) == "pending"
+
+
+def test_client_errors_are_not_found(server, tmp_path):
+    server.routes["/gone"] = Route(status=410)
+    server.routes["/forbidden"] = Route(status=403)
+    server.routes["/timeout"] = Route(status=408)
+    items = [Ref(url=server.url(path)) for path in ["/gone", "/forbidden", "/timeout"]]
+
+    collector = Collector(JsonAdapter(server.base_url), tmp_path)
+    stats = collector.collect(items)
+
+    assert stats.not_found == 2
+    assert stats.failed == 1
+    assert [letter.url for letter in collector.dead_letters.pending()] == [
+        server.url("/timeout")
+    ]
+    assert collector.frontier.is_done(server.url("/gone"))
+    assert collector.frontier.is_done(server.url("/forbidden"))
+
+
+def test_adapters_decide_which_pages_are_missing(server, tmp_path):
+    # ログインが切れたときの 403 などは、取り直すために失敗にする
+    class StrictAdapter(JsonAdapter):
+        def is_missing(self, page: Page) -> bool:
+            return page.status_code == 404
+
+    server.routes["/forbidden"] = Route(status=403)
+
+    collector = Collector(StrictAdapter(server.base_url), tmp_path)
+    stats = collector.collect([Ref(url=server.url("/forbidden"))])
+
+    assert stats.not_found == 0
+    assert stats.failed == 1
+    assert collector.frontier.status(server.url("/forbidden")) == "pending"
+
+
+def test_rerun_skips_saved_items(server, tmp_path):
+    server.routes["/list-1"] = listing(["/a", "/b"])
+    server.routes["/a"] = record({"id": "a"})
+    server.routes["/b"] = record({"id": "b"})
+    Collector(JsonAdapter(server.base_url), tmp_path).collect()
+    server.requests.clear()
+
+    stats = Collector(JsonAdapter(server.base_url), tmp_path).collect()
+
+    assert item_requests(server) == []
+    assert stats.done == 2
+    assert load_shards(tmp_path / "items")["id"] == ["a", "b"]
+
+
+def test_drains_the_frontier_by_priority(server, tmp_path):
+    for path in ["/a", "/b", "/c"]:
+        server.routes[path] = record({"id": path})
+    collector = Collector(JsonAdapter(server.base_url), tmp_path, batch_size=1)
+    collector.frontier.add_many([server.url("/a"), server.url("/b")])
+    collector.frontier.add_many([server.url("/c")], priority=1)
+    collector.frontier.pop()  # 前回取得中に落ちたもの (a)
+
+    stats = collector.collect([])
+
+    assert item_requests(server) == ["/c", "/a", "/b"]
+    assert stats.records == 3
+    assert collector.frontier.pending_count() == 0
+
+
+def listing_requests(server) -> list[str]:
+    return [path for path, _ in server.requests if path.startswith("/list")]
+
+
+def test_discovery_resumes_from_unread_listings(server, tmp_path):
+    class CrashingAdapter(JsonAdapter):
+        crash = True
+
+        def parse_listing(self, page: Page, ref: Ref) -> Listing:
+            if ref.url.endswith("/list-2") and self.crash:
+                raise Crash
+            return super().parse_listing(page, ref)
+
+    server.routes["/list-1"] = listing(["/a"], ["/list-2"])
+    server.routes["/list-2"] = listing(["/b"])
+    adapter = CrashingAdapter(server.base_url)
+    with pytest.raises(Crash):
+        Collector(adapter, tmp_path).discover()
+    server.requests.clear()
+
+    adapter.crash = False
+    collector = Collector(adapter, tmp_path)
+
+    assert collector.discover() == 1
+    assert listing_requests(server) == ["/list-2"]
+    assert collector.frontier.urls() == [server.url("/a"), server.url("/b")]
+
+
+def test_discovery_skips_listings_that_are_not_refreshed(server, tmp_path):
+    class WorkAdapter(JsonAdapter):
+        def refresh_listing(self, ref: Ref) -> bool:
+            return ref.url.endswith("/list-1")
+
+    server.routes["/list-1"] = listing(["/a"], ["/list-2"])
+    server.routes["/list-2"] = listing(["/b"])
+    assert Collector(WorkAdapter(server.base_url), tmp_path).discover() == 2
+    server.requests.clear()
+
+    # 最初の一覧ページだけを読み直し、増えたページを見つける
+    server.routes["/list-1"] = listing(["/c", "/a"], ["/list-2"])
+    collector = Collector(WorkAdapter(server.base_url), tmp_path)
+
+    assert collector.discover() == 1
+    assert listing_requests(server) == ["/list-1"]
+    assert collector.frontier.urls() == [
+        server.url("/a"),
+        server.url("/b"),
+        server.url("/c"),
+    ]
+
+
+def test_failed_listings_are_read_again_on_the_next_pass(server, tmp_path):
+    server.routes["/list-1"] = listing(["/a"], ["/list-2"])
+    server.routes["/list-2"] = Route(b"not json")
+    collector = Collector(JsonAdapter(server.base_url), tmp_path)
+    collector.discover()
+    assert collector.listing_frontier.status(server.url("/list-2")) is None
+    server.requests.clear()
+
+    server.routes["/list-2"] = listing(["/b"])
+
+    assert collector.discover() == 1
+    assert listing_requests(server) == ["/list-1", "/list-2"]
+
+
+def test_items_are_read_from_the_cache(server, tmp_path):
+    server.routes["/a"] = record({"id": "a"})
+    items = [Ref(url=server.url("/a"))]
+    first = Collector(JsonAdapter(server.base_url), tmp_path / "first")
+    first.collect(items)
+    first.cache.close()
+
+    # キャッシュだけを持って最初から取り直す (パーサーを直したときなど)
+    (tmp_path / "second").mkdir()
+    shutil.copy(tmp_path / "first" / "cache.sqlite", tmp_path / "second")
+    server.requests.clear()
+
+    stats = Collector(JsonAdapter(server.base_url), tmp_path / "second").collect(items)
+
+    assert item_requests(server) == []
+    assert stats.cached == 1
+    assert load_shards(tmp_path / "second" / "items")["id"] == ["a"]
+
+
+def test_skips_pages_with_the_same_content(server, tmp_path):
+    server.routes["/a"] = record({"id": "same"})
+    server.routes["/b"] = record({"id": "same"})
+    content_index = ContentIndex(tmp_path / "contents.sqlite")
+
+    class DedupeAdapter(JsonAdapter):
+        schema = pa.schema(
+            [("id", pa.string()), ("url", pa.string()), ("duplicate_of", pa.string())]
+        )
+
+    stats = Collector(
+        DedupeAdapter(server.base_url), tmp_path, content_index=content_index
+    ).collect([Ref(url=server.url("/a")), Ref(url=server.url("/b"))])
+
+    # 2 つめのページは最初のページへの参照だけを書く
+    assert load_shards(tmp_path / "items").to_list() == [
+        {"id": "same", "url": None, "duplicate_of": None},
+        {"id": None, "url": server.url("/b"), "duplicate_of": server.url("/a")},
+    ]
+    assert stats.records == 2
+    assert stats.duplicates == 1
+    assert content_index.report()["test"]["raw"].duplicates == 1
+
+
+def test_schema_promotion_marks_committed_pages_done(server, tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        "common.adapter.ShardWriter", partial(ShardWriter, batch_size=1)
+    )
+    server.routes["/a"] = record({"id": "a", "value": None})
+    server.routes["/b"] = record({"id": "b", "value": "x"})
+    server.routes["/c"] = record("crash")
+
+    collector = Collector(JsonAdapter(server.base_url), tmp_path)
+    with pytest.raises(Crash):
+        collector.collect([Ref(url=server.url(path)) for path in ["/a", "/b", "/c"]])
+
+    # b で schema が決まったときに a のシャードが確定している。b はまだ保存されていない
+    assert load_manifest(tmp_path / "items").num_rows == 1
+    assert collector.frontier.is_done(server.url("/a"))
+    assert not collector.frontier.is_done(server.url("/b"))
+
+
+def test_page_is_done_only_after_all_its_records_are_committed(
+    server, tmp_path, monkeypatch
+):
+    # レコードを 1 つ書くたびにシャードが確定する
+    monkeypatch.setattr(
+        "common.adapter.ShardWriter",
+        partial(ShardWriter, batch_size=1, max_shard_bytes=1),
+    )
+    server.routes["/a"] = record([{"id": "a1"}, {"id": "a2"}])
+    server.routes["/b"] = record("crash")
+
+    collector = Collector(JsonAdapter(server.base_url), tmp_path)
+    calls = []
+    done = collector.frontier.done
+    collector.frontier.done = lambda *urls: (calls.append(urls), done(*urls))
+    with pytest.raises(Crash):
+        collector.collect([Ref(url=server.url("/a")), Ref(url=server.url("/b"))])
+
+    # a1 のシャードが確定した時点では、a はまだ取得済みにならない
+    assert calls == [(), (server.url("/a"),)]
+    assert load_manifest(tmp_path / "items").num_rows == 2
+    assert not collector.frontier.is_done(server.url("/b"))
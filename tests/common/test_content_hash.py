@@ -0,0 +1,69 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from common.content_hash import ContentIndex
+
+
+def test_returns_the_first_ref_for_duplicates(tmp_path):
+    index = ContentIndex(tmp_path / "contents.sqlite")
+
+    assert index.add_raw(b"page", "site", "https://example.com/a") is None
+    assert index.add_raw(b"page", "site", "https://example.com/b") == (
+        "https://example.com/a"
+    )
+    assert index.add_raw(b"other", "site", "https://example.com/c") is None
+
+
+def test_same_ref_is_not_a_duplicate(tmp_path):
+    index = ContentIndex(tmp_path / "contents.sqlite")
+    index.add_raw(b"page", "site", "https://example.com/a")
+
+    # 保存前に落ちて同じ URL を取り直したとき
+    assert index.add_raw(b"page", "site", "https://example.com/a") is None
+    assert index.report()["site"]["raw"].duplicates == 0
+
+
+def test_kinds_are_separate(tmp_path):
+    index = ContentIndex(tmp_path / "contents.sqlite")
+    index.add_raw("本文".encode("utf-8"), "site", "a")
+
+    assert index.add_text("本文", "site", "b") is None
+    assert index.add_text("本文", "site", "c") == "b"
+
+
+def test_report_counts_by_source_and_kind(tmp_path):
+    index = ContentIndex(tmp_path / "contents.sqlite")
+    index.add_raw(b"x", "site", "a")
+    index.add_raw(b"x", "site", "b")
+    index.add_text("x", "site", "a")
+    index.add_raw(b"x", "other", "c")
+
+    report = index.report()
+    assert report["site"]["raw"].seen == 2
+    assert report["site"]["raw"].duplicates == 1
+    assert report["site"]["raw"].ratio == 0.5
+    assert report["site"]["text"].duplicates == 0
+    assert report["other"]["raw"].duplicates == 1
+
+
+def test_persists_across_reopen(tmp_path):
+    index = ContentIndex(tmp_path / "contents.sqlite")
+    index.add_raw(b"page", "site", "a")
+    index.close()
+
+    index = ContentIndex(tmp_path / "contents.sqlite")
+    assert index.add_raw(b"page", "site", "b") == "a"
+    assert index.report()["site"]["raw"].seen == 2
+
+
+def test_concurrent_adds_register_one_first_ref(tmp_path):
+    index = ContentIndex(tmp_path / "contents.sqlite")
+    refs = [f"ref-{i}" for i in range(32)]
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(
+            executor.map(lambda ref: index.add_raw(b"page", "site", ref), refs)
+        )
+
+    assert results.count(None) == 1
+    first = refs[results.index(None)]
+    assert all(result in (None, first) for result in results)
+    assert index.report()["site"]["raw"].duplicates == 31
@@ -0,0 +1,46 @@
+from common.dead_letter import DeadLetterQueue
+
+
+def test_latest_line_is_the_current_state(tmp_path):
+    queue = DeadLetterQueue(tmp_path / "dead_letter.jsonl")
+    queue.push("work", "1", "https://example.com/1", ValueError("broken"))
+    queue.push("work", "2", "https://example.com/2", ValueError("broken"))
+
+    [first, second] = queue.pending("work")
+    queue.resolve(first)
+
+    assert [letter.key for letter in queue.pending()] == ["2"]
+    assert queue.latest()[("work", "1")].status == "resolved"
+
+
+def test_keeps_the_raw_response_and_traceback(tmp_path):
+    queue = DeadLetterQueue(tmp_path / "dead_letter.jsonl")
+    try:
+        raise ValueError("broken")
+    except ValueError as e:
+        queue.push(
+            "episode",
+            "1/2",
+            "https://example.com/1/2",
+            e,
+            response="<html>raw</html>",
+            context={"work_id": "1"},
+        )
+
+    [letter] = queue.pending("episode")
+    assert letter.response == "<html>raw</html>"
+    assert letter.context == {"work_id": "1"}
+    assert "ValueError: broken" in letter.traceback
+
+
+def test_gives_up_after_max_attempts(tmp_path):
+    queue = DeadLetterQueue(tmp_path / "dead_letter.jsonl")
+    queue.push("work", "1", "https://example.com/1", ValueError(), attempt=3)
+    queue.push("work", "2", "https://example.com/2", ValueError(), attempt=2)
+
+    assert [letter.key for letter in queue.pending("work", max_attempts=3)] == ["2"]
+    assert queue.pending("episode") == []
+
+
+def test_empty_queue(tmp_path):
+    assert DeadLetterQueue(tmp_path / "dead_letter.jsonl").pending() == []
@@ -0,0 +1,79 @@
+import pytest
+import requests
+
+from common.encoding import (
+    EncodingStats,
+    decode_html,
+    decode_response,
+    header_encoding,
+    meta_encoding,
+)
+
+TEXT = "日本語のページです。" * 20
+
+
+def test_header_encoding():
+    assert header_encoding("text/html; charset=UTF-8") == "utf-8"
+    assert header_encoding('text/html; charset="Shift_JIS"') == "cp932"
+    assert header_encoding("text/html; charset=unknown-charset") is None
+    assert header_encoding("text/html") is None
+    assert header_encoding(None) is None
+
+
+def test_meta_encoding():
+    assert meta_encoding(b'<html><head><meta charset="euc-jp">') == "euc_jp"
+    assert (
+        meta_encoding(
+            b'<meta http-equiv="Content-Type" content="text/html; charset=Shift_JIS">'
+        )
+        == "cp932"
+    )
+    assert meta_encoding(b" " * 5000 + b'<meta charset="euc-jp">') is None
+
+
+@pytest.mark.parametrize(
+    "content_type, html, expected_path",
+    [
+        ("text/html; charset=euc-jp", f"<p>{TEXT}</p>", "header"),
+        (None, f'<meta charset="euc-jp"><p>{TEXT}</p>', "meta"),
+        (None, f"<p>{TEXT}</p>", "detected"),
+    ],
+)
+def test_decode_html_paths(content_type, html, expected_path):
+    stats = EncodingStats()
+    text, _ = decode_html(html.encode("euc_jp"), content_type, stats)
+
+    assert TEXT in text
+    assert stats.report() == {expected_path: 1}
+
+
+def test_wrong_header_falls_back_to_meta():
+    stats = EncodingStats()
+    content = f'<meta charset="cp932"><p>{TEXT}①</p>'.encode("cp932")
+
+    text, encoding = decode_html(content, "text/html; charset=utf-8", stats)
+
+    assert encoding == "cp932"
+    assert "①" in text  # Shift_JIS の機種依存文字
+    assert stats.report() == {"meta": 1}
+
+
+def test_undecodable_bytes_are_replaced(monkeypatch):
+    monkeypatch.setattr("common.encoding.detect_encoding", lambda content: None)
+    stats = EncodingStats()
+
+    text, encoding = decode_html(b"\xff\xfe\xfa broken", None, stats)
+
+    assert encoding == "utf-8"
+    assert "broken" in text
+    assert stats.report() == {"fallback": 1}
+
+
+def test_decode_response_sets_res_encoding():
+    res = requests.Response()
+    res._content = f"<p>{TEXT}</p>".encode("cp932")
+    res.headers["Content-Type"] = "text/html; charset=Shift_JIS"
+
+    assert TEXT in decode_response(res, EncodingStats())
+    assert res.encoding == "cp932"
+    assert TEXT in res.text
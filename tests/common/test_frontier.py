@@ -0,0 +1,134 @@
+import sqlite3
+
+from common.frontier import BloomFilter, Frontier
+
+
+def test_add_many_returns_only_new_urls(tmp_path):
+    frontier = Frontier(tmp_path / "frontier.sqlite")
+
+    assert frontier.add_many(["a", "b", "a"]) == ["a", "b"]
+    assert frontier.add_many(["b", "c"]) == ["c"]
+    assert frontier.add("c") is False
+    assert frontier.urls() == ["a", "b", "c"]
+    assert len(frontier) == 3
+
+
+def test_done_survives_reopen(tmp_path):
+    path = tmp_path / "frontier.sqlite"
+    frontier = Frontier(path)
+    frontier.add_many(["a", "b"])
+    frontier.done("a", "d")  # add していない URL も記録される
+    frontier.close()
+
+    frontier = Frontier(path)
+    assert frontier.is_done("a")
+    assert frontier.is_done("d")
+    assert frontier.status("b") == "pending"
+    assert frontier.status("x") is None
+    assert frontier.pending_count() == 1
+    assert frontier.urls("done") == ["a", "d"]
+
+
+def test_shared_between_connections(tmp_path):
+    path = tmp_path / "frontier.sqlite"
+    first = Frontier(path)
+    second = Frontier(path)
+
+    assert first.add_many(["a"]) == ["a"]
+    assert second.add_many(["a", "b"]) == ["b"]
+    assert "b" in first
+
+
+def test_bloom_filter_is_loaded_from_existing_urls(tmp_path):
+    path = tmp_path / "frontier.sqlite"
+    Frontier(path).add_many(["a", "b"])
+
+    frontier = Frontier(path, bloom=True)
+    assert frontier.seen("a")
+    assert not frontier.seen("z")
+    frontier.add("z")
+    assert frontier.seen("z")
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    keys = [f"https://example.com/{i}" for i in range(1000)]
+    for key in keys:
+        bloom.add(key)
+
+    assert all(key in bloom for key in keys)
+    false_positives = sum(f"https://example.org/{i}" in bloom for i in range(1000))
+    assert false_positives < 50
+
+
+def test_pop_in_priority_then_insertion_order(tmp_path):
+    frontier = Frontier(tmp_path / "frontier.sqlite")
+    frontier.add_many(["a", "b"])
+    frontier.add_many(["c"], priority=1)
+
+    assert frontier.pop(2) == ["c", "a"]
+    assert frontier.status("a") == "claimed"
+    assert frontier.pop(5) == ["b"]
+    assert frontier.pop() == []
+
+
+def test_release_and_recover_return_claimed_urls(tmp_path):
+    path = tmp_path / "frontier.sqlite"
+    frontier = Frontier(path)
+    frontier.add_many(["a", "b", "c"])
+    assert frontier.pop(3) == ["a", "b", "c"]
+    frontier.done("a")
+    frontier.release("b")
+    assert frontier.pop() == ["b"]
+
+    # 取得中のまま落ちたもの
+    frontier = Frontier(path)
+    frontier.recover()
+    assert frontier.pop(5) == ["b", "c"]
+
+
+def test_entries_keep_their_data(tmp_path):
+    frontier = Frontier(tmp_path / "frontier.sqlite")
+    assert frontier.add_entries([("a", '{"n": 1}'), ("b", None)]) == ["a", "b"]
+    # 既出の URL の data は変わらない
+    assert frontier.add_entries([("a", '{"n": 2}')]) == []
+
+    assert frontier.pop_entries(5) == [("a", '{"n": 1}'), ("b", None)]
+
+
+def test_opens_a_file_without_the_queue_columns(tmp_path):
+    path = tmp_path / "frontier.sqlite"
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE urls (url TEXT NOT NULL UNIQUE, "
+        "status TEXT NOT NULL DEFAULT 'pending', "
+        "added_at REAL NOT NULL, updated_at REAL NOT NULL)"
+    )
+    conn.execute("INSERT INTO urls VALUES ('a', 'pending', 0, 0)")
+    conn.commit()
+    conn.close()
+
+    frontier = Frontier(path)
+    frontier.add_many(["b"], priority=1)
+    assert frontier.pop_entries(2) == [("b", None), ("a", None)]
+
+
+def test_entries_are_read_in_batches(tmp_path):
+    frontier = Frontier(tmp_path / "frontier.sqlite")
+    frontier.add_entries([("a", "1"), ("b", None), ("c", "3")])
+    frontier.done("b")
+
+    assert list(frontier.entries(batch_size=2)) == [("a", "1"), ("b", None), ("c", "3")]
+    assert list(frontier.entries("pending", batch_size=1)) == [("a", "1"), ("c", "3")]
+
+
+def test_removed_urls_can_be_added_again(tmp_path):
+    frontier = Frontier(tmp_path / "frontier.sqlite")
+    frontier.add_many(["a", "b"])
+    frontier.done("a")
+
+    frontier.remove("a")
+
+    assert "a" not in frontier
+    assert frontier.add("a")
+    assert frontier.status("a") == "pending"
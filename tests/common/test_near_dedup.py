@@ -0,0 +1,92 @@
+import random
+
+import numpy as np
+import pyarrow as pa
+
+from common.near_dedup import (
+    MAX_HASH,
+    MERSENNE_PRIME,
+    MinHashConfig,
+    NearDedupIndex,
+    compute_signatures,
+    dedup_shards,
+    dedup_table,
+    minhash,
+)
+from common.shard_writer import ShardWriter, load_shards
+
+# 候補を取りこぼさないようにバンドを細かくし、推定の誤差も小さくする
+CONFIG = MinHashConfig(num_perm=256, bands=128, threshold=0.6)
+
+
+def random_text(rng: random.Random, length: int) -> str:
+    return "".join(
+        rng.choice("あいうえおかきくけこさしすせそたちつてと") for _ in range(length)
+    )
+
+
+# x と y は似ていないが、z は x とも y とも似ている
+def bridged_texts() -> tuple[str, str, str]:
+    rng = random.Random(0)
+    base, a, b = random_text(rng, 100), random_text(rng, 50), random_text(rng, 50)
+    return base + a, base + b, base + a + b
+
+
+def test_minhash_does_not_overflow():
+    hashes = np.array([MAX_HASH, MAX_HASH - np.uint64(1)], dtype=np.uint64)
+    a = np.array([MAX_HASH], dtype=np.uint64)
+    b = np.array([MAX_HASH], dtype=np.uint64)
+
+    expected = min(
+        (int(h) * int(MAX_HASH) + int(MAX_HASH)) % int(MERSENNE_PRIME) & int(MAX_HASH)
+        for h in hashes
+    )
+    assert minhash(hashes, a, b).tolist() == [expected]
+
+
+def test_near_duplicates_share_a_cluster(tmp_path):
+    index = NearDedupIndex(tmp_path / "index.db", CONFIG)
+    x, y, _ = bridged_texts()
+    texts = [x, x + "。", y]
+    clusters, keep = index.add_batch(["a", "b", "c"], compute_signatures(texts, CONFIG))
+
+    assert clusters[0] == clusters[1] != clusters[2]
+    assert keep.tolist() == [True, False, True]
+
+
+def test_empty_texts_are_not_clustered(tmp_path):
+    index = NearDedupIndex(tmp_path / "index.db", CONFIG)
+    table = pa.table({"id": [1, 2, 3, 4], "text": ["", None, "", "本文"]})
+    table = dedup_table(table, index, "text", "id")
+
+    assert len(set(table["dup_cluster"].to_pylist())) == 4
+    assert table["keep"].to_pylist() == [True] * 4
+
+
+def test_readding_returns_the_current_cluster(tmp_path):
+    index = NearDedupIndex(tmp_path / "index.db", CONFIG)
+    x, _, _ = bridged_texts()
+    signatures = compute_signatures([x, x], CONFIG)
+    index.add_batch(["a"], signatures[:1])
+    clusters, keep = index.add_batch(["b", "a"], signatures)
+
+    assert clusters.tolist() == [1, 1]
+    assert keep.tolist() == [False, True]
+    assert list(index.duplicate_clusters()) == [["a", "b"]]
+
+
+def test_dedup_shards_refreshes_merged_clusters(tmp_path):
+    x, y, z = bridged_texts()
+    with ShardWriter(tmp_path / "input", batch_size=1) as writer:
+        writer.write_many([{"id": i, "text": text} for i, text in enumerate([x, y, z])])
+
+    index = NearDedupIndex(tmp_path / "index.db", CONFIG)
+    # 1 行ずつ足すので、y を書いた時点では x とつながっていない
+    stats = dedup_shards(
+        tmp_path / "input", tmp_path / "output", index, "text", "id", batch_size=1
+    )
+
+    output = load_shards(tmp_path / "output")
+    assert output["dup_cluster"] == [1, 1, 1]
+    assert output["keep"] == [True, False, False]
+    assert stats.num_dropped == 2
@@ -0,0 +1,52 @@
+import time
+
+import requests
+
+from helpers import Route
+
+from common.response_cache import ResponseCache
+
+
+def test_put_and_get(server, tmp_path):
+    server.routes["/page"] = Route(
+        "本文".encode("utf-8"), headers={"Content-Type": "text/html; charset=utf-8"}
+    )
+    cache = ResponseCache(tmp_path / "cache.sqlite")
+    cache.put(requests.get(server.url("/page")))
+
+    cached = cache.get(server.url("/page"))
+    assert cached is not None
+    assert cached.status_code == 200
+    assert cached.content == "本文".encode("utf-8")
+    assert cached.headers["content-type"] == "text/html; charset=utf-8"
+    assert server.url("/page") in cache
+    assert cache.get(server.url("/other")) is None
+
+
+def test_put_keeps_the_requested_url(server, tmp_path):
+    server.routes["/page"] = Route(b"page")
+    cache = ResponseCache(tmp_path / "cache.sqlite")
+    cache.put(requests.get(server.url("/page")), "https://example.com/original")
+
+    assert "https://example.com/original" in cache
+    assert server.url("/page") not in cache
+
+
+def test_max_age(server, tmp_path):
+    server.routes["/page"] = Route(b"page")
+    cache = ResponseCache(tmp_path / "cache.sqlite")
+    cache.put(requests.get(server.url("/page")))
+    time.sleep(0.05)
+
+    assert cache.get(server.url("/page"), max_age=0.01) is None
+    assert cache.get(server.url("/page"), max_age=60) is not None
+
+
+def test_persists_across_reopen(server, tmp_path):
+    server.routes["/page"] = Route(b"page")
+    cache = ResponseCache(tmp_path / "cache.sqlite")
+    cache.put(requests.get(server.url("/page")))
+    cache.close()
+
+    cached = ResponseCache(tmp_path / "cache.sqlite").get(server.url("/page"))
+    assert cached is not None and cached.content == b"page"
@@ -0,0 +1,95 @@
+from helpers import Route
+
+from common.scheduler import FetchTask, HostPolicy, HostScheduler, get_host
+
+FAST = HostPolicy(delay=0.0, max_concurrency=1, backoff=0.01, max_backoff=0.01)
+
+
+def body(task, res) -> str:
+    return res.text
+
+
+def test_returns_every_task(server):
+    for i in range(5):
+        server.routes[f"/{i}"] = Route(f"page {i}".encode())
+    scheduler = HostScheduler(default_policy=FAST)
+
+    results = list(
+        scheduler.run(
+            [FetchTask(url=server.url(f"/{i}"), payload=i) for i in range(5)], body
+        )
+    )
+
+    assert sorted((r.task.payload, r.result) for r in results) == [
+        (i, f"page {i}") for i in range(5)
+    ]
+    stats = scheduler.report()[get_host(server.base_url)]
+    assert stats.requests == 5
+    assert stats.failures == 0
+
+
+def test_aborted_run_does_not_leak_tasks_into_the_next_run(server):
+    for name in ["a0", "a1", "a2", "a3", "b0", "b1"]:
+        server.routes[f"/{name}"] = Route(name.encode())
+    scheduler = HostScheduler(default_policy=FAST)
+
+    first = scheduler.run(
+        [FetchTask(url=server.url(f"/a{i}"), payload="a") for i in range(4)], body
+    )
+    next(first)
+    first.close()  # 消費側が途中で止めた (例外など)
+
+    def second_handle(task, res):
+        return ("second", res.text)
+
+    results = list(
+        scheduler.run(
+            [FetchTask(url=server.url(f"/b{i}"), payload="b") for i in range(2)],
+            second_handle,
+        )
+    )
+
+    assert sorted(result.result for result in results) == [
+        ("second", "b0"),
+        ("second", "b1"),
+    ]
+    assert all(result.task.payload == "b" for result in results)
+
+
+def test_retries_then_gives_up(server):
+    server.routes["/busy"] = Route(status=503)
+    server.routes["/missing"] = Route(status=404)
+    scheduler = HostScheduler(
+        default_policy=HostPolicy(delay=0.0, max_retries=2, backoff=0.01)
+    )
+
+    results = {
+        result.task.url: result
+        for result in scheduler.run(
+            [
+                FetchTask(url=server.url("/busy")),
+                FetchTask(url=server.url("/missing")),
+            ],
+            lambda task, res: res.status_code,
+        )
+    }
+
+    busy = results[server.url("/busy")]
+    assert busy.error is not None and busy.error.startswith("Max retry exceeded")
+    assert busy.task.attempt == 3
+    # 404 は handle に渡す
+    assert results[server.url("/missing")].result == 404
+    assert server.requests.count(("/busy", None)) == 3
+
+
+def test_handle_errors_are_returned_not_raised(server):
+    server.routes["/page"] = Route(b"x")
+    scheduler = HostScheduler(default_policy=FAST)
+
+    def handle(task, res):
+        raise ValueError("broken page")
+
+    (result,) = scheduler.run([FetchTask(url=server.url("/page"))], handle)
+
+    assert result.result is None
+    assert "broken page" in result.error
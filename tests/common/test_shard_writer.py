@@ -0,0 +1,82 @@
+import pyarrow as pa
+import pytest
+
+from common.shard_writer import ShardWriter, iter_batches, load_manifest, load_shards
+
+
+def records(start: int, stop: int) -> list[dict]:
+    return [{"id": i, "text": f"text {i}"} for i in range(start, stop)]
+
+
+def test_rolls_over_by_size(tmp_path):
+    with ShardWriter(tmp_path, max_shard_bytes=1, batch_size=2) as writer:
+        committed = writer.write_many(records(0, 5))
+
+    manifest = load_manifest(tmp_path)
+    assert committed == 2
+    assert [shard.num_rows for shard in manifest.shards] == [2, 2, 1]
+    assert load_shards(tmp_path)["id"] == list(range(5))
+
+
+def test_write_reports_commit_after_all_buffered_records(tmp_path):
+    writer = ShardWriter(tmp_path, max_shard_bytes=1, batch_size=3)
+    results = [writer.write(record) for record in records(0, 3)]
+    writer.close()
+
+    assert results == [False, False, True]
+    assert load_manifest(tmp_path).num_rows == 3
+
+
+def test_abort_keeps_only_completed_shards(tmp_path):
+    with pytest.raises(RuntimeError):
+        with ShardWriter(tmp_path, max_shard_bytes=1, batch_size=2) as writer:
+            writer.write_many(records(0, 3))
+            raise RuntimeError
+
+    assert load_manifest(tmp_path).num_rows == 2
+    assert list(tmp_path.glob("*.tmp")) == []
+
+
+def test_reopen_appends_with_the_same_schema(tmp_path):
+    with ShardWriter(tmp_path) as writer:
+        writer.write_many(records(0, 2))
+    with ShardWriter(tmp_path) as writer:
+        writer.write({"id": 2, "text": None})
+
+    ds = load_shards(tmp_path)
+    assert ds["id"] == [0, 1, 2]
+    assert ds["text"] == ["text 0", "text 1", None]
+
+
+def test_fixed_schema_rejects_other_records(tmp_path):
+    schema = pa.schema([pa.field("id", pa.int64())])
+    writer = ShardWriter(tmp_path, schema=schema, batch_size=1)
+    with pytest.raises(ValueError):
+        writer.write({"id": "not a number"})
+
+
+def test_write_table_and_iter_batches(tmp_path):
+    table = pa.table({"id": list(range(10))})
+    with ShardWriter(tmp_path, max_shard_bytes=1, batch_size=4) as writer:
+        assert writer.write_table(table) == 3
+
+    batches = list(iter_batches(tmp_path))
+    assert [batch.num_rows for batch in batches] == [4, 4, 2]
+    assert pa.Table.from_batches(batches).equals(table)
+
+
+def test_load_shards_without_shards(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        load_shards(tmp_path)
+
+
+def test_on_commit_reports_schema_promotion(tmp_path):
+    commits = []
+    with ShardWriter(tmp_path, batch_size=1, on_commit=commits.append) as writer:
+        assert not writer.write({"id": 0, "value": None})
+        # value の型が決まったところで、前のシャードが確定する
+        assert not writer.write({"id": 1, "value": "x"})
+        assert commits == [1]
+
+    assert commits == [1, 2]
+    assert load_shards(tmp_path)["value"] == [None, "x"]
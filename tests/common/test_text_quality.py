@@ -0,0 +1,95 @@
+import pyarrow as pa
+import pytest
+
+from datasets import Dataset
+
+from common.shard_writer import ShardWriter, load_shards
+from common.text_quality import (
+    QualityFilter,
+    Threshold,
+    add_text_stats,
+    dataset_text_stats,
+    filter_dataset,
+    line_repetition_ratio,
+    text_stat_columns,
+    text_stats,
+    text_stats_shards,
+)
+
+
+def test_text_stats_counts_characters():
+    stats = text_stats(pa.array(["ひらカナ漢字ab", "", None]), prefix="x_")
+    row = stats.slice(0, 1).to_pylist()[0]
+
+    assert row["x_length"] == 8
+    assert row["x_lines"] == 1
+    assert row["x_hiragana_ratio"] == pytest.approx(2 / 8)
+    assert row["x_katakana_ratio"] == pytest.approx(2 / 8)
+    assert row["x_kanji_ratio"] == pytest.approx(2 / 8)
+    assert row["x_ascii_ratio"] == pytest.approx(2 / 8)
+    assert row["x_japanese_ratio"] == pytest.approx(6 / 8)
+
+    # 空の文書の割合は 0、null の文書は null
+    assert stats["x_length"].to_pylist()[1:] == [0, None]
+    assert stats["x_kanji_ratio"].to_pylist()[1:] == [0.0, None]
+
+
+def test_long_vowel_mark_counts_as_katakana():
+    stats = text_stats(pa.array(["データ"]))
+    assert stats["katakana_ratio"].to_pylist() == [1.0]
+
+
+def test_line_repetition_ratio():
+    texts = pa.array(["a\nb\na\n\na", "a\nb", "", None], pa.large_string())
+    assert line_repetition_ratio(texts).to_pylist() == [0.5, 0.0, 0.0, None]
+
+
+def test_text_stat_columns_match_text_stats():
+    assert text_stat_columns("summary") == (
+        text_stats(pa.array(["x"]), prefix="summary_").column_names
+    )
+
+
+def test_quality_filter_rejects_nulls():
+    table = pa.table({"length": [0, 5, 20, None]})
+    quality_filter = QualityFilter(thresholds={"length": Threshold(min=1, max=10)})
+    assert quality_filter.mask(table).to_pylist() == [False, True, False, False]
+
+
+def test_filter_dataset_with_arrow_mask():
+    ds = Dataset.from_dict(
+        {
+            "summary": ["要約", "", None, "要約"],
+            "detail": ["本文", "本文", "本文", None],
+        }
+    )
+    ds = dataset_text_stats(ds, ["summary", "detail"])
+    ds = filter_dataset(
+        ds, QualityFilter(thresholds={"detail_length": Threshold(min=1)})
+    )
+
+    assert ds["summary"] == ["要約", "", None]
+    assert ds.column_names[:2] == ["summary", "detail"]
+
+    ds = ds.remove_columns(text_stat_columns("summary") + text_stat_columns("detail"))
+    assert ds.column_names == ["summary", "detail"]
+
+
+def test_text_stats_shards_resumes(tmp_path):
+    with ShardWriter(tmp_path / "input", batch_size=2) as writer:
+        writer.write_many([{"text": text} for text in ["あ", "", "い", "う"]])
+    quality_filter = QualityFilter(thresholds={"text_length": Threshold(min=1)})
+
+    # 最初のシャードだけ書き終えた状態を作る
+    with ShardWriter(tmp_path / "output") as writer:
+        table = add_text_stats(pa.table({"text": ["あ", ""]}), "text")
+        writer.write_table(table.append_column("passed", quality_filter.mask(table)))
+
+    num_rows = text_stats_shards(
+        tmp_path / "input", tmp_path / "output", ["text"], quality_filter
+    )
+
+    output = load_shards(tmp_path / "output")
+    assert num_rows == 2
+    assert output["text"] == ["あ", "", "い", "う"]
+    assert output["passed"] == [True, False, True, True]
@@ -0,0 +1,16 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# notebook と同じように、リポジトリのルートから common を import する
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from helpers import LocalServer
+
+
+@pytest.fixture
+def server():
+    server = LocalServer()
+    yield server
+    server.close()
@@ -0,0 +1,97 @@
+import importlib.util
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+
+class Route:
+    def __init__(
+        self,
+        body: bytes = b"",
+        status: int = 200,
+        headers: dict[str, str] | None = None,
+        ranges: bool = True,
+        send_length: bool = True,
+        cut_after: int | None = None,
+    ):
+        self.body = body
+        self.status = status
+        self.headers = headers if headers is not None else {}
+        self.ranges = ranges  # Range ヘッダーに 206 で応えるか
+        self.send_length = send_length  # False なら接続を閉じて終わりを知らせる
+        self.cut_after = cut_after  # 次の 1 回だけ、このバイト数を送ったところで切る
+
+
+# テスト用のローカル HTTP サーバー。path ごとに Route を登録しておく
+class LocalServer:
+    def __init__(self):
+        self.routes: dict[str, Route] = {}
+        self.requests: list[tuple[str, str | None]] = []  # (path, Range)
+        self.lock = threading.Lock()
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with server.lock:
+                    server.requests.append((self.path, self.headers.get("Range")))
+                route = server.routes.get(self.path, Route(status=404))
+                server.respond(self, route)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def url(self, path: str) -> str:
+        return self.base_url + path
+
+    def respond(self, handler: BaseHTTPRequestHandler, route: Route):
+        body = route.body
+        status = route.status
+        headers = dict(route.headers)
+
+        range_header = handler.headers.get("Range")
+        if status == 200 and route.ranges and range_header is not None:
+            start = int(range_header.removeprefix("bytes=").split("-")[0])
+            if start >= len(body):
+                status, body = 416, b""
+                headers["Content-Range"] = f"bytes */{len(route.body)}"
+            else:
+                status, body = 206, body[start:]
+                headers["Content-Range"] = (
+                    f"bytes {start}-{len(route.body) - 1}/{len(route.body)}"
+                )
+
+        handler.send_response(status)
+        for name, value in headers.items():
+            handler.send_header(name, value)
+        if route.send_length:
+            handler.send_header("Content-Length", str(len(body)))
+        handler.end_headers()
+
+        if route.cut_after is not None:
+            body = body[: route.cut_after]
+            route.cut_after = None
+            handler.close_connection = True
+        handler.wfile.write(body)
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+# サイトごとの adapter.py は名前が同じなので、パスを指定して別の名前で読み込む
+def load_module(name: str, path: Path):
+    spec = importlib.util.spec_from_file_location(name, path)
+    assert spec is not None and spec.loader is not None
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
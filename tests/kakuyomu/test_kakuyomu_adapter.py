@@ -0,0 +1,175 @@
+from pathlib import Path
+
+import pyarrow as pa
+
+from helpers import load_module
+
+from common.adapter import Page, Ref
+from common.response_cache import CachedResponse
+
+kakuyomu_adapter = load_module(
+    "kakuyomu_adapter",
+    Path(__file__).resolve().parents[2] / "books" / "kakuyomu" / "adapter.py",
+)
+KakuyomuAdapter = kakuyomu_adapter.KakuyomuAdapter
+RECORD_SCHEMA = kakuyomu_adapter.RECORD_SCHEMA
+kakuyomu = kakuyomu_adapter.kakuyomu
+
+COMMENTS = """
+<html><body>
+<div class="widget-cheerComment" id="comment-100">
+  <div class="widget-cheerComment-inner">
+    <h5><a href="/users/reader">reader</a></h5>
+    <p class="widget-cheerComment-episodeTitle"><a href="/works/1/episodes/10">第1話</a></p>
+    <time datetime="2024-01-01T00:00:00Z"></time>
+    <div class="widget-cheerComment-body"><p class="js-vertical-composition-item">面白い</p></div>
+  </div>
+  <div class="widget-cheerComment-reply">
+    <p class="widget-cheerComment-buttons">
+      <a class="widget-cheerComment-buttons-author" href="/users/author">author</a>
+      <span><span>2024年1月2日</span></span>
+    </p>
+    <div class="widget-cheerComment-body"><p class="js-vertical-composition-item">ありがとう</p></div>
+  </div>
+</div>
+</body></html>
+"""
+
+REVIEWS = """
+<html><body><div id="workReview-list">
+  <article><h4><span><a href="/works/1/reviews/200">おすすめ</a></span></h4></article>
+</div></body></html>
+"""
+
+ACCESSES = """
+<html><body>
+<span id="workStatsCount-label">1,234</span>
+<table id="episodeStats-table"><tbody>
+  <tr>
+    <td class="episodeTitle"><a href="/works/1/episodes/10">第1話</a></td>
+    <td class="barCheerCount"><span>5</span></td>
+    <td class="barCount"><span class="barCount-label">1,000</span></td>
+  </tr>
+  <tr>
+    <td class="episodeTitle"><a href="/works/1/episodes/11">第2話</a></td>
+    <td class="barCount"><span class="barCount-label">234</span></td>
+  </tr>
+</tbody></table>
+</body></html>
+"""
+
+
+def html_page(url: str, html: str) -> Page:
+    return Page(CachedResponse(url, 200, {}, html.encode("utf-8")), from_cache=False)
+
+
+def ref(kind: str, url: str, page: int | None = None) -> Ref:
+    payload = {"kind": kind, "work_id": "1"}
+    if page is not None:
+        payload["page"] = page
+    return Ref(url=url, payload=payload)
+
+
+# どの種類のレコードも、schema にない列を持たない
+def check_schema(records: list[dict]):
+    for record in records:
+        assert set(record) <= set(RECORD_SCHEMA.names)
+    pa.Table.from_pylist(records, schema=RECORD_SCHEMA)
+
+
+def test_comment_pages_are_items_and_continue_to_the_next_page():
+    adapter = KakuyomuAdapter()
+    url = kakuyomu.compose_comment_url("1", 1)
+
+    listing = adapter.parse_listing(html_page(url, COMMENTS), ref("comments", url, 1))
+
+    assert [item.url for item in listing.items] == [url]
+    assert [next.url for next in listing.listings] == [
+        kakuyomu.compose_comment_url("1", 2)
+    ]
+    assert listing.listings[0].payload["page"] == 2
+
+
+def test_empty_comment_page_ends_the_listing():
+    adapter = KakuyomuAdapter()
+    url = kakuyomu.compose_comment_url("1", 3)
+
+    listing = adapter.parse_listing(
+        html_page(url, "<html></html>"), ref("comments", url, 3)
+    )
+
+    assert listing.items == []
+    assert listing.listings == []
+
+
+def test_comments_become_records():
+    adapter = KakuyomuAdapter()
+    url = kakuyomu.compose_comment_url("1", 1)
+
+    records = adapter.parse_item(html_page(url, COMMENTS), ref("comments", url, 1))
+
+    check_schema(records)
+    assert [
+        (r["kind"], r["comment_id"], r["user_id"], r["reply_to"]) for r in records
+    ] == [
+        ("comment", "100", "reader", None),
+        ("comment", "100-reply", "author", "100"),
+    ]
+    assert records[0]["episode_id"] == "10"
+    assert records[0]["body"] == "面白い"
+
+
+def test_reviews_become_records():
+    adapter = KakuyomuAdapter()
+    url = kakuyomu.compose_review_url("1", 1)
+
+    records = adapter.parse_item(html_page(url, REVIEWS), ref("reviews", url, 1))
+
+    check_schema(records)
+    assert records == [
+        {
+            "kind": "review",
+            "work_id": "1",
+            "review_url": "/works/1/reviews/200",
+            "is_spoiler": False,
+        }
+    ]
+
+
+def test_accesses_become_records():
+    adapter = KakuyomuAdapter()
+    url = kakuyomu.compose_access_url("1")
+
+    records = adapter.parse_item(html_page(url, ACCESSES), ref("access", url))
+
+    check_schema(records)
+    assert [(r["episode_id"], r["pv"], r["likes"]) for r in records] == [
+        ("10", 1000, 5),
+        ("11", 234, 0),
+    ]
+    assert all(r["total_pv"] == 1234 for r in records)
+
+
+def test_duplicate_pages_become_reference_records():
+    adapter = KakuyomuAdapter()
+    url = kakuyomu.compose_comment_url("1", 2)
+
+    record = adapter.duplicate_record(ref("comments", url, 2), "https://example.com")
+
+    check_schema([record])
+    assert record == {
+        "kind": "duplicate",
+        "work_id": "1",
+        "url": url,
+        "duplicate_of": "https://example.com",
+    }
+
+
+def test_only_search_results_are_refreshed():
+    adapter = KakuyomuAdapter()
+
+    assert adapter.refresh_listing(adapter.listings()[0])
+    assert not adapter.refresh_listing(ref("work", kakuyomu.compose_work_url("1")))
+    assert not adapter.refresh_listing(
+        ref("comments", kakuyomu.compose_comment_url("1", 1), 1)
+    )
@@ -0,0 +1,310 @@
+import json
+
+import pytest
+from tqdm import tqdm
+
+import novel_work
+from common.dead_letter import DeadLetterQueue
+from novel_work import (
+    CachedMetadata,
+    WorkInfoCache,
+    make_url_pair,
+    retrive_all_episodes_from_cache,
+    retrive_episodes,
+    retrive_prioritized_works,
+    retry_work_dead_letters,
+    save_cache,
+    save_works,
+)
+from priority import CrawlBudget
+from retriver.metadata import CachedChapter, CachedEpisode, CachedInformation
+from snapshot import PreviousSnapshot
+from utils import Access, Episode
+
+
+def make_cache(id: str, stars: int, number_of_episodes: int) -> WorkInfoCache:
+    return WorkInfoCache(
+        id=id,
+        metadata=CachedMetadata(
+            title=f"作品 {id}",
+            author_name="作者",
+            author_id="author",
+            stars=stars,
+            catchphrase=None,
+            introduction=None,
+            info=CachedInformation(
+                is_ended=True,
+                number_of_episodes=number_of_episodes,
+                type="original",
+                genre="fantasy",
+                self_ratings=[],
+                tags=[],
+                derivative_original_work=None,
+                total_characters=1000,
+                published_at="2023-01-01",
+                updated_at="2023-01-01",
+                number_of_reviews=0,
+                number_of_comments=0,
+                number_of_follows=0,
+            ),
+            chapters=[
+                CachedChapter(
+                    title=None,
+                    episodes=[
+                        CachedEpisode(
+                            id=f"{id}-{i}", title=f"第{i}話", published_at="2023-01-01"
+                        )
+                        for i in range(1, number_of_episodes + 1)
+                    ],
+                )
+            ],
+        ),
+        accesses=Access(total_pv=0, episodes=[]),
+        reviews=[],
+        comments=[],
+    )
+
+
+@pytest.fixture
+def fetched(monkeypatch):
+    urls: list[str] = []
+
+    def fetch_html(url: str):
+        if novel_work.budget_tracker is not None:
+            if not novel_work.budget_tracker.acquire():
+                raise novel_work.BudgetExhausted(url)
+        urls.append(url)
+        return f"<p>{url}</p>"
+
+    monkeypatch.setattr(novel_work, "fetch_html", fetch_html)
+    monkeypatch.setattr(
+        novel_work.retriver.episode, "get_body", lambda soup: f"本文 {soup.text}"
+    )
+    return urls
+
+
+def test_max_episodes_counts_only_fetched_episodes(fetched):
+    cache = make_cache("1", stars=0, number_of_episodes=4)
+    previous = {
+        "1-1": Episode(
+            id="1-1", index=1, title="第1話", published_at="2023-01-01", body="前回"
+        )
+    }
+
+    chapters, stopped = retrive_episodes(
+        "1", cache.metadata.chapters, previous, max_episodes=2
+    )
+
+    assert stopped
+    assert [e.id for e in chapters[0].episodes] == ["1-1", "1-2", "1-3"]
+    assert chapters[0].episodes[0].body == "前回"
+    assert len(fetched) == 2
+
+
+def test_complete_works_are_not_partial(fetched):
+    cache = make_cache("1", stars=0, number_of_episodes=2)
+
+    chapters, stopped = retrive_episodes("1", cache.metadata.chapters)
+
+    assert not stopped
+    assert len(chapters[0].episodes) == 2
+
+
+@pytest.fixture
+def crawl(tmp_path, monkeypatch, fetched):
+    output_path = tmp_path / "novel_work"
+    cache_path = tmp_path / "cache"
+    output_path.mkdir()
+    cache_path.mkdir()
+    monkeypatch.setattr(novel_work, "OUTPUT_PATH", str(output_path))
+    monkeypatch.setattr(novel_work, "CACHE_PATH", str(cache_path))
+    monkeypatch.setattr(
+        novel_work, "COVERAGE_FILE_NAME", str(output_path / "coverage.json")
+    )
+    monkeypatch.setattr(
+        novel_work, "CACHE_FILE_NAME", lambda i: str(cache_path / f"cache_{i}.json")
+    )
+    monkeypatch.setattr(
+        novel_work,
+        "OUTPUT_FILE_NAME",
+        lambda i: str(output_path / f"novel_work_{i}.json"),
+    )
+    monkeypatch.setattr(novel_work, "NUMBER_OF_THREADS", 1)
+    monkeypatch.setattr(novel_work, "budget_tracker", None)
+    monkeypatch.setattr(novel_work, "saved_works", None)
+
+    save_cache([make_cache("low", stars=1, number_of_episodes=1)], 0)
+    save_cache([make_cache("high", stars=100, number_of_episodes=3)], 1)
+    return output_path
+
+
+def saved(output_path) -> dict[str, dict]:
+    works = {}
+    for path in sorted(output_path.glob("novel_work_*.json")):
+        for data in json.loads(path.read_text(encoding="utf-8")):
+            assert data["id"] not in works  # 同じ作品は 1 つだけ
+            works[data["id"]] = data
+    return works
+
+
+def test_resumes_partial_works_on_the_next_run(crawl, fetched):
+    budget = CrawlBudget(max_episodes_per_work=2)
+
+    retrive_prioritized_works(budget)
+    works = saved(crawl)
+    assert works["high"]["is_partial"]
+    assert len(works["high"]["chapters"][0]["episodes"]) == 2
+    assert not works["low"]["is_partial"]
+    assert len(fetched) == 3
+
+    # 途中までの作品だけを、取得済みのエピソードを流用して続きから取得する
+    retrive_prioritized_works(budget)
+    works = saved(crawl)
+    assert not works["high"]["is_partial"]
+    assert [e["id"] for e in works["high"]["chapters"][0]["episodes"]] == [
+        "high-1",
+        "high-2",
+        "high-3",
+    ]
+    assert len(fetched) == 4
+    assert fetched[-1].endswith("/episodes/high-3")
+
+    retrive_prioritized_works(budget)
+    assert len(fetched) == 4
+
+
+def test_budget_exhaustion_marks_the_work_partial(crawl, fetched):
+    retrive_prioritized_works(CrawlBudget(max_requests=2))
+
+    works = saved(crawl)
+    assert list(works) == ["high"]
+    assert works["high"]["is_partial"]
+
+    coverage = json.loads((crawl / "coverage.json").read_text(encoding="utf-8"))
+    assert coverage["works"][0]["is_partial"]
+    assert coverage["number_of_skipped_works"] == 1
+
+
+def test_previous_snapshot_does_not_reuse_partial_works(crawl):
+    retrive_prioritized_works(CrawlBudget(max_episodes_per_work=1))
+    snapshot = PreviousSnapshot(str(crawl))
+
+    assert snapshot.version("high").is_partial
+    assert snapshot.unchanged_chapters("high", "2023-01-01") is None
+    assert snapshot.unchanged_chapters("low", "2023-01-01") is not None
+
+
+@pytest.fixture
+def dead_letters(tmp_path, monkeypatch):
+    queue = DeadLetterQueue(tmp_path / "dead_letter.jsonl")
+    monkeypatch.setattr(novel_work, "dead_letters", queue)
+    return queue
+
+
+def test_episode_dead_letters_keep_the_raw_html(fetched, dead_letters, monkeypatch):
+    def get_body(soup):
+        raise ValueError("no body")
+
+    monkeypatch.setattr(novel_work.retriver.episode, "get_body", get_body)
+    cache = make_cache("1", stars=0, number_of_episodes=1)
+
+    retrive_episodes("1", cache.metadata.chapters)
+
+    [letter] = dead_letters.pending("episode")
+    assert letter.response == "<p>https://kakuyomu.jp/works/1/episodes/1-1</p>"
+
+
+def test_failed_works_go_to_the_dead_letter_queue(fetched, dead_letters):
+    broken = make_cache("broken", stars=0, number_of_episodes=1)
+    broken.metadata.info.self_ratings = ["不明"]  # parse_rating で失敗する
+    caches = [broken, make_cache("ok", stars=0, number_of_episodes=1)]
+
+    with tqdm(total=2) as pbar:
+        works = retrive_all_episodes_from_cache(caches, pbar, {"broken": 3, "ok": 3})
+
+    assert [work.id for work in works] == ["ok"]
+    [letter] = dead_letters.pending("work")
+    assert letter.key == "broken"
+    assert letter.context["chunk"] == 3
+    assert letter.context["url_pair"]["metadata"] == "https://kakuyomu.jp/works/broken"
+    # ページを取得する前に失敗したので、もとにしたキャッシュを残す
+    assert letter.url == "https://kakuyomu.jp/works/broken"
+    assert WorkInfoCache.model_validate_json(letter.response) == broken
+
+
+def test_failed_works_keep_the_last_fetched_page(fetched, dead_letters, monkeypatch):
+    def retrive_episodes(work_id, chapters, previous, max_episodes, pages):
+        pages["https://kakuyomu.jp/works/1/episodes/1-1"] = "<p>episode</p>"
+        raise ValueError("broken")
+
+    monkeypatch.setattr(novel_work, "retrive_episodes", retrive_episodes)
+
+    with tqdm(total=1) as pbar:
+        retrive_all_episodes_from_cache(
+            [make_cache("1", stars=0, number_of_episodes=1)], pbar, {"1": 0}
+        )
+
+    [letter] = dead_letters.pending("work")
+    assert letter.url == "https://kakuyomu.jp/works/1/episodes/1-1"
+    assert letter.response == "<p>episode</p>"
+
+
+@pytest.fixture
+def retried(crawl, dead_letters, monkeypatch):
+    monkeypatch.setattr(novel_work, "CRAWL_BUDGET", None)
+    monkeypatch.setattr(
+        novel_work,
+        "retrive_work_cache",
+        lambda url_pair, pages: make_cache(url_pair.work_id, 0, 1),
+    )
+    dead_letters.push(
+        "work",
+        "new",
+        "https://kakuyomu.jp/works/new",
+        ValueError("broken"),
+        context={"chunk": 0, "url_pair": make_url_pair("new").model_dump()},
+    )
+    return dead_letters.pending("work")
+
+
+def test_retried_works_in_consumed_chunks_go_straight_to_episodes(
+    crawl, retried, fetched, dead_letters
+):
+    save_works([], 0)  # cache_0 はもう novel_work_0 になっている
+
+    retry_work_dead_letters(retried)
+
+    assert list(saved(crawl)) == ["new"]
+    assert fetched == ["https://kakuyomu.jp/works/new/episodes/new-1"]
+    cache = json.loads((crawl.parent / "cache" / "cache_0.json").read_text("utf-8"))
+    assert [data["id"] for data in cache] == ["low"]
+    assert dead_letters.pending() == []
+
+
+def test_retried_works_in_pending_chunks_go_to_the_cache(
+    crawl, retried, fetched, dead_letters
+):
+    retry_work_dead_letters(retried)
+
+    cache = json.loads((crawl.parent / "cache" / "cache_0.json").read_text("utf-8"))
+    assert [data["id"] for data in cache] == ["low", "new"]
+    assert fetched == []
+    assert dead_letters.pending() == []
+
+
+def test_retried_works_that_fail_again_stay_in_the_queue(
+    crawl, retried, fetched, dead_letters, monkeypatch
+):
+    save_works([], 0)
+
+    def retrive_novel_work(cache, pages):
+        raise ValueError("still broken")
+
+    monkeypatch.setattr(novel_work, "retrive_novel_work", retrive_novel_work)
+
+    retry_work_dead_letters(retried)
+
+    [letter] = dead_letters.pending("work")
+    assert letter.attempt == 2
+    assert letter.response is not None
+    assert saved(crawl) == {}
@@ -0,0 +1,49 @@
+import threading
+
+from priority import BudgetTracker, CrawlBudget, ScoreWeights, work_score
+
+
+def test_work_score_prefers_more_popular_works():
+    weights = ScoreWeights()
+    low = work_score(weights, stars=1, total_pv=10, followers=1, total_characters=100)
+    high = work_score(
+        weights, stars=100, total_pv=10000, followers=50, total_characters=100
+    )
+
+    assert work_score(weights, 0, 0, 0, 0) == 0
+    assert high > low > 0
+
+
+def test_budget_tracker_stops_at_max_requests():
+    tracker = BudgetTracker(CrawlBudget(max_requests=100))
+    acquired = []
+
+    def acquire():
+        for _ in range(50):
+            acquired.append(tracker.acquire())
+
+    threads = [threading.Thread(target=acquire) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert acquired.count(True) == 100
+    assert tracker.exhausted
+
+
+def test_budget_tracker_stops_at_max_bytes():
+    tracker = BudgetTracker(CrawlBudget(max_bytes=1000))
+
+    assert tracker.acquire()
+    tracker.record_bytes(1000)
+    assert tracker.exhausted
+    assert not tracker.acquire()
+
+
+def test_unlimited_budget():
+    tracker = BudgetTracker(CrawlBudget())
+    tracker.record_bytes(10**12)
+
+    assert all(tracker.acquire() for _ in range(1000))
+    assert not tracker.exhausted
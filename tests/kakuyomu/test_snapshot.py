@@ -0,0 +1,198 @@
+import json
+
+import pytest
+
+import novel_work
+import snapshot
+from novel_work import retrive_comments
+from retriver.comments import CachedComment
+from snapshot import PreviousSnapshot, scan_works
+from utils import Access, Chapter, Comment, Episode, Metadata, NovelWork
+
+
+def make_work(
+    id: str,
+    updated_at: str = "2023-01-01",
+    comments: list[Comment] = [],
+    title: str = "タイトル",
+) -> NovelWork:
+    return NovelWork(
+        id=id,
+        metadata=Metadata(
+            title=title,
+            author_id="author",
+            author_name="作者",
+            stars=0,
+            catchphrase=None,
+            introduction=None,
+            type="original",
+            genre="fantasy",
+            tags=[],
+            derivative_original_work_id=None,
+            total_characters=0,
+            self_ratings=[],
+            is_ended=False,
+            published_at="2023-01-01",
+            updated_at=updated_at,
+        ),
+        number_of_episodes=1,
+        chapters=[
+            Chapter(
+                title=None,
+                episodes=[
+                    Episode(
+                        id=f"{id}-1",
+                        index=1,
+                        title="第一話",
+                        published_at="2023-01-01",
+                        body=f"本文 {id}",
+                    )
+                ],
+            )
+        ],
+        number_of_reviews=0,
+        reviews=[],
+        number_of_comments=len(comments),
+        comments=comments,
+        number_of_followers=0,
+        access=Access(total_pv=0, episodes=[]),
+    )
+
+
+def comment(id: str) -> Comment:
+    return Comment(
+        id=id,
+        episode_id="1",
+        user_id="user",
+        is_author=False,
+        body=f"コメント {id}",
+        published_at="2023-01-01",
+    )
+
+
+def save(path, works: list[NovelWork]):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump([w.model_dump() for w in works], f, indent=2, ensure_ascii=False)
+
+
+def test_scan_works_returns_byte_offsets(tmp_path):
+    path = tmp_path / "novel_work_0.json"
+    save(path, [make_work("1", title="日本語"), make_work("2")])
+    raw = path.read_bytes()
+
+    scanned = list(scan_works(str(path)))
+
+    assert [data["id"] for data, _, _ in scanned] == ["1", "2"]
+    for data, offset, length in scanned:
+        assert json.loads(raw[offset : offset + length]) == data
+
+
+# 小さく分けて読んでも、文字列の中の括弧やエスケープ、分かれた多バイト文字で崩れない
+@pytest.mark.parametrize("chunk_size", [1, 7, 64])
+def test_scan_works_reads_in_chunks(tmp_path, monkeypatch, chunk_size):
+    monkeypatch.setattr(snapshot, "SCAN_CHUNK_SIZE", chunk_size)
+    path = tmp_path / "novel_work_0.json"
+    save(
+        path,
+        [
+            make_work("1", title='括弧 } ] [ { と "引用" と \\ と\n改行'),
+            make_work("2", title="\\"),
+            make_work("3"),
+        ],
+    )
+    raw = path.read_bytes()
+
+    scanned = list(scan_works(str(path)))
+
+    assert [data["id"] for data, _, _ in scanned] == ["1", "2", "3"]
+    for data, offset, length in scanned:
+        assert json.loads(raw[offset : offset + length]) == data
+
+
+def test_scan_works_handles_empty_files(tmp_path):
+    path = tmp_path / "novel_work_0.json"
+    save(path, [])
+
+    assert list(scan_works(str(path))) == []
+
+
+def test_loads_works_lazily(tmp_path):
+    save(tmp_path / "novel_work_0.json", [make_work("1"), make_work("2")])
+    save(tmp_path / "novel_work_1.json", [make_work("3", updated_at="2023-02-01")])
+    (tmp_path / "coverage.json").write_text("{}")
+
+    snapshot = PreviousSnapshot(str(tmp_path), max_loaded_works=1)
+
+    assert "3" in snapshot and "4" not in snapshot
+    assert snapshot.loaded_works == {}
+    assert snapshot.previous_episodes("2")["2-1"].body == "本文 2"
+    assert snapshot.previous_episodes("3")["3-1"].body == "本文 3"
+    assert list(snapshot.loaded_works) == ["3"]
+
+
+def test_unchanged_chapters_compares_updated_at(tmp_path):
+    save(tmp_path / "novel_work_0.json", [make_work("1", updated_at="2023-01-01")])
+    snapshot = PreviousSnapshot(str(tmp_path))
+
+    chapters = snapshot.unchanged_chapters("1", "2023-01-01")
+    assert chapters is not None and chapters[0].episodes[0].body == "本文 1"
+    assert snapshot.unchanged_chapters("1", "2023-03-01") is None
+    assert snapshot.unchanged_chapters("2", "2023-01-01") is None
+
+
+def cached(id: str) -> CachedComment:
+    return CachedComment(
+        id=id,
+        user_id="user",
+        target_episode_id="1",
+        body=f"new {id}",
+        published_at="2023-01-01",
+        reply_to=None,
+    )
+
+
+@pytest.fixture
+def comment_pages(tmp_path, monkeypatch):
+    save(
+        tmp_path / "novel_work_0.json",
+        [make_work("1", comments=[comment("3"), comment("2"), comment("1")])],
+    )
+    monkeypatch.setattr(
+        novel_work, "previous_snapshot", PreviousSnapshot(str(tmp_path))
+    )
+
+    # 新しい順に 2 件ずつ
+    pages = {1: [cached("5"), cached("4")], 2: [cached("3"), cached("2")], 3: []}
+    requested = []
+
+    def get_page_soup(url: str, pages: dict[str, str]):
+        page = int(url.split("page=")[-1])
+        requested.append(page)
+        return page
+
+    monkeypatch.setattr(novel_work, "get_page_soup", get_page_soup)
+    monkeypatch.setattr(novel_work, "extract_comment_urls", lambda page: pages[page])
+    return requested
+
+
+def test_reuses_comments_when_count_is_unchanged(comment_pages):
+    comments = retrive_comments("1", 3, {})
+
+    assert [c.id for c in comments] == ["3", "2", "1"]
+    assert comment_pages == []
+
+
+def test_fetches_only_new_comments(comment_pages):
+    comments = retrive_comments("1", 5, {})
+
+    assert [c.id for c in comments] == ["5", "4", "3", "2", "1"]
+    assert comments[2].body == "new 3"  # 取り直したページのほうを使う
+    assert comments[4].body == "コメント 1"
+    assert comment_pages == [1, 2]
+
+
+def test_refetches_all_comments_when_count_decreases(comment_pages):
+    comments = retrive_comments("1", 2, {})
+
+    assert [c.id for c in comments] == ["5", "4", "3", "2"]
+    assert comment_pages == [1, 2, 3]
@@ -0,0 +1,105 @@
+import pytest
+
+import work_list
+from work_list import DiscoveryState, discover_updated_works
+
+
+def url(id: str) -> str:
+    return f"https://kakuyomu.jp/works/{id}"
+
+
+@pytest.fixture
+def search(monkeypatch):
+    pages: dict[int, list[tuple[str, str | None]]] = {}
+    requested: list[int] = []
+
+    def get_soup(search_url: str):
+        page = int(search_url.split("page=")[-1])
+        requested.append(page)
+        return page
+
+    monkeypatch.setattr(work_list, "get_soup", get_soup)
+    monkeypatch.setattr(work_list, "is_no_result", lambda page: page not in pages)
+    monkeypatch.setattr(work_list, "extract_works", lambda page: pages[page])
+    return pages, requested
+
+
+def test_first_discovery_walks_all_pages(search):
+    pages, _ = search
+    pages[1] = [(url("3"), "2023-01-03"), (url("2"), "2023-01-03")]
+    pages[2] = [(url("1"), "2023-01-01")]
+    state = DiscoveryState()
+
+    assert discover_updated_works(state) == [url("3"), url("2"), url("1")]
+    assert state.last_episode_published_at == "2023-01-03"
+    assert state.urls_at_last == [url("3"), url("2")]
+
+
+def test_keeps_works_at_the_boundary_timestamp(search):
+    pages, requested = search
+    pages[1] = [
+        (url("4"), "2023-01-04"),
+        (url("3"), "2023-01-03"),  # 前回と同じ時刻で、前回は見ていない
+        (url("2"), "2023-01-03"),  # 前回見た
+    ]
+    pages[2] = [(url("1"), "2023-01-01")]
+    state = DiscoveryState(
+        last_episode_published_at="2023-01-03", urls_at_last=[url("2")]
+    )
+
+    assert discover_updated_works(state) == [url("4"), url("3")]
+    assert requested == [1, 2]
+    assert state.last_episode_published_at == "2023-01-04"
+    assert state.urls_at_last == [url("4")]
+
+
+def test_remembers_every_url_at_the_same_timestamp(search):
+    pages, _ = search
+    pages[1] = [(url("3"), "2023-01-03"), (url("1"), "2023-01-01")]
+    state = DiscoveryState(
+        last_episode_published_at="2023-01-03", urls_at_last=[url("2")]
+    )
+
+    assert discover_updated_works(state) == [url("3")]
+    assert state.urls_at_last == [url("2"), url("3")]
+
+
+def test_warns_when_max_page_stops_the_walk(search, monkeypatch, capsys):
+    pages, requested = search
+    monkeypatch.setattr(work_list, "MAX_PAGE", 2)
+    pages[1] = [(url("4"), "2023-01-04")]
+    pages[2] = [(url("3"), "2023-01-03")]
+    pages[3] = [(url("1"), "2023-01-01")]
+    state = DiscoveryState(last_episode_published_at="2023-01-01")
+
+    assert discover_updated_works(state) == [url("4"), url("3")]
+    assert requested == [1, 2]
+    assert "[WARNING] stopped at page 2" in capsys.readouterr().out
+
+
+def test_does_not_warn_when_reaching_the_last_discovery(search, capsys):
+    pages, _ = search
+    pages[1] = [(url("2"), "2023-01-02"), (url("1"), "2023-01-01")]
+    state = DiscoveryState(last_episode_published_at="2023-01-02")
+
+    assert discover_updated_works(state) == [url("2")]
+    assert "[WARNING]" not in capsys.readouterr().out
+
+
+def test_url_list_has_only_this_search(search, monkeypatch, tmp_path):
+    pages, _ = search
+    pages[1] = [(url("2"), None), (url("1"), None)]
+    pages[2] = [(url("1"), None), (url("3"), None)]
+    monkeypatch.setattr(
+        work_list, "extract_urls", lambda page: [u for u, _ in pages[page]]
+    )
+    monkeypatch.setattr(work_list, "search_conditions", work_list.search_conditions[:1])
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "work_list").mkdir()
+
+    # 前回までの実行で frontier に入っている作品は書かない
+    work_list.Frontier(work_list.FRONTIER_PATH).add_many([url("old")])
+    work_list.main()
+
+    with open("work_list/urls.txt", encoding="utf-8") as f:
+        assert f.read().splitlines() == [url("2"), url("1"), url("3")]
@@ -0,0 +1,133 @@
+import gzip
+import json
+from pathlib import Path
+
+from helpers import load_module
+
+from common.adapter import Page, Ref
+from common.content_hash import ContentIndex
+from common.response_cache import CachedResponse
+
+from archtag import ArchtagState, TagState, compose_archtag_url, is_known
+from article import extract_article
+
+nhk_adapter = load_module(
+    "nhk_adapter",
+    Path(__file__).resolve().parents[2] / "news" / "nhk" / "adapter.py",
+)
+
+ARTICLE = """
+<html><head><meta charset="shift_jis"></head><body>
+<header>ヘッダー</header>
+<p class="content--summary">要約です</p>
+<div class="content--detail-more"><p>本文</p><p>続き</p></div>
+</body></html>
+"""
+
+
+def item(id: str, pub_date: str) -> dict:
+    return {"id": id, "pubDate": pub_date, "link": f"/news/html/{id}.html"}
+
+
+def json_page(url: str, items: list[dict]) -> Page:
+    content = json.dumps({"channel": {"item": items}}).encode()
+    return Page(CachedResponse(url, 200, {}, content), from_cache=False)
+
+
+def test_extract_article_decodes_declared_charset():
+    content = ARTICLE.encode("shift_jis")
+
+    article = extract_article(content, store_html=True)
+
+    assert article["summary"] == "要約です"
+    assert article["detail"] == "本文続き"
+    assert gzip.decompress(article["html_gzip"]) == content
+
+
+def test_extract_article_without_content():
+    article = extract_article(b"<html><body></body></html>")
+    assert article == {"summary": None, "detail": None}
+
+
+def test_is_known_stops_at_the_previous_newest_item():
+    state = TagState(newest_id="2", newest_pub_date="Mon, 04 Dec 2023 19:53:00 +0900")
+
+    assert not is_known(item("3", "Mon, 04 Dec 2023 20:00:00 +0900"), state)
+    assert is_known(item("2", "Mon, 04 Dec 2023 19:53:00 +0900"), state)
+    assert is_known(item("1", "Mon, 04 Dec 2023 10:00:00 +0900"), state)
+
+
+def test_adapter_stops_paging_at_known_items_and_advances_state():
+    state = ArchtagState(
+        tags={
+            "0000001": TagState(
+                newest_id="2", newest_pub_date="Mon, 04 Dec 2023 19:53:00 +0900"
+            )
+        }
+    )
+    adapter = nhk_adapter.NhkAdapter(["0000001", "0000001"], state=state)
+    assert len(adapter.listings()) == 1
+
+    ref = adapter.listings()[0]
+    listing = adapter.parse_listing(
+        json_page(
+            ref.url,
+            [
+                item("3", "Mon, 04 Dec 2023 20:00:00 +0900"),
+                item("2", "Mon, 04 Dec 2023 19:53:00 +0900"),
+            ],
+        ),
+        ref,
+    )
+
+    assert [ref.key for ref in listing.items] == ["/news/html/3.html"]
+    assert listing.listings == []
+    assert state.tags["0000001"].newest_id == "3"
+
+
+def test_adapter_pages_until_max_page_without_state():
+    adapter = nhk_adapter.NhkAdapter(["0000001"], max_page=2)
+    ref = adapter.listings()[0]
+
+    listing = adapter.parse_listing(json_page(ref.url, []), ref)
+    assert [next_ref.url for next_ref in listing.listings] == [
+        compose_archtag_url("0000001", 2)
+    ]
+
+    last = listing.listings[0]
+    assert adapter.parse_listing(json_page(last.url, []), last).listings == []
+
+
+def test_adapter_marks_same_text_as_duplicate(tmp_path):
+    adapter = nhk_adapter.NhkAdapter(
+        ["0000001"], content_index=ContentIndex(tmp_path / "contents.sqlite")
+    )
+    content = ARTICLE.encode("shift_jis")
+
+    def parse(url: str) -> dict:
+        page = Page(CachedResponse(url, 200, {}, content), from_cache=False)
+        return adapter.parse_item(page, Ref(url=url, payload={"link": url}))
+
+    first = parse("https://example.com/a")
+    second = parse("https://example.com/b")
+
+    assert first["duplicate_of"] is None
+    assert first["summary"] == "要約です"
+    assert second == {
+        "link": "https://example.com/b",
+        "summary": None,
+        "detail": None,
+        "duplicate_of": "https://example.com/a",
+    }
+
+
+def test_adapter_duplicate_record_has_the_article_columns():
+    adapter = nhk_adapter.NhkAdapter(["0000001"])
+    ref = Ref(url="https://example.com/b", payload={"link": "/b"})
+
+    assert adapter.duplicate_record(ref, "https://example.com/a") == {
+        "link": "/b",
+        "summary": None,
+        "detail": None,
+        "duplicate_of": "https://example.com/a",
+    }
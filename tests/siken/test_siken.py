@@ -0,0 +1,68 @@
+from siken import ParserStats, get_question_details, get_questions, parse_page
+
+QUESTION_PAGE = """
+<html><body>
+<div id="mondai">問題文</div>
+<div class="ansbg"><ul>
+  <li><span>選択肢ア</span></li>
+  <li><span>選択肢イ</span></li>
+  <li><span>選択肢ウ</span></li>
+  <li><span>選択肢エ</span></li>
+</ul></div>
+<span id="answerChar">ウ</span>
+<div id="kaisetsu">解説</div>
+</body></html>
+"""
+
+PAST_EXAM_PAGE = """
+<html><body>
+<table class="qtable">
+  <tr><th>No</th><th>論点</th><th>分類</th></tr>
+  <tr><td><a href="q1.html">問1</a></td><td>論点1</td><td>分類1</td><td><i class="ok"></i></td></tr>
+  <tr><td><a href="q2.html">問2</a></td><td>論点2</td><td>分類2</td><td></td></tr>
+</table>
+</body></html>
+"""
+
+
+def test_parse_page_uses_lxml_when_anchors_survive():
+    stats = ParserStats()
+    soup = parse_page(QUESTION_PAGE, "question", stats)
+
+    assert stats.report() == {"question": {"lxml": 1}}
+    assert get_question_details(soup) == {
+        "question_body": "問題文",
+        "choice_0": "選択肢ア",
+        "choice_1": "選択肢イ",
+        "choice_2": "選択肢ウ",
+        "choice_3": "選択肢エ",
+        "answer_num": 2,
+        "explanation": "解説",
+        "explanation_choice_0": None,
+        "explanation_choice_1": None,
+        "explanation_choice_2": None,
+        "explanation_choice_3": None,
+    }
+
+
+def test_parse_page_falls_back_to_html5lib():
+    stats = ParserStats()
+    parse_page("<html><body><p>no table</p></body></html>", "past_exam", stats)
+
+    assert stats.report() == {"past_exam": {"html5lib": 1}}
+
+
+def test_get_questions_keeps_only_explained_rows():
+    soup = parse_page(PAST_EXAM_PAGE, "past_exam")
+    questions = get_questions(
+        "https://www.ap-siken.com", "https://www.ap-siken.com/kakomon/", soup
+    )
+
+    assert questions == [
+        {
+            "base_url": "https://www.ap-siken.com",
+            "url": "https://www.ap-siken.com/kakomon/q1.html",
+            "title": "論点1",
+            "category": "分類1",
+        }
+    ]
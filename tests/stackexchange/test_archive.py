@@ -0,0 +1,84 @@
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+import archive
+from archive import SEVEN_ZIP_COMMANDS, find_7z, list_members, open_member
+
+has_7z = any(shutil.which(command) for command in SEVEN_ZIP_COMMANDS)
+requires_7z = pytest.mark.skipif(not has_7z, reason="7z command is not installed")
+
+
+def test_find_7z_explains_how_to_install(monkeypatch):
+    monkeypatch.setattr(archive.shutil, "which", lambda command: None)
+
+    with pytest.raises(Exception, match="p7zip"):
+        find_7z()
+
+
+@pytest.fixture
+def dump(tmp_path):
+    (tmp_path / "Posts.xml").write_bytes(b"<posts>" + b"<row />" * 10000 + b"</posts>")
+    (tmp_path / "Users.xml").write_bytes(b"<users></users>")
+    path = tmp_path / "site.7z"
+    subprocess.run(
+        [find_7z(), "a", str(path), "Posts.xml", "Users.xml"],
+        cwd=tmp_path,
+        check=True,
+        capture_output=True,
+    )
+    return path
+
+
+@requires_7z
+def test_list_members(dump):
+    assert sorted(list_members(dump)) == ["Posts.xml", "Users.xml"]
+
+
+@requires_7z
+def test_open_member_streams_without_extracting(dump):
+    with open_member(dump, "Users.xml") as file:
+        assert file.read() == b"<users></users>"
+
+
+@requires_7z
+def test_open_member_can_stop_early(dump):
+    with open_member(dump, "Posts.xml") as file:
+        assert file.read(7) == b"<posts>"
+
+
+@requires_7z
+def test_open_member_rejects_missing_member(dump):
+    with pytest.raises(Exception, match="not found"):
+        with open_member(dump, "Votes.xml"):
+            pass
+
+
+# 7z の代わりに、stdout を書き終える前に stderr へパイプの容量より多く書くコマンド
+@pytest.fixture
+def noisy_7z(tmp_path, monkeypatch):
+    script = tmp_path / "noisy_7z"
+    script.write_text(
+        f"#!{sys.executable}\n"
+        "import sys\n"
+        "sys.stderr.write('warning\\n' * 100000)\n"
+        "sys.stderr.flush()\n"
+        "sys.stdout.buffer.write(b'x' * 100000)\n"
+        "sys.exit(int(sys.argv[-1] == 'broken'))\n"
+    )
+    script.chmod(0o755)
+    monkeypatch.setattr(archive, "find_7z", lambda: str(script))
+    monkeypatch.setattr(archive, "list_members", lambda path: ["Posts.xml", "broken"])
+
+
+def test_open_member_does_not_block_on_stderr(noisy_7z, tmp_path):
+    with open_member(tmp_path / "site.7z", "Posts.xml") as f:
+        assert len(f.read()) == 100000
+
+
+def test_open_member_reports_stderr_on_failure(noisy_7z, tmp_path):
+    with pytest.raises(Exception, match="warning"):
+        with open_member(tmp_path / "site.7z", "broken") as f:
+            f.read()
@@ -0,0 +1,59 @@
+import os
+
+from build import (
+    DumpSignature,
+    dump_signature,
+    is_up_to_date,
+    output_paths,
+    save_signature,
+)
+from download import RemoteFile
+
+
+def write_outputs(output_dir, domain):
+    for path in output_paths(output_dir, domain):
+        path.write_bytes(b"")
+
+
+def test_rebuilds_when_remote_md5_changes(tmp_path):
+    write_outputs(tmp_path, "site")
+    files = {"site.7z": RemoteFile(name="site.7z", size=10, md5="a" * 32)}
+    save_signature(tmp_path, "site", dump_signature("site", str(tmp_path), files))
+
+    assert is_up_to_date(tmp_path, "site", dump_signature("site", str(tmp_path), files))
+
+    files["site.7z"] = RemoteFile(name="site.7z", size=10, md5="b" * 32)
+    assert not is_up_to_date(
+        tmp_path, "site", dump_signature("site", str(tmp_path), files)
+    )
+
+
+def test_compares_local_dump_without_metadata(tmp_path):
+    dump = tmp_path / "site.7z"
+    dump.write_bytes(b"dump")
+    write_outputs(tmp_path, "site")
+    save_signature(tmp_path, "site", dump_signature("site", str(tmp_path), {}))
+
+    assert is_up_to_date(tmp_path, "site", dump_signature("site", str(tmp_path), {}))
+
+    dump.write_bytes(b"new dump")
+    os.utime(dump, (0, dump.stat().st_mtime + 10))
+    assert not is_up_to_date(
+        tmp_path, "site", dump_signature("site", str(tmp_path), {})
+    )
+
+
+def test_rebuilds_outputs_without_signature(tmp_path):
+    write_outputs(tmp_path, "site")
+
+    assert not is_up_to_date(tmp_path, "site", DumpSignature(size=1, md5="a"))
+
+
+def test_rebuilds_missing_outputs(tmp_path):
+    save_signature(tmp_path, "site", DumpSignature(size=1, md5="a"))
+
+    assert not is_up_to_date(tmp_path, "site", DumpSignature(size=1, md5="a"))
+
+
+def test_unknown_dump_never_matches():
+    assert not DumpSignature().matches(DumpSignature())
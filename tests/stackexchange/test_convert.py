@@ -0,0 +1,32 @@
+import pytest
+
+from convert import batched, convert_htmls
+
+HTMLS = [f"<p>post <b>{i}</b></p><pre><code>x = {i}</code></pre>" for i in range(20)]
+
+
+def test_batched():
+    assert list(batched(range(5), 2)) == [[0, 1], [2, 3], [4]]
+
+
+@pytest.mark.parametrize("num_workers", [1, 2])
+def test_convert_htmls_keeps_input_order(num_workers):
+    converted = list(convert_htmls(HTMLS, num_workers=num_workers, batch_size=3))
+
+    assert len(converted) == len(HTMLS)
+    for i, markdown in enumerate(converted):
+        assert f"post **{i}**" in markdown
+        assert f"x = {i}" in markdown
+
+
+def test_convert_htmls_reads_input_lazily():
+    consumed = []
+
+    def htmls():
+        for i, html in enumerate(HTMLS):
+            consumed.append(i)
+            yield html
+
+    converted = convert_htmls(htmls(), num_workers=1)
+    next(converted)
+    assert consumed == [0]
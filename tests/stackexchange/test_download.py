@@ -0,0 +1,119 @@
+import hashlib
+
+import pytest
+from helpers import Route
+
+import download
+from download import RemoteFile, download_archive, download_file
+
+DUMP = bytes(range(256)) * 64  # 16 KiB
+
+
+def remote(body: bytes = DUMP) -> RemoteFile:
+    return RemoteFile(name="site.7z", size=len(body), md5=hashlib.md5(body).hexdigest())
+
+
+def test_downloads_and_verifies(server, tmp_path):
+    server.routes["/site.7z"] = Route(DUMP)
+    path = tmp_path / "site.7z"
+
+    download_file(server.url("/site.7z"), path, remote(), retry_delay=0)
+
+    assert path.read_bytes() == DUMP
+    assert not path.with_name("site.7z.part").exists()
+
+
+def test_resumes_existing_part_file_with_range(server, tmp_path):
+    server.routes["/site.7z"] = Route(DUMP)
+    path = tmp_path / "site.7z"
+    path.with_name("site.7z.part").write_bytes(DUMP[:1000])
+
+    download_file(server.url("/site.7z"), path, remote(), retry_delay=0)
+
+    assert path.read_bytes() == DUMP
+    assert server.requests == [("/site.7z", "bytes=1000-")]
+
+
+def test_resumes_after_connection_is_cut(server, tmp_path, monkeypatch):
+    # 読み終えたチャンクまでは .part に残る
+    monkeypatch.setattr(download, "CHUNK_SIZE", 1000)
+    server.routes["/site.7z"] = Route(DUMP, cut_after=5000)
+    path = tmp_path / "site.7z"
+
+    download_file(server.url("/site.7z"), path, remote(), retry_delay=0)
+
+    assert path.read_bytes() == DUMP
+    assert server.requests == [("/site.7z", None), ("/site.7z", "bytes=5000-")]
+
+
+def test_resumes_after_clean_but_short_stream(server, tmp_path):
+    # Content-Length がないので、切れても正常に終わったように見える
+    server.routes["/site.7z"] = Route(DUMP, send_length=False, cut_after=5000)
+    path = tmp_path / "site.7z"
+
+    download_file(server.url("/site.7z"), path, remote(), retry_delay=0)
+
+    assert path.read_bytes() == DUMP
+    assert server.requests == [("/site.7z", None), ("/site.7z", "bytes=5000-")]
+
+
+def test_keeps_short_part_file_when_retries_run_out(server, tmp_path):
+    server.routes["/site.7z"] = Route(DUMP, send_length=False, ranges=False)
+    path = tmp_path / "site.7z"
+    expected = RemoteFile(name="site.7z", size=len(DUMP) * 2)
+
+    with pytest.raises(Exception, match="Max retry exceeded"):
+        download_file(
+            server.url("/site.7z"), path, expected, max_retry=2, retry_delay=0
+        )
+
+    assert path.with_name("site.7z.part").stat().st_size == len(DUMP)
+    assert not path.exists()
+
+
+def test_fails_fast_on_client_errors(server, tmp_path):
+    server.routes["/site.7z"] = Route(status=403)
+    path = tmp_path / "site.7z"
+    path.with_name("site.7z.part").write_bytes(DUMP[:1000])
+
+    with pytest.raises(Exception, match="403"):
+        download_file(server.url("/site.7z"), path, remote(), retry_delay=0)
+
+    assert len(server.requests) == 1
+    assert path.with_name("site.7z.part").read_bytes() == DUMP[:1000]
+
+
+def test_discards_part_file_with_wrong_md5(server, tmp_path):
+    server.routes["/site.7z"] = Route(DUMP)
+    path = tmp_path / "site.7z"
+    expected = RemoteFile(name="site.7z", size=len(DUMP), md5="0" * 32)
+
+    with pytest.raises(Exception, match="MD5 mismatch"):
+        download_file(server.url("/site.7z"), path, expected, retry_delay=0)
+
+    assert not path.with_name("site.7z.part").exists()
+
+
+def test_download_archive_skips_complete_files(server, tmp_path):
+    server.routes["/example.stackexchange.com.7z"] = Route(DUMP)
+    files = {"example.stackexchange.com.7z": remote()}
+
+    first = download_archive(
+        "example.stackexchange.com", tmp_path, "7z", files, base_url=server.base_url
+    )
+    second = download_archive(
+        "example.stackexchange.com", tmp_path, "7z", files, base_url=server.base_url
+    )
+
+    assert first.error is None and not first.skipped
+    assert second.skipped
+    assert len(server.requests) == 1
+
+
+def test_download_archive_reports_missing_dump(server, tmp_path):
+    result = download_archive(
+        "missing.stackexchange.com", tmp_path, "7z", base_url=server.base_url
+    )
+
+    assert result.error is not None
+    assert len(server.requests) == 1
@@ -0,0 +1,88 @@
+import os
+
+import pyarrow as pa
+
+from enrich import EnrichIndex, enrich_posts
+from posts import StackExchange
+
+USERS_XML = b"""<users>
+  <row Id="1" Reputation="100" />
+  <row Id="2" Reputation="5" />
+</users>"""
+
+VOTES_XML = b"""<votes>
+  <row Id="1" PostId="10" VoteTypeId="2" />
+  <row Id="2" PostId="10" VoteTypeId="2" />
+  <row Id="3" PostId="10" VoteTypeId="3" />
+  <row Id="4" PostId="11" VoteTypeId="5" />
+</votes>"""
+
+COMMENTS_XML = b"""<comments>
+  <row Id="1" PostId="10" Score="1" Text="first" UserId="2" />
+  <row Id="2" PostId="10" Score="3" Text="best" />
+  <row Id="3" PostId="10" Score="1" Text="second" UserId="1" />
+</comments>"""
+
+
+def make_site(tmp_path) -> StackExchange:
+    (tmp_path / "example").mkdir(exist_ok=True)
+    for name, body in [
+        ("Users", USERS_XML),
+        ("Votes", VOTES_XML),
+        ("Comments", COMMENTS_XML),
+    ]:
+        (tmp_path / "example" / f"{name}.xml").write_bytes(body)
+    return StackExchange(directory=str(tmp_path), site="example")
+
+
+def test_enrich_posts(tmp_path):
+    index = EnrichIndex(tmp_path / "enrich.sqlite")
+    index.load_site(make_site(tmp_path))
+
+    posts = pa.table({"id": ["10", "11", "12"], "owner_user_id": ["1", None, "404"]})
+    rows = enrich_posts(posts, index, num_comments=2, batch_size=2).to_pylist()
+    index.close()
+
+    assert [row["owner_reputation"] for row in rows] == [100, None, None]
+    assert [(row["up_votes"], row["down_votes"]) for row in rows] == [
+        (2, 1),
+        (0, 0),
+        (0, 0),
+    ]
+    assert [c["text"] for c in rows[0]["top_comments"]] == ["best", "first"]
+    assert rows[1]["top_comments"] == []
+
+
+def test_enrich_posts_keeps_empty_tables(tmp_path):
+    index = EnrichIndex(tmp_path / "enrich.sqlite")
+    posts = pa.table({"id": pa.array([], pa.string()), "owner_user_id": []})
+
+    table = enrich_posts(posts, index)
+    index.close()
+
+    assert table.num_rows == 0
+    assert table.column_names[-1] == "top_comments"
+
+
+def test_reloads_tables_when_the_dump_changes(tmp_path):
+    site = make_site(tmp_path)
+    index = EnrichIndex(tmp_path / "enrich.sqlite")
+    index.load_site(site)
+    assert index.reputations(["1"]) == [100]
+
+    # 同じダンプなら読み直さない
+    users = tmp_path / "example" / "Users.xml"
+    index.conn.execute("UPDATE users SET reputation = 0")
+    index.load_site(site)
+    assert index.reputations(["1"]) == [0]
+
+    users.write_bytes(USERS_XML.replace(b'"100"', b'"200"'))
+    os.utime(users, (0, users.stat().st_mtime + 10))
+    index.close()
+
+    # 開き直しても (notebook から使っても) 新しいダンプを読む
+    index = EnrichIndex(tmp_path / "enrich.sqlite")
+    index.load_site(site)
+    assert index.reputations(["1"]) == [200]
+    assert index.vote_counts(["10"]) == [(2, 1)]
+    index.close()
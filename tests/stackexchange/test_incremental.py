@@ -0,0 +1,75 @@
+import pyarrow as pa
+import pytest
+
+import incremental
+from incremental import convert_changed
+from qa_table import load_table
+
+SCHEMA = pa.schema(
+    [
+        pa.field("id", pa.string()),
+        pa.field("last_activity_date", pa.string()),
+        pa.field("last_edit_date", pa.string()),
+        pa.field("body", pa.string()),
+    ]
+)
+
+
+def posts(rows: list[tuple[str, str, str | None, str]]) -> pa.Table:
+    return pa.Table.from_pylist(
+        [dict(zip(SCHEMA.names, row)) for row in rows],
+        schema=SCHEMA,
+    )
+
+
+@pytest.mark.parametrize("batch_size", [1, 2, 100])
+def test_convert_changed_reuses_unchanged_bodies(tmp_path, batch_size):
+    old = posts(
+        [
+            ("1", "2020", None, "old markdown 1"),
+            ("2", "2020", None, "old markdown 2"),
+        ]
+    )
+    new = posts(
+        [
+            ("1", "2020", None, "<p>html 1</p>"),  # 同じ版
+            ("2", "2021", "2021", "<p>edited 2</p>"),
+            ("3", "2021", None, "<p>new 3</p>"),
+        ]
+    )
+
+    stats = convert_changed(new, old, tmp_path / "out", 1, batch_size=batch_size)
+    table = load_table(tmp_path / "out", SCHEMA)
+
+    assert table["id"].to_pylist() == ["1", "2", "3"]
+    assert table["body"].to_pylist() == ["old markdown 1", "edited 2", "new 3"]
+    assert (stats.num_posts, stats.num_reused, stats.num_converted) == (3, 1, 2)
+
+
+def test_convert_changed_converts_one_batch_at_a_time(tmp_path, monkeypatch):
+    requested = []
+
+    def convert_htmls(htmls, num_workers=None):
+        for html in htmls:
+            requested.append(html)
+            yield html.upper()
+
+    monkeypatch.setattr(incremental, "convert_htmls", convert_htmls)
+    new = posts([(str(i), "2020", None, f"body {i}") for i in range(6)])
+
+    written = []
+    original = incremental.ShardWriter.write_table
+
+    def write_table(self, table):
+        # 書くときには、次の batch の html はまだ読んでいない
+        written.append((table.num_rows, len(requested)))
+        return original(self, table)
+
+    monkeypatch.setattr(incremental.ShardWriter, "write_table", write_table)
+
+    convert_changed(new, SCHEMA.empty_table(), tmp_path / "out", batch_size=2)
+
+    assert written == [(2, 2), (2, 4), (2, 6)]
+    assert load_table(tmp_path / "out", SCHEMA)["body"].to_pylist() == [
+        f"BODY {i}" for i in range(6)
+    ]
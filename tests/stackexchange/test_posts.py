@@ -0,0 +1,52 @@
+import io
+
+import pytest
+
+from posts import Answer, Question, StackExchange, TagWiki, iter_rows, parse_post
+
+POSTS_XML = b"""<?xml version="1.0" encoding="utf-8"?>
+<posts>
+  <row Id="1" PostTypeId="1" AcceptedAnswerId="2" CreationDate="2020-01-01T00:00:00.000" Score="3" ViewCount="10" Body="&lt;p&gt;question&lt;/p&gt;" OwnerUserId="5" LastActivityDate="2020-01-02T00:00:00.000" Title="title" Tags="&lt;python&gt;&lt;xml&gt;" AnswerCount="1" CommentCount="0" ContentLicense="CC BY-SA 4.0" />
+  <row Id="2" PostTypeId="2" ParentId="1" CreationDate="2020-01-01T01:00:00.000" Score="1" Body="&lt;p&gt;answer&lt;/p&gt;" LastActivityDate="2020-01-01T01:00:00.000" CommentCount="2" ContentLicense="CC BY-SA 4.0" />
+  <row Id="3" PostTypeId="5" CreationDate="2020-01-01T02:00:00.000" Score="0" Body="&lt;p&gt;wiki&lt;/p&gt;" LastActivityDate="2020-01-01T02:00:00.000" CommentCount="0" ContentLicense="CC BY-SA 4.0" />
+  <row Id="4" PostTypeId="6" CreationDate="2020-01-01T03:00:00.000" Score="0" Body="" LastActivityDate="2020-01-01T03:00:00.000" CommentCount="0" ContentLicense="CC BY-SA 4.0" />
+</posts>
+"""
+
+
+def test_iter_rows_yields_every_row():
+    ids = [el.attrib["Id"] for el in iter_rows(io.BytesIO(POSTS_XML), "posts")]
+
+    assert ids == ["1", "2", "3", "4"]
+
+
+def test_iter_rows_rejects_other_tables():
+    with pytest.raises(Exception, match="Invalid xml"):
+        next(iter_rows(io.BytesIO(POSTS_XML), "comments"))
+
+
+def test_parse_post():
+    posts = [parse_post(el) for el in iter_rows(io.BytesIO(POSTS_XML), "posts")]
+    question, answer, wiki, nomination = posts
+
+    assert isinstance(question, Question)
+    assert question.tags == ["python", "xml"]
+    assert question.accepted_answer_id == "2"
+    assert question.favorite_count == 0
+    assert question.body == "<p>question</p>"
+
+    assert isinstance(answer, Answer)
+    assert answer.parent_id == "1"
+    assert answer.owner_user_id is None
+    assert answer.comment_count == 2
+
+    assert isinstance(wiki, TagWiki)
+    assert nomination is None
+
+
+def test_stack_exchange_reads_extracted_xml(tmp_path):
+    (tmp_path / "example").mkdir()
+    (tmp_path / "example" / "Posts.xml").write_bytes(POSTS_XML)
+    site = StackExchange(directory=str(tmp_path), site="example")
+
+    assert [post.id for post in site.posts()] == ["1", "2", "3"]
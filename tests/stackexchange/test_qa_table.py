@@ -0,0 +1,102 @@
+from posts import Answer, Question
+from qa_table import (
+    accepted_answer_index,
+    build_qa_table,
+    build_simple_table,
+    popular_answer_index,
+    write_post_tables,
+)
+
+COMMON = {
+    "creation_date": "2020-01-01T00:00:00.000",
+    "last_edit_date": None,
+    "last_activity_date": "2020-01-01T00:00:00.000",
+    "owner_user_id": None,
+    "last_editor_user_id": None,
+    "comment_count": 0,
+    "content_license": "CC BY-SA 4.0",
+}
+
+
+def question(id: str, accepted_answer_id: str | None = None) -> Question:
+    return Question(
+        **COMMON,
+        id=id,
+        post_type="question",
+        score=0,
+        body=f"question {id}",
+        title=f"title {id}",
+        accepted_answer_id=accepted_answer_id,
+        answer_count=0,
+        view_count=0,
+        tags=["tag"],
+        favorite_count=0,
+    )
+
+
+def answer(id: str, parent_id: str, score: int) -> Answer:
+    return Answer(
+        **COMMON,
+        id=id,
+        post_type="answer",
+        score=score,
+        body=f"answer {id}",
+        parent_id=parent_id,
+    )
+
+
+POSTS = [
+    question("1", accepted_answer_id="11"),
+    answer("11", "1", score=1),
+    answer("12", "1", score=5),
+    answer("13", "1", score=5),
+    question("2"),
+    answer("99", "404", score=10),  # 質問がない回答
+    question("3", accepted_answer_id="12"),  # 別の質問の回答は採用されない
+    answer("31", "3", score=0),
+]
+
+
+def tables(tmp_path):
+    return write_post_tables(POSTS, tmp_path)
+
+
+def test_write_post_tables_splits_questions_and_answers(tmp_path):
+    questions, answers = tables(tmp_path)
+
+    assert questions["id"].to_pylist() == ["1", "2", "3"]
+    assert answers["id"].to_pylist() == ["11", "12", "13", "99", "31"]
+
+
+def test_accepted_answer_must_belong_to_the_question(tmp_path):
+    questions, answers = tables(tmp_path)
+
+    assert accepted_answer_index(questions, answers).to_pylist() == [0, None, None]
+
+
+def test_popular_answer_prefers_the_oldest_on_ties(tmp_path):
+    questions, answers = tables(tmp_path)
+
+    assert popular_answer_index(questions, answers).to_pylist() == [1, None, 4]
+
+
+def test_build_qa_table_groups_answers_in_file_order(tmp_path):
+    table = build_qa_table(*tables(tmp_path)).to_pylist()
+
+    assert [[a["id"] for a in row["answers"]] for row in table] == [
+        ["11", "12", "13"],
+        [],
+        ["31"],
+    ]
+    assert [row["popular_answer_id"] for row in table] == ["12", None, "31"]
+    assert table[0]["question"]["title"] == "title 1"
+
+
+def test_build_simple_table(tmp_path):
+    table = build_simple_table(*tables(tmp_path)).to_pylist()
+
+    assert table[0]["accepted_answer_body"] == "answer 11"
+    assert table[0]["popular_answer_body"] == "answer 12"
+    assert table[1]["accepted_answer_body"] is None
+    assert table[2]["accepted_answer_id"] == "12"
+    assert table[2]["accepted_answer_body"] is None